@@ -22,22 +22,56 @@ Contains code for auto-marking AST nodes.
 #     along with OAT.  If not, see <http://www.gnu.org/licenses/>.
 
 import ast
+import time
+import operator
+import functools
+import multiprocessing
 from .customast import CustomAST
 
+import analysis.markcache
+import analysis.callsummary
+import analysis.markers.names
+import analysis.markers.store
+import analysis.markers.sidecar
+import analysis.markers.block
 import analysis.markers.breaks
 import analysis.markers.visible
 import analysis.markers.read
 import analysis.markers.write
 
+# Marker for each type of marking we resolve
+_MARKERS = {
+    "visible": analysis.markers.visible.VisibleMarker,
+    "breaks": analysis.markers.breaks.BreakMarker,
+    "reads": analysis.markers.read.ReadMarker,
+    "writes": analysis.markers.write.WriteMarker,
+}
+
+# Fresh copies of the markings an unmarked node has, as the markers give them
+_DEFAULT_MARKS = {
+    "visible": (lambda: True),
+    "breaks": set,
+    "reads": set,
+    "writes": set,
+}
+
+def _no_user_marks(node, needed):
+    return {}
+
+def _accept_marks(node, markings):
+    return True
+
 class AutoMarker:
     """Tries to find correct markings for each node."""
 
     def __init__(self,
                  res_order : "The resolution order for calculating markings.",
                  mark : "Should we mark the nodes as we work?" = True,
-                 user : "Function to allow users to manually select markings." = (lambda node, needed: {}),
-                 review : "Function to review mark choices." = (lambda n, m: True),
-                 defaults : "Dictionary of functions to get defaults for each marking." = {}):
+                 user : "Function to allow users to manually select markings." = _no_user_marks,
+                 review : "Function to review mark choices." = _accept_marks,
+                 defaults : "Dictionary of functions to get defaults for each marking." = None,
+                 cache : "MarkCache to keep calculated markings in, if any." = None,
+                 stats : "MarkStats to record what we do in, if any." = None):
         order_allowed = set(["mark", "calc", "user"])
 
         for res in res_order:
@@ -50,16 +84,29 @@ class AutoMarker:
         self.res_order = res_order
         self.mark = mark
         self.review = review
-        self.defaults = defaults
-
-        if "visible" not in self.defaults:
-            self.defaults["visible"] = (lambda: analysis.markers.visible.VisibleMarker().duplicate())
-        if "breaks" not in self.defaults:
-            self.defaults["breaks"] = (lambda: analysis.markers.breaks.BreakMarker().duplicate())
-        if "reads" not in self.defaults:
-            self.defaults["reads"] = (lambda: analysis.markers.read.ReadMarker().duplicate())
-        if "writes" not in self.defaults:
-            self.defaults["writes"] = (lambda: analysis.markers.write.WriteMarker().duplicate())
+        self.defaults = {} if defaults == None else defaults
+        # Other processes can only do the same as us without these
+        self._local_only = "user" in res_order or review is not _accept_marks or bool(self.defaults)
+        # Only calculating, as call summaries are
+        self._calc_only = res_order == ["calc"] and not self._local_only
+        self.cache = cache
+        self.stats = stats
+        self._synthetic = {}
+        self._transformed = set()
+        self._memo = {}
+        self._made = {}
+        self._complete = set()
+        self._symbols = analysis.markers.names.SYMBOLS
+
+        for m in _DEFAULT_MARKS:
+            if m not in self.defaults:
+                self.defaults[m] = _DEFAULT_MARKS[m]
+
+        if stats != None:
+            self.get_marks = stats.timed("mark", self.get_marks)
+            self.user_marks = stats.timed("user", self.user_marks)
+            self.default_marks = stats.timed("default", self.default_marks)
+            self.calculate_marks = stats.counted("calc", self.calculate_marks)
 
 ########################################################
 # Resolution functions                                 #
@@ -70,10 +117,306 @@ class AutoMarker:
 ########################################################
 
     def resolve_marks(self, node, needed : "Set containing the markings we want." = {"visible", "breaks", "reads", "writes"}):
-        """Resolve markings for a given node based on the given resolution order. Can throw UserStop"""
+        """
+        Resolve markings for a given node based on the given resolution order. Can throw UserStop
+
+        Resolving one node usually means resolving its children first. Rather
+        than recursing, the resolution steps yield (node, needed) whenever they
+        want another node resolved and are sent back the result, so that we
+        can keep our own stack and cope with trees of any depth.
+
+        When marking, calculated markings are recorded in the mark store
+        along with the nodes they were calculated from, so that editing the
+        tree later only drops the markings that depended on the edit.
+
+        Each node is only resolved once per call. Results are remembered by
+        node and reused for any later request wanting the same markings or
+        fewer. The nodes made by transforms are kept on the node they came
+        from until it is edited, so they are only made once.
+
+        Given a cache, the markings made below node are kept under the
+        structure of node, and reused the next time, see _cacheable.
+
+        """
+
+        self._start(node)
+        try:
+            if self._cacheable(node):
+                name = self._cache_key("resolve", needed, node.structural_hash(), self._depends(node))
+                found = self._load_cached(name, node, needed)
+                if found != None:
+                    return found
+                result = self._run(node, needed)
+                self._keep_cached(name, node)
+                return dict(result)
+            return dict(self._run(node, needed))
+        finally:
+            self._finish()
+
+    def mark_tree(self,
+                  root : "Top of the tree to mark",
+                  needed : "Set containing the markings we want." = {"visible", "breaks", "reads", "writes"},
+                  jobs : "Number of processes to share the work between" = 1,
+                  source_hash : "Hash of the source root was parsed from, if unchanged" = None):
+        """
+        Resolve markings for every node below root, children before parents. Can throw UserStop
+
+        Returns the markings for root. Each node is resolved after all its
+        children, and everything resolved is remembered for the whole pass,
+        so each node is resolved from the results for its children and the
+        tree is covered in a single pass.
+
+        With more than one job, the bodies of the functions and classes at
+        the top of root are marked by other processes first, see _mark_parts.
+        Raises ValueError if this would need the user or our own defaults.
+
+        Given a cache, every marking made is kept in one entry under the
+        source hash, or the structure of root, so an unchanged file is
+        loaded in one read without being marked. The markings for each of
+        those bodies are also kept under the structure of the body, so when
+        the file has changed only the bodies that have changed are marked
+        again.
+
+        >>> tree = CustomAST(ast.parse("def f(x):\\n    a = b"))
+        >>> sorted(AutoMarker(["calc"]).mark_tree(tree)["writes"])
+        ['f']
+        >>> marks = analysis.markers.store.STORE.get(tree["body"]["0"]["body"]["0"])
+        >>> sorted(marks["reads"]), sorted(marks["writes"])
+        (['b'], ['a'])
+
+        """
+
+        if jobs > 1 and self._local_only:
+            raise ValueError("Cannot share the marking between processes when asking the user or using other defaults.")
+
+        self._start(root)
+        try:
+            parts = self._parts(root)
+            cached = self._cacheable(root)
+            if cached:
+                name = self._cache_key("file" if source_hash else "tree", needed, source_hash or root.structural_hash())
+                found = self._load_cached(name, root, needed)
+                if found != None:
+                    return found
+                names = [self._cache_key("tree", needed, p.structural_hash(), self._depends(p)) for p in parts]
+                missed = [(n, p) for n, p in zip(names, parts) if self._use_cached(n, p, needed) == None]
+                parts = [p for n, p in missed]
+
+            if jobs > 1:
+                self._mark_parts(parts, needed, jobs)
+
+            # Post-order, leaving out parts which are already done
+            stack = [(root, False)]
+            while stack:
+                node, ready = stack.pop()
+                if ready:
+                    self._run(node, needed)
+                elif (node.is_ast() or node.is_list()) and id(node) not in self._complete:
+                    stack.append((node, True))
+                    stack.extend((node[c], False) for c in reversed(list(node.ordered_children())))
+            result = self._run(root, needed)
+
+            if cached:
+                for n, p in missed:
+                    self._keep_cached(n, p)
+                self._keep_cached(name, root)
+            return dict(result)
+        finally:
+            self._finish()
+
+    def _parts(self, root):
+        """Get the bodies of the functions and classes at the top of root, which only depend on the rest through the calls they make."""
+
+        parts = []
+        if "body" in root and root["body"].is_list():
+            body = root["body"]
+            for c in body.ordered_children():
+                stmt = body[c]
+                if stmt.type() in ("FunctionDef", "ClassDef") and not stmt["body"].is_empty():
+                    parts.append(stmt["body"])
+        return parts
+
+    def _mark_parts(self, parts, needed, jobs):
+        """
+        Mark the given parts of a tree in other processes.
+
+        Each worker is given the whole tree once, so that calls can be
+        summarised. It is then given the path to a part and any markings
+        already on it, and gives back the markings it made, see
+        analysis.markcache.pack. The results are remembered as if we had
+        resolved them here.
+
+        """
+
+        if len(parts) < 2:
+            return
+
+        # Start the biggest first so no worker is left with one at the end
+        parts = sorted(parts, key=lambda p: sum(1 for n in p.walk()), reverse=True)
+
+        marks = analysis.markers.store.STORE
+        keep = "mark" in self.res_order
+        tasks = [(p.path(), analysis.markcache.pack(p, marks) if keep else None, self.res_order, needed)
+                 for p in parts]
+        with _Pool(jobs, _share_tree, (parts[0].root().node(),)) as pool:
+            results = pool.map(_mark_part, tasks, chunksize=1)
+
+        for part, data in zip(parts, results):
+            self._adopt(data, part, needed)
+
+    def _adopt(self, data, part, needed):
+        """
+        Take packed markings for part, see analysis.markcache.unpack.
+
+        They are put in the store if we are marking and remembered as if we
+        had resolved them. Returns the names of any linked entries.
+
+        """
+
+        marks = analysis.markers.store.STORE
+        found = marks if self.mark else analysis.markers.store.MarkStore(marks.symbols)
+        nodes = []
+        links = analysis.markcache.unpack(data, part, found, nodes)
+        analysis.callsummary.adopted(nodes)
+        for node in nodes:
+            self._made[id(node)] = node
+            record = found.get(node)
+            if needed.issubset(record):
+                self._remember(node, needed, {m: record[m] for m in needed})
+        self._complete.add(id(part))
+        return links
+
+    def _cacheable(self, node):
+        """
+        Check if markings below node can be kept in and taken from our cache.
+
+        This needs the markings to be calculated the same way every time,
+        so nothing can come from the user, and if we use the markings
+        already there, there must not be any. The tree is only searched for
+        them if the store has any markings at all.
+
+        """
+
+        if self.cache == None or self._local_only or not self.mark:
+            return False
+        if "mark" in self.res_order:
+            marks = analysis.markers.store.STORE
+            return not len(marks) or not any(marks.has(n) for n in node.walk())
+        return True
+
+    def _cache_key(self, kind, needed, *content):
+        return analysis.markcache.key(kind, sorted(needed), self.res_order, *content)
+
+    def _depends(self, node):
+        """Get what the markings below node rely on elsewhere in the tree, see analysis.callsummary."""
+
+        return analysis.callsummary.table(node).depends(node)
+
+    def _load_cached(self, name, node, needed):
+        """
+        Take every marking below node from one cache entry, without resolving anything.
+
+        Gives the markings for node, or None if they are not there.
+
+        """
+
+        data = self.cache.get(name)
+        if self.stats != None:
+            self.stats.cache_lookup(data != None)
+        if data == None:
+            return None
+        marks = analysis.markers.store.STORE
+        nodes = []
+        try:
+            analysis.markcache.unpack(data, node, marks, nodes)
+        except TypeError: # Unusable, so mark as if it was not there
+            return None
+        analysis.callsummary.adopted(nodes)
+        record = marks.get(node)
+        if not needed.issubset(record):
+            return None
+        return {m: record[m] for m in needed}
+
+    def _use_cached(self, name, node, needed):
+        """Take the markings below node from the cache, giving the names of any linked entries or None if they are not there."""
+
+        data = self.cache.get(name)
+        if self.stats != None:
+            self.stats.cache_lookup(data != None)
+        if data == None:
+            return None
+        try:
+            return self._adopt(data, node, needed)
+        except TypeError: # Unusable, so mark as if it was not there
+            return None
+
+    def _keep_cached(self, name, node):
+        """Put the markings we made below node, or took from elsewhere, in the cache."""
+
+        made = self._made
+        data = analysis.markcache.pack(node, analysis.markers.store.STORE, lambda n: made.get(id(n)) is n)
+        self.cache.put(name, data)
+
+    def _start(self, node=None):
+        """Forget everything remembered by an earlier run, and start one on the tree of node."""
+
+        self._synthetic = {} # Nodes made by transforms -> tree nodes they rely on
+        self._transformed = set()
+        self._memo = {}
+        self._made = {} # Nodes we have marked
+        self._complete = set() # Nodes whose whole subtree has been taken from elsewhere
+        self._symbols = analysis.markers.names.SYMBOLS if node == None else analysis.markers.names.table(node)
+
+    _finish = _start
+
+    def _run(self, node, needed):
+        """Resolve a node, and whatever it needs, using our own stack."""
+
+        result = self._recall(node, needed)
+        if result != None:
+            return result
+
+        resolve = self._resolve if self.stats == None else self._timed
+        stack = [(resolve(node, needed), node, needed)]
+        while True:
+            steps, current, current_needed = stack[-1]
+            try:
+                request = steps.send(result)
+            except StopIteration as finished:
+                stack.pop()
+                result = finished.value
+                self._remember(current, current_needed, result)
+                if not stack:
+                    return result
+            else:
+                result = self._recall(*request)
+                if result == None:
+                    stack.append((resolve(*request), request[0], request[1]))
+
+    def _remember(self, node, needed, result):
+        """Store the result of resolving a node for this run."""
+
+        # Keeping the node keeps its id from being reused during the run
+        self._memo.setdefault(id(node), []).append((frozenset(needed), result, node))
+
+    def _recall(self, node, needed):
+        """Get a result remembered for node with at least the needed markings, or None."""
+
+        for done, result, original in self._memo.get(id(node), ()):
+            if done.issuperset(needed):
+                if len(done) == len(needed):
+                    return result
+                return {m: result[m] for m in needed}
+        return None
+
+    def _resolve(self, node, needed):
+        """Resolution steps for a single node, see resolve_marks."""
 
         result = {}
         wanted = needed.copy()
+        marked = ()
+        calculated = ()
+        sources = []
 
         for res in self.res_order + ["default"]:
             wanted.difference_update(result) # Remove those markings we have
@@ -81,37 +424,105 @@ class AutoMarker:
             if not wanted: # done
                 break
 
-            remainder = {
-                "mark": self.get_marks,
-                "calc": self.calculate_marks,
-                "user": self.user_marks,
-                "default": self.default_marks
-            }[res](node, wanted)
+            if res == "calc":
+                remainder = yield from self._tracked(self.calculate_marks(node, wanted), sources)
+                calculated = set(remainder)
+            else:
+                remainder = {
+                    "mark": self.get_marks,
+                    "user": self.user_marks,
+                    "default": self.default_marks
+                }[res](node, wanted)
+                if res == "mark":
+                    marked = set(remainder)
             result.update(remainder) # should only contain as yet unmarked values
 
         if not self.review(node, result):
             raise UserStop
 
-        if self.mark:
-            if "visible" in needed:
-                analysis.markers.visible.VisibleMarker(node).set_mark(result["visible"])
-            if "breaks" in needed:
-                analysis.markers.breaks.BreakMarker(node).set_mark(result["breaks"])
-            if "reads" in needed:
-                analysis.markers.read.ReadMarker(node).set_mark(result["reads"])
-            if "writes" in needed:
-                analysis.markers.write.WriteMarker(node).set_mark(result["writes"])
+        synthetic = id(node) in self._synthetic
+        if synthetic or calculated:
+            sources = self._tree_sources(node, sources)
+        if synthetic:
+            self._synthetic[id(node)] = sources
+
+        if self.mark and not synthetic: # Nodes made by transforms are not part of the tree
+            marks = analysis.markers.store.STORE
+            # Set everything at once, in the form the markers keep it
+            values = {m: result[m] for m in needed if m not in marked} # Marked ones are already there
+            for m in ("reads", "writes"):
+                if m in values:
+                    values[m] = self._names(values[m])
+            if values:
+                marks.update(node, values)
+                self._made[id(node)] = node
+            if calculated:
+                marks.derive(node, calculated, sources)
 
         return result
 
+    def _timed(self, node, needed):
+        """Resolution steps for a single node that record the time spent on it, see MarkStats."""
+
+        stats = self.stats
+        steps = self._resolve(node, needed)
+        clock = time.perf_counter
+        spent = others = 0.0
+        result = None
+        while True:
+            start, before = clock(), stats.outside_calc
+            try:
+                request = steps.send(result)
+            except StopIteration as finished:
+                request = None
+                result = finished.value
+            spent += clock() - start
+            others += stats.outside_calc - before
+            if request == None:
+                stats.resolved(node.type(), spent, spent - others)
+                return result
+            result = yield request
+
+    def _tracked(self, steps, sources : "List to add each node requested by steps to"):
+        """Run resolution steps, noting the nodes they ask for."""
+
+        result = None
+        while True:
+            try:
+                request = steps.send(result)
+            except StopIteration as finished:
+                return finished.value
+            sources.append(request[0])
+            result = yield request
+
+    def _tree_sources(self, node, sources):
+        """
+        Get the tree nodes a calculation on node relied on.
+
+        Nodes made by transforms are replaced with the tree nodes they relied
+        on. A transformed node also relies on the layout of all its children.
+
+        """
+
+        if id(node) in self._transformed:
+            sources = sources + [node[c] for c in node.ordered_children()]
+
+        found = []
+        for s in sources:
+            if id(s) in self._synthetic:
+                found.extend(self._synthetic[id(s)])
+            else:
+                found.append(s)
+        return found
+
     def _base_marks(self, needed):
         """Get a new dictionary containing the markings for an empty list of nodes."""
 
         full_defs = {
             "visible": False,
             "breaks": set(),
-            "reads": set(),
-            "writes": set(),
+            "reads": self._names(),
+            "writes": self._names(),
         }
 
         try:
@@ -129,16 +540,9 @@ class AutoMarker:
     def get_marks(self, node, needed):
         """Get the current markings for the node if they exist, or None."""
 
-        types = {
-            "visible": analysis.markers.visible.VisibleMarker,
-            "breaks": analysis.markers.breaks.BreakMarker,
-            "reads": analysis.markers.read.ReadMarker,
-            "writes": analysis.markers.write.WriteMarker,
-        }
-
         result = {}
         for n in needed:
-            marker = types[n](node)
+            marker = _MARKERS[n](node)
             if marker.is_marked():
                 result[n] = marker.get_mark()
 
@@ -153,40 +557,22 @@ class AutoMarker:
         return {n: self.defaults[n]() for n in needed}
 
     def calculate_marks(self, node, needed):
-        """Calculate markings for the given mark types on node."""
+        """
+        Calculate markings for the given mark types on node.
 
-        try:
-            desc = MARK_CALCULATION[node.type()]
-        except KeyError:
+        Like the other calculation steps this is a generator, see resolve_marks.
+        The task description for the node type is compiled into steps the
+        first time it is used, see _compiled.
+
+        """
+
+        steps = _compiled(node.type())
+        if steps == None:
             return {}
-        else:
-            return self._run_task_description(desc, node, needed)
+        return (yield from steps(self, node, needed))
 
 # Calculation / task description methods
 
-    def _run_task_description(self, desc, node, needed):
-        """Run the given task description on the node to generate a set of markings."""
-
-        if isinstance(desc, dict):
-            return self._desc_dict(desc, node, needed)
-        elif hasattr(desc, "__call__"):
-            return self._run_task_description(desc(node), node, needed)
-        elif isinstance(desc, list):
-            return self._combine_sequence((self._run_task_description(d, node, needed) for d in desc), needed)
-        elif isinstance(desc, set):
-            return self._combine_all((self._run_task_description(d, node, needed) for d in desc), needed)
-        elif isinstance(desc, tuple):
-            if len(desc) < 2:
-                return self._combine_any(
-                    [self._base_marks(needed)] + [self._run_task_description(d, node, needed) for d in desc],
-                    needed)
-            else:
-                return self._combine_any((self._run_task_description(d, node, needed) for d in desc), needed)
-        elif isinstance(desc, str) and desc in node:
-            return self.resolve_marks(node[desc])
-        else:
-            return {} # Received an invalid task description
-
     def _combine_any(self, marks, needed):
         """Combine each of the given marks assuming we could choose any one of them."""
 
@@ -204,16 +590,15 @@ class AutoMarker:
             combined["visible"] = any(m["visible"] for m in marks)
 
         if "breaks" in calculates:
-            combined["breaks"] = set.union(*[m["breaks"] for m in marks])
+            combined["breaks"] = set().union(*[m["breaks"] for m in marks])
 
         if "writes" in calculates:
-            combined["writes"] = set.union(*[m["writes"] for m in marks])
+            combined["writes"] = self._union(m["writes"] for m in marks)
 
         if "reads" in calculates:
-            combined["reads"] = set.union(*[m["reads"] for m in marks])
-            adding_writes = set.intersection(*[m["writes"] for m in marks])
-            adding_writes = combined["writes"].difference(adding_writes)
-            combined["reads"].update(adding_writes)
+            # Anything not written on every path may keep its old value, so counts as read
+            always_writes = functools.reduce(operator.and_, [m["writes"] for m in marks[1:]], self._names(marks[0]["writes"]))
+            combined["reads"] = self._union(m["reads"] for m in marks) | (combined["writes"] - always_writes)
 
         return combined
 
@@ -234,18 +619,17 @@ class AutoMarker:
             combined["visible"] = any(m["visible"] for m in marks)
 
         if "breaks" in calculates:
-            combined["breaks"] = set.union(*[m["breaks"] for m in marks])
+            combined["breaks"] = set().union(*[m["breaks"] for m in marks])
 
         if "reads" in calculates:
-            combined["reads"] = set()
-            cumulative_writes = set()
+            reads = cumulative_writes = self._names()
             for m in marks:
-                n_reads = m["reads"].difference(cumulative_writes)
-                cumulative_writes.update(m["writes"])
-                combined["reads"].update(n_reads)
+                reads = reads | (m["reads"] - cumulative_writes)
+                cumulative_writes = cumulative_writes | m["writes"]
+            combined["reads"] = reads
 
         if "writes" in calculates:
-            combined["writes"] = set.union(*[m["writes"] for m in marks])
+            combined["writes"] = self._union(m["writes"] for m in marks)
 
         return combined
 
@@ -259,54 +643,48 @@ class AutoMarker:
             combined.update(m)
         return combined
 
-    def _desc_dict(self, desc, node, needed):
-        """Run a dictionary task description."""
+    def _names(self, values=()):
+        """Get a set of variable names in the form the markers store them for the tree being marked."""
 
-        if "transform" in desc:
-            new_node = desc["transform"](node)
-            if new_node != None:
-                return self.resolve_marks(new_node, needed)
-
-        if "marks" in desc and "nomarks" in desc:
-            if desc["marks"].intersect(desc["nomarks"]):
-                return {} # Overlap invalid
-
-        if "marks" in desc:
-            needed = needed.intersection(desc["marks"])
-        if "nomarks" in desc:
-            needed = needed.difference(desc["nomarks"])
-
-        if "combine" in desc:
-            c_marks = [node[f] for f in desc["combine"] if f in node and not node[f].is_empty()] # Keeps order
-            c_marks = [self.resolve_marks(c, needed) for c in c_marks]
-            if c_marks:
-                marks = self._combine_sequence(c_marks, needed)
-            else:
-                marks = self._base_marks(needed)
-        else:
-            marks = self._base_marks(needed)
+        if isinstance(values, analysis.markers.names.NameSet) and values.table is self._symbols:
+            return values
+        return analysis.markers.names.NameSet(values, self._symbols)
 
-        # Marking type specific
-        if "breaks" in needed and "breaks" in marks:
-            if "rem_breaks" in desc:
-                marks["breaks"].difference_update(desc["rem_breaks"])
-            if "add_breaks" in desc:
-                marks["breaks"].update(desc["add_breaks"])
+    def _union(self, sets):
+        """Union of sets of variable names."""
 
-        if "reads" in needed and "reads" in marks:
-            if "add_reads" in desc:
-                marks["reads"].update(node[f].node() for f in desc["add_reads"])
+        return functools.reduce(operator.or_, sets, self._names())
 
-        if "writes" in needed and "writes" in marks:
-            if "add_writes" in desc:
-                marks["writes"].update(node[f].node() for f in desc["add_writes"])
+    def _note_transform(self, node, new_node):
+        """Remember which nodes a transform made, as opposed to took from the tree."""
 
-        return marks
+        self._transformed.add(id(node))
+        if self.stats != None:
+            self.stats.transformed(node.type())
+        pending = [new_node]
+        while pending:
+            current = pending.pop()
+            self._synthetic[id(current)] = []
+            # Children taken from the tree still hang from their old parents
+            pending.extend(c for c in current.children.values() if c.parent is current)
 
 ################################################
 # Helping functions for auto-mark calculation. #
 ################################################
 
+def _call(func, args):
+    """Make a call node without keywords, leaving out any fields this version of Python does not have."""
+
+    fields = {"func": func, "args": args, "keywords": []}
+    return ast.Call(**{f: fields.get(f) for f in ast.Call._fields})
+
+def _undecorated(node):
+    """Copy a function or class definition without its decorators, sharing everything else."""
+
+    fields = {f: node[f] for f in node.ordered_children()}
+    fields["decorator_list"] = []
+    return CustomAST(node.type(asclass=True)(**fields))
+
 def _trans_func_decorators(node):
     """
     Convert a func with decorators into its equivalent code, i.e.
@@ -325,19 +703,12 @@ def _trans_func_decorators(node):
     if node["decorator_list"].is_empty():
         return None
 
-    func = CustomAST(ast.FunctionDef(
-               node["name"],
-               node["args"],
-               node["body"],
-               [],
-               node["returns"]
-    ))
+    func = _undecorated(node)
     assname = CustomAST(ast.Name(node["name"], ast.Store()))
     calls = CustomAST(ast.Name(node["name"], ast.Load()))
     dlist = node["decorator_list"]
     for dec in reversed(list(dlist.ordered_children())):
-        calls = ast.Call(dlist[dec], [calls], [], None, None)
-        calls = CustomAST(calls)
+        calls = CustomAST(_call(dlist[dec], [calls]))
     return CustomAST([func, ast.Assign([assname], calls)])
 
 def _trans_class_decorators(node):
@@ -358,19 +729,12 @@ def _trans_class_decorators(node):
     if node["decorator_list"].is_empty(): # Translate for decorators
         return None
 
-    cls = CustomAST(ast.ClassDef(
-        node["name"],
-        node["bases"],
-        node["keywords"],
-        node["starargs"],
-        node["kwargs"],
-        []
-    ))
+    cls = _undecorated(node)
     assname = CustomAST(ast.Name(node["name"], ast.Store()))
     calls = CustomAST(ast.Name(node["name"], ast.Load()))
     dlist = node["decorator_list"]
-    for dec in reversed(dlist):
-        calls = CustomAST(ast.Call(dlist[dec], [calls], [], None, None))
+    for dec in reversed(list(dlist.ordered_children())):
+        calls = CustomAST(_call(dlist[dec], [calls]))
     return CustomAST([cls, ast.Assign([assname], calls)])
 
 
@@ -400,11 +764,11 @@ def _try_except_dict(node):
 
 def _trans_iter_only(node):
     """Take node with iterator and give just the iterator call."""
-    return CustomAST(ast.Call(ast.Name("iter", ast.Load()), [node["iter"]], [], None, None))
+    return CustomAST(_call(ast.Name("iter", ast.Load()), [node["iter"]]))
 
 def _trans_next_only(node):
     """Take a node with a target and an iterator supposedly written to '._.' and return the next call."""
-    nxt_call = ast.Call(ast.Attribute(ast.Name("._.", ast.Load()), "next", ast.Load()), [], [], None, None)
+    nxt_call = _call(ast.Attribute(ast.Name("._.", ast.Load()), "next", ast.Load()), [])
     return CustomAST(ast.Assign([node["target"]], nxt_call))
 
 def _trans_dict_zipper(node):
@@ -422,6 +786,48 @@ def _context_sensitive(base, load={}, store={}):
         return d
     return f
 
+def _steps(func):
+    """Mark a function as being resolution steps itself, rather than giving a task description."""
+
+    func.is_steps = True
+    return func
+
+@_steps
+def _call_steps(marker, node, needed):
+    """
+    Steps for a call, see _call_dict.
+
+    If the summary of the function called needs its body marked, and we
+    are only calculating, the body is resolved here like any other node,
+    so it is not marked again later.
+
+    """
+
+    if id(node) in marker._synthetic: # Made by a transform, so not in the tree's table
+        return (yield from _call_unknown(marker, node, needed))
+
+    table = analysis.callsummary.table(node)
+    func = table.pending(node)
+    if func != None and marker._calc_only:
+        table.summarise(func, (yield (func["body"], set(analysis.callsummary.MARKINGS))))
+    return (yield from _call_desc(marker, node, needed))
+
+_CALL_UNKNOWN = {"marks": set()} # No idea what we'd be calling
+
+def _call_dict(node):
+    """Calls we have a summary for work out their arguments and then do what the summary says."""
+
+    summary = analysis.callsummary.lookup(node)
+    if summary == None:
+        return _CALL_UNKNOWN
+    return {
+        "combine": ["func", "args", "keywords", "starargs", "kwargs"],
+        "add_breaks": summary["breaks"],
+        "add_visible": summary["visible"],
+        "add_read_names": summary["reads"],
+        "add_write_names": summary["writes"],
+    }
+
 def _list_dict(node):
     """Returns a task desc holding the list's children."""
     return list(node.ordered_children()) if len(node) else ()
@@ -531,7 +937,7 @@ MARK_CALCULATION = {
     "Yield": {"combine": ["value"], "add_breaks": {"except", "yield"}},
 
     "Compare": [{"combine": ["left"], "add_breaks": {"except"}}, ("comparators",)],
-    "Call": {"marks": set()}, # No idea what we'd be calling # TODO - think harder
+    "Call": _call_steps,
     "Num": {},
     "Str": {},
     "Bytes": {},
@@ -628,4 +1034,424 @@ MARK_CALCULATION = {
     "list": _list_dict,
 }
 
+##############################################
+# Compiling task descriptions to resolution  #
+# steps, so the table is only read once      #
+##############################################
+
+# Node type -> (task description, compiled steps)
+_COMPILED = {}
+
+# Stands in for the description of types not in MARK_CALCULATION
+_UNKNOWN = object()
+
+def _compiled(node_type : "Type of node to get the steps for"):
+    """
+    Get the resolution steps for a node type from MARK_CALCULATION.
+
+    The description is compiled the first time, and again if the entry in
+    MARK_CALCULATION is replaced. Gives None for unknown types. The steps
+    are called with the AutoMarker, the node and the markings needed.
+
+    >>> _compiled("Pass") is _compiled("Pass"), _compiled("NotANode")
+    (True, None)
+
+    """
+
+    desc = MARK_CALCULATION.get(node_type, _UNKNOWN)
+    source, steps = _COMPILED.get(node_type, (None, None))
+    if source is desc:
+        return steps
+    if desc is _UNKNOWN:
+        return None
+    steps = _compile(desc)
+    _COMPILED[node_type] = (desc, steps)
+    return steps
+
+def _compile(desc : "Task description"):
+    """Compile a task description into resolution steps, as run by calculate_marks."""
+
+    if isinstance(desc, dict):
+        return _compile_dict(desc)
+    elif getattr(desc, "is_steps", False):
+        return desc
+    elif hasattr(desc, "__call__"):
+        return _compile_callable(desc)
+    elif isinstance(desc, (list, set, tuple)):
+        return _compile_group(desc)
+    elif isinstance(desc, str):
+        return _compile_field(desc)
+    else:
+        return _constant(lambda marker, node, needed: {}) # Invalid task description
+
+def _constant(calc : "Function of (marker, node, needed) giving the markings"):
+    """Make steps from a calculation that never needs another node resolved."""
+
+    def steps(marker, node, needed):
+        return calc(marker, node, needed)
+        yield # Never reached, but makes this a generator
+    return steps
+
+def _compile_field(field):
+    """Steps to resolve every marking on a child of the node."""
+
+    def steps(marker, node, needed):
+        if field in node:
+            return (yield (node[field], {"visible", "breaks", "reads", "writes"}))
+        return {}
+    return steps
+
+def _compile_group(desc):
+    """Steps combining the results of a list, set or tuple of descriptions."""
+
+    # Fields are resolved here rather than through more steps
+    parts = [d if isinstance(d, str) else _compile(d) for d in desc]
+    if isinstance(desc, list):
+        combine, with_base = "_combine_sequence", False
+    elif isinstance(desc, set):
+        combine, with_base = "_combine_all", False
+    else:
+        combine, with_base = "_combine_any", len(desc) < 2
+
+    def steps(marker, node, needed):
+        marks = []
+        for part in parts:
+            if part.__class__ is not str:
+                marks.append((yield from part(marker, node, needed)))
+            elif part in node:
+                marks.append((yield (node[part], {"visible", "breaks", "reads", "writes"})))
+            else:
+                marks.append({})
+        if with_base:
+            marks.insert(0, marker._base_marks(needed))
+        return getattr(marker, combine)(marks, needed)
+    return steps
+
+def _compile_dict(desc):
+    """Steps for a dictionary description."""
+
+    transform = desc.get("transform")
+    only = desc.get("marks")
+    without = desc.get("nomarks")
+    if only != None and without != None and set(only) & set(without):
+        return _constant(lambda marker, node, needed: {}) # Overlap invalid
+    combine = tuple(desc.get("combine", ()))
+    rem_breaks = desc.get("rem_breaks", ())
+    add_breaks = desc.get("add_breaks", ())
+    add_reads = tuple(desc.get("add_reads", ()))
+    add_writes = tuple(desc.get("add_writes", ()))
+    # Names themselves rather than fields holding them
+    add_visible = desc.get("add_visible", False)
+    add_read_names = desc.get("add_read_names", ())
+    add_write_names = desc.get("add_write_names", ())
+    adjusts = rem_breaks or add_breaks or add_reads or add_writes or add_visible or add_read_names or add_write_names
+
+    def calculate(marker, node, needed, c_marks):
+        if c_marks:
+            marks = marker._combine_sequence(c_marks, needed)
+        else:
+            marks = marker._base_marks(needed)
+
+        if not adjusts:
+            return marks
+
+        # Marking type specific
+        if "breaks" in needed and "breaks" in marks:
+            marks["breaks"].difference_update(rem_breaks)
+            marks["breaks"].update(add_breaks)
+        if add_reads and "reads" in needed and "reads" in marks:
+            marks["reads"] = marks["reads"] | {node[f].node() for f in add_reads}
+        if add_writes and "writes" in needed and "writes" in marks:
+            marks["writes"] = marks["writes"] | {node[f].node() for f in add_writes}
+        if add_visible and "visible" in needed and "visible" in marks:
+            marks["visible"] = True
+        if add_read_names and "reads" in needed and "reads" in marks:
+            marks["reads"] = marks["reads"] | add_read_names
+        if add_write_names and "writes" in needed and "writes" in marks:
+            marks["writes"] = marks["writes"] | add_write_names
+        return marks
+
+    def limit(needed):
+        if only != None:
+            needed = needed.intersection(only)
+        if without != None:
+            needed = needed.difference(without)
+        return needed
+
+    if transform == None and not combine:
+        return _constant(lambda marker, node, needed: calculate(marker, node, limit(needed), None))
+
+    def steps(marker, node, needed):
+        if transform != None:
+            new_node = node.derived(transform, transform)
+            if new_node != None:
+                marker._note_transform(node, new_node)
+                return (yield (new_node, needed))
+
+        needed = limit(needed)
+        c_marks = []
+        for f in combine:
+            if f in node:
+                child = node[f]
+                if not child.is_empty():
+                    c_marks.append((yield (child, needed)))
+        return calculate(marker, node, needed, c_marks)
+    return steps
+
+def _compile_callable(func):
+    """Steps for a function giving a description, compiling each distinct description once."""
+
+    cache = {}
+
+    def steps(marker, node, needed):
+        desc = func(node)
+        try:
+            key = _desc_key(desc)
+            compiled = cache[key]
+        except KeyError:
+            compiled = cache[key] = _compile(desc)
+        except TypeError: # Not something we can remember
+            compiled = _compile(desc)
+        return (yield from compiled(marker, node, needed))
+    return steps
+
+# Steps for the description of a call, once any summary it needs is ready
+_call_desc = _compile_callable(_call_dict)
+_call_unknown = _compile(_CALL_UNKNOWN)
+
+def _desc_key(desc):
+    """Get a hashable key that is equal for equal task descriptions."""
+
+    if isinstance(desc, dict):
+        return (dict, frozenset((k, _desc_key(v)) for k, v in desc.items()))
+    elif isinstance(desc, (list, tuple)):
+        return (desc.__class__, tuple(_desc_key(d) for d in desc))
+    elif isinstance(desc, (set, frozenset)):
+        return (set, frozenset(_desc_key(d) for d in desc))
+    return desc
+
+#############################################
+# Marking in other processes                #
+#############################################
+
+class _Pool:
+    """Process pool which is closed at the end of a with block."""
+
+    def __init__(self, jobs, initializer=None, initargs=()):
+        self.pool = multiprocessing.Pool(jobs, initializer, initargs)
+
+    def __enter__(self):
+        return self.pool
+
+    def __exit__(self, *exc):
+        self.pool.close()
+        self.pool.join()
+
+_WORKER_TREE = None # Tree shared with a worker process by _share_tree
+
+def _share_tree(node):
+    global _WORKER_TREE
+    _WORKER_TREE = CustomAST(node)
+
+def _mark_part(task):
+    """Mark a body of the shared tree in a worker process and give back its packed markings."""
+
+    path, existing, res_order, needed = task
+    part = _WORKER_TREE.at_path(path)
+    if existing != None:
+        analysis.markcache.unpack(existing, part)
+    AutoMarker(res_order).mark_tree(part, needed)
+    return analysis.markcache.pack(part)
+
+def _mark_file(task):
+    """Parse and mark a whole file in a worker process, giving back its markings file."""
+
+    fname, res_order, needed = task
+    with open(fname, "r") as file:
+        source = file.read()
+    tree = CustomAST(ast.parse(source, filename=fname))
+    AutoMarker(res_order).mark_tree(tree, needed)
+    return analysis.markers.sidecar.dumps(tree, source)
+
+def mark_files(fnames : "Source files to mark",
+               res_order : "The resolution order, which cannot include user" = ["calc"],
+               needed : "Set containing the markings we want." = {"visible", "breaks", "reads", "writes"},
+               jobs : "Number of processes to share the files between" = 1):
+    """
+    Mark every node of several files, sharing the files between processes.
+
+    Returns a dictionary from file name to its markings, as written by
+    analysis.markers.sidecar.dumps. Raises IOError or SyntaxError if a file
+    cannot be read or parsed.
+
+    >>> import os, tempfile
+    >>> folder = tempfile.mkdtemp()
+    >>> sources = {os.path.join(folder, n + ".py"): n + " = x" for n in "ab"}
+    >>> for fname, source in sources.items():
+    ...     with open(fname, "w") as file:
+    ...         n = file.write(source)
+    >>> found = mark_files(sorted(sources), ["calc"], jobs=2)
+    >>> fname = os.path.join(folder, "b.py")
+    >>> tree = CustomAST(ast.parse(sources[fname]))
+    >>> analysis.markers.sidecar.loads(found[fname], tree, sources[fname]) > 0
+    True
+    >>> sorted(analysis.markers.store.STORE.get(tree)["writes"])
+    ['b']
+
+    """
+
+    if "user" in res_order:
+        raise ValueError("Cannot ask the user while marking files.")
+
+    tasks = [(f, res_order, needed) for f in fnames]
+    if jobs > 1 and len(tasks) > 1:
+        with _Pool(jobs) as pool:
+            results = pool.map(_mark_file, tasks, chunksize=1)
+    else:
+        results = [_mark_file(t) for t in tasks]
+    return dict(zip(fnames, results))
+
+#############################################
+# Instrumentation                           #
+#############################################
+
+class MarkStats:
+    """
+    Records what an AutoMarker does and where the time goes.
+
+    Give one to an AutoMarker to fill in, and use report() or the
+    attributes. nodes maps each node type to [nodes resolved, seconds],
+    counting the time spent on those nodes but not on their children.
+    methods maps each resolution method to [markings given, seconds].
+    transforms counts the transforms used for each node type, and
+    cache_hits and cache_misses count lookups in the marker's cache. Work
+    done in other processes is not counted.
+
+    >>> stats = MarkStats()
+    >>> tree = CustomAST(ast.parse("a = b"))
+    >>> result = AutoMarker(["calc"], stats=stats).mark_tree(tree)
+    >>> stats.nodes["Name"][0], stats.methods["calc"][0] > 0, stats.methods["default"][0]
+    (2, True, 0)
+    >>> stats.cache_hits, stats.cache_misses
+    (0, 0)
+
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.methods = {m: [0, 0.0] for m in ("mark", "calc", "user", "default")}
+        self.transforms = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.outside_calc = 0.0 # Seconds spent in the other methods
+
+    def timed(self, method : "Name of the resolution method", func : "Function of (node, needed) giving markings"):
+        """Wrap a resolution method so its markings and time are counted."""
+
+        entry = self.methods[method]
+        def timed_method(node, needed):
+            start = time.perf_counter()
+            result = func(node, needed)
+            spent = time.perf_counter() - start
+            entry[0] += len(result)
+            entry[1] += spent
+            self.outside_calc += spent
+            return result
+        return timed_method
+
+    def counted(self, method, steps : "Function of (node, needed) giving resolution steps"):
+        """Wrap resolution steps so their markings are counted. Their time is counted when each node is done."""
+
+        entry = self.methods[method]
+        def counted_steps(node, needed):
+            result = yield from steps(node, needed)
+            entry[0] += len(result)
+            return result
+        return counted_steps
+
+    def resolved(self, node_type, spent : "Seconds spent on the node", calc : "Seconds of that spent calculating"):
+        entry = self.nodes.setdefault(node_type, [0, 0.0])
+        entry[0] += 1
+        entry[1] += spent
+        self.methods["calc"][1] += calc
+
+    def transformed(self, node_type):
+        self.transforms[node_type] = self.transforms.get(node_type, 0) + 1
+
+    def cache_lookup(self, hit):
+        if hit:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+
+    def report(self, limit : "Most node types to list" = 10):
+        """Get a readable report as a list of lines, slowest node types first."""
+
+        count = sum(c for c, t in self.nodes.values())
+        total = sum(t for c, t in self.nodes.values())
+        lines = ["Resolved " + str(count) + " nodes in " + _seconds(total) + "."]
+
+        lines.append("Slowest node types:")
+        slowest = sorted(self.nodes.items(), key=lambda item: item[1][1], reverse=True)
+        for node_type, (c, t) in slowest[:limit]:
+            lines.append("  " + node_type + " - " + str(c) + " nodes, " + _seconds(t))
+
+        lines.append("Resolution methods:")
+        for method in ("mark", "calc", "user", "default"):
+            c, t = self.methods[method]
+            lines.append("  " + method.title() + " - " + str(c) + " markings, " + _seconds(t))
+
+        if self.transforms:
+            used = sorted(self.transforms.items(), key=lambda item: item[1], reverse=True)
+            lines.append("Transforms: " + ", ".join(k + " " + str(v) for k, v in used))
+
+        lookups = self.cache_hits + self.cache_misses
+        if lookups:
+            rate = str(round(100 * self.cache_hits / lookups)) + "%"
+            lines.append("Cache: " + str(self.cache_hits) + " of " + str(lookups) + " entries found (" + rate + ")")
+        return lines
+
+def _seconds(t):
+    return str(round(t, 3)) + "s"
+
+#############################################
+# Marking on demand                         #
+#############################################
+
+class BlockProvider:
+    """
+    Gives the markings of a block of statements like
+    analysis.markers.block_marks, auto-marking any statement that is
+    missing some of them first.
+
+    Only the statements of blocks asked for are marked, and the markings
+    are kept, so each is only worked out once until the tree is edited.
+    Reorderers can be given one of these to use.
+
+    >>> tree = CustomAST(ast.parse("a = b\\nc = a"))
+    >>> provider = BlockProvider()
+    >>> marks = provider(tree["body"])
+    >>> marks.all_marked(), sorted(marks.reads[1]), provider.marked
+    (True, ['a'], 2)
+    >>> provider(tree["body"]).all_marked(), provider.marked
+    (True, 2)
+
+    """
+
+    def __init__(self,
+                 res_order : "The resolution order, which cannot include user" = ["mark", "calc"],
+                 cache : "MarkCache to share markings between runs, or None" = None):
+        self.marker = AutoMarker(res_order, mark=True, cache=cache)
+        self.marked = 0 # Statements we have had to mark
+
+    def __call__(self, block : "CustomAST list of statements"):
+        needed = set(analysis.markers.block.MARKINGS)
+        marks = analysis.markers.store.STORE
+        for c in block.ordered_children():
+            node = block[c]
+            if not needed.issubset(marks.get(node)):
+                self.marker.resolve_marks(node, needed)
+                self.marked += 1
+        return analysis.markers.block.block_marks(block)
+
 class UserStop(Exception): pass
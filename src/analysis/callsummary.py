@@ -0,0 +1,286 @@
+"""
+Summaries of what calling a function does, so calls can be auto-marked.
+
+Only calls made by name are summarised: those to the builtins in BUILTINS,
+and those to functions defined once at the top of the module and bound
+nowhere else. Anything else could be calling anything at all.
+
+A function's summary comes from the calculated markings of its body,
+leaving out the names local to it. Functions that call themselves, directly
+or through others, are not summarised. Each summary is only worked out the
+first time it is needed, and is kept by the structure of the function and
+of everything it calls, so it is shared with other trees and survives edits
+elsewhere in the module. Most calls are then a single lookup.
+
+"""
+
+# OAT - Obfuscation and Analysis Tool
+# Copyright (C) 2011  Andy Gurden
+#
+#     This file is part of OAT.
+#
+#     OAT is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     OAT is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with OAT.  If not, see <http://www.gnu.org/licenses/>.
+
+import weakref
+import collections
+
+from . import customast
+from . import scopes
+from .markers import store
+import analysis.automarker
+
+MARKINGS = ("visible", "breaks", "reads", "writes")
+
+def _summary(visible=False, breaks=("except",), reads=(), writes=()):
+    return {
+        "visible": visible,
+        "breaks": frozenset(breaks),
+        "reads": frozenset(reads),
+        "writes": frozenset(writes),
+    }
+
+# Builtins that only work on the arguments they are given. Any special
+# methods they call are ignored, as they are for operators. Those that
+# iterate over or call their arguments, like list or sorted, could run any
+# code at all and are left out.
+BUILTINS = {name: _summary() for name in (
+    "abs", "ascii", "bin", "bool", "callable", "chr", "complex", "divmod",
+    "enumerate", "filter", "float", "format", "getattr", "hasattr", "hash",
+    "hex", "id", "int", "isinstance", "issubclass", "iter", "len", "map",
+    "oct", "ord", "pow", "range", "repr", "reversed", "round", "slice",
+    "str", "type", "zip",
+)}
+
+# And those that talk to the outside world
+BUILTINS.update((name, _summary(visible=True)) for name in ("print", "input", "open"))
+
+# Number of function summaries to keep
+SHARED_LIMIT = 4096
+
+_SHARED = collections.OrderedDict() # (Structural hash, what it relies on) -> summary, most recent last
+_SITES = weakref.WeakKeyDictionary() # Root -> id -> weak references to calls that could have been marked from a summary
+
+def lookup(call : "Call node"):
+    """
+    Get the summary of what a call does, or None if we cannot tell.
+
+    Summaries are dictionaries of the visible, breaks, reads and writes
+    markings of the call itself, on top of working out its arguments.
+
+    >>> import ast
+    >>> from analysis.customast import CustomAST
+    >>> tree = CustomAST(ast.parse(
+    ...     "def f(x):\\n"
+    ...     "    global total\\n"
+    ...     "    total = x + rate\\n"
+    ...     "def g(a):\\n"
+    ...     "    return f(len(a))\\n"
+    ...     "g(b)\\n"
+    ...     "h(b)\\n"))
+    >>> g = lookup(tree["body"]["2"]["value"])
+    >>> g["visible"], sorted(g["breaks"]), sorted(g["reads"]), sorted(g["writes"])
+    (False, ['except'], ['f', 'len', 'rate'], ['total'])
+    >>> lookup(tree["body"]["3"]["value"]) == None
+    True
+
+    """
+
+    found = table(call).summary(call)
+    if found != None:
+        _SITES.setdefault(call.root(), {})[id(call)] = weakref.ref(call)
+    return found
+
+def adopted(nodes : "Nodes given markings worked out somewhere else"):
+    """Note that any calls among nodes could have been marked from a summary, so edits drop their markings."""
+
+    for node in nodes:
+        if node.type() == "Call":
+            _SITES.setdefault(node.root(), {})[id(node)] = weakref.ref(node)
+
+def table(node : "Any node of the tree"):
+    """Get the CallTable for the tree node is in, made once until the tree is edited."""
+
+    return node.root().derived(CallTable, CallTable)
+
+class CallTable:
+    """Which names the calls in a tree are made to, and what calling them does."""
+
+    def __init__(self, root : "Root of the tree"):
+        self.root = root
+        self.callees = {} # Id of Call node -> module level name it calls
+        self.functions = {} # Name -> FunctionDef we can summarise
+        self.builtins = set() # Names of BUILTINS that are not bound in the module
+        self._scopes = {} # Name -> scope of the function
+        self._calls = {} # Name -> module level names called inside the function
+        self.summaries = {} # Name -> summary, once worked out
+
+        found = scopes.find_scopes(root)
+        self._found = found # Holds the calls, so their ids stay theirs on trees that make nodes on demand
+        outer = found[0]
+        if any(s.star for s in found):
+            return # Any name could be bound
+
+        # Every time each module level name is bound, from anywhere
+        bound = dict(outer.bound)
+        for s in found[1:]:
+            for name, kind in s.declared.items():
+                if kind == "global" and name in s.bound:
+                    bound[name] = bound.get(name, 0) + s.bound[name]
+
+        owners = {id(s.node): s for s in found}
+        if "body" in root and root["body"].is_list():
+            body = root["body"]
+            for c in body.ordered_children():
+                stmt = body[c]
+                name = stmt["name"].node() if stmt.type() == "FunctionDef" else None
+                if name != None and stmt["decorator_list"].is_empty() and bound[name] == 1:
+                    self.functions[name] = stmt
+                    self._scopes[name] = owners[id(stmt)]
+                    self._calls[name] = set()
+        self.builtins = {name for name in BUILTINS if name not in bound}
+
+        tops = {id(s): name for name, s in self._scopes.items()}
+        for s in found:
+            top = s # Scope at the top of the module this one is in
+            while top.parent != None and top.parent is not outer:
+                top = top.parent
+            calls = self._calls.get(tops.get(id(top)))
+            for call in s.calls:
+                name = call["func"]["id"].node()
+                kind, owner = scopes.resolve(s, name)
+                if kind == "global" or (kind == None and owner is outer):
+                    self.callees[id(call)] = name
+                    if calls != None:
+                        calls.add(name)
+
+        # Leave out anything that could end up calling itself
+        for name in list(self.functions):
+            if name in self._reachable(self._calls[name]):
+                del self.functions[name]
+
+    def summary(self, call : "Call node"):
+        """Get the summary of what a call does, or None if we cannot tell."""
+
+        name = self.callees.get(id(call))
+        if name == None:
+            return None
+        func = self.functions.get(name)
+        if func == None:
+            return BUILTINS[name] if name in self.builtins else None
+        found = self._known(name)
+        if found != None:
+            return found
+        if self._scopes[name].yields:
+            return self.summarise(func, None)
+        marker = analysis.automarker.AutoMarker(["calc"], mark=False)
+        return self.summarise(func, marker.resolve_marks(func["body"], set(MARKINGS)))
+
+    def pending(self, call : "Call node"):
+        """
+        Get the function a call is made to if its body needs marking before
+        it can be summarised, or None.
+
+        Markers that only calculate can mark the body themselves and give
+        the markings to summarise, to save it being marked twice.
+
+        """
+
+        name = self.callees.get(id(call))
+        if name == None or name not in self.functions or self._scopes[name].yields or self._known(name) != None:
+            return None
+        return self.functions[name]
+
+    def summarise(self,
+                  func : "FunctionDef we can summarise",
+                  marks : "Calculated visible, breaks, reads and writes markings of its body"):
+        """Keep the summary of a function, worked out from its body. Returns the summary."""
+
+        name = func["name"].node()
+        scope = self._scopes[name]
+        if scope.yields: # Only makes a generator
+            found = _summary()
+        else:
+            local = {n for n in scope.bound if scope.declared.get(n) == None}
+            found = _summary(
+                marks["visible"],
+                set(marks["breaks"]) - {"return"} | {"except"}, # Could also be given the wrong arguments
+                set(marks["reads"]) - local,
+                set(marks["writes"]) - local,
+            )
+        self.summaries[name] = found
+        _SHARED[self._key(name)] = found
+        while len(_SHARED) > SHARED_LIMIT:
+            _SHARED.popitem(last=False)
+        return found
+
+    def _known(self, name):
+        """Get the summary of a function if it has been worked out here or for a tree like this, or None."""
+
+        try:
+            return self.summaries[name]
+        except KeyError:
+            pass
+        key = self._key(name)
+        found = _SHARED.get(key)
+        if found != None:
+            _SHARED.move_to_end(key)
+            self.summaries[name] = found
+        return found
+
+    def _key(self, name):
+        func = self.functions[name]
+        return (func.structural_hash(), tuple(self.depends(func)))
+
+    def depends(self, node : "Node below the root"):
+        """
+        Get what the calls below node rely on in the rest of the module.
+
+        Gives a sorted list of the names that could be called along with
+        the structural hash of their function, or whether they are a
+        builtin. Markings kept for node are only right while this stays
+        the same.
+
+        """
+
+        names = {self.callees[id(n)] for n in node.nodes_of_type("Call") if id(n) in self.callees}
+        names |= self._reachable(names)
+        found = []
+        for name in sorted(names):
+            func = self.functions.get(name)
+            found.append((name, func.structural_hash() if func != None else name in self.builtins))
+        return found
+
+    def _reachable(self, names):
+        """Get every function name that calling the given ones could lead to calling."""
+
+        found = set()
+        pending = list(names)
+        while pending:
+            for n in self._calls.get(pending.pop(), ()):
+                if n not in found:
+                    found.add(n)
+                    pending.append(n)
+        return found
+
+def _edited(node):
+    """Drop the calculated markings of every call summarised in the tree, as the edit could change them."""
+
+    sites = _SITES.pop(node.root(), None)
+    if sites:
+        for ref in sites.values():
+            call = ref() # Held weakly, as the call leads back to the root
+            if call != None:
+                store.STORE.invalidate(call)
+
+customast.EDIT_LISTENERS.append(_edited)
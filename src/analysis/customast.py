@@ -24,13 +24,77 @@ This should provide extra functionality to make certain things simpler.
 #     along with OAT.  If not, see <http://www.gnu.org/licenses/>.
 
 import ast
+import bisect
+import hashlib
+
+# Kinds of node, worked out once per class in node_kind
+KIND_OTHER = 0
+KIND_EMPTY = 1
+KIND_BASIC = 2
+KIND_LIST = 3
+KIND_AST = 4
+
+_KINDS = {type(None): KIND_EMPTY}
+
+# Functions called with the node whenever become() edits a tree
+EDIT_LISTENERS = []
+
+def node_kind(cls : "Class of the wrapped node"):
+    """
+    Get the kind of node a class represents, caching the answer.
+
+    >>> node_kind(ast.Name) == KIND_AST
+    True
+    >>> node_kind(str) == KIND_BASIC
+    True
+
+    """
+
+    try:
+        return _KINDS[cls]
+    except KeyError:
+        pass
+
+    if issubclass(cls, ast.AST):
+        kind = KIND_AST
+    elif issubclass(cls, list):
+        kind = KIND_LIST
+    elif issubclass(cls, (str, int, float, bytes)):
+        kind = KIND_BASIC
+    else:
+        kind = KIND_OTHER
+    _KINDS[cls] = kind
+    return kind
 
 class CustomAST:
     """Wrapper for the built in AST."""
 
-    def __init__(self, node):
+    def __init__(self, node, index : "Build a type index for the tree as we wrap it" = False):
+        self._setup(node)
+        types = TypeIndex() if index else None
+
+        # Wrap the whole tree in document order rather than recursing
+        pending = [self]
+        while pending:
+            current = pending.pop()
+            created = current._gen_children()
+            if types != None:
+                if len(created) == len(current.children):
+                    types.append(current)
+                else:
+                    types = None # Contains existing nodes, leave it until needed
+            pending.extend(reversed(created))
+
+        if types != None:
+            self._types = types
+
+    def _setup(self, node):
+        """Set up our own fields, leaving the children until later."""
+
         self._node = node
-        self._gen_children()
+        self.kind = node_kind(node.__class__)
+        self.parent = None
+        self.link = None
 
     def type(self, asclass=False):
         """
@@ -52,30 +116,22 @@ class CustomAST:
     def is_ast(self):
         """Is the node a normal AST node."""
 
-        return issubclass(self.type(asclass=True), ast.AST)
+        return self.kind == KIND_AST
 
     def is_basic(self):
         """Is the node a basic type."""
 
-        if issubclass(self.type(asclass=True), str):
-            return True
-        if issubclass(self.type(asclass=True), int):
-            return True
-        if issubclass(self.type(asclass=True), float):
-            return True
-        if issubclass(self.type(asclass=True), bytes):
-            return True
-        return False
+        return self.kind == KIND_BASIC
 
     def is_list(self):
         """Is this node a list."""
 
-        return issubclass(self.type(asclass=True), list)
+        return self.kind == KIND_LIST
 
     def is_empty(self):
         """Is the node empty (None or [])."""
 
-        return self._node == None or (self.is_list() and not self.node())
+        return self.kind == KIND_EMPTY or (self.kind == KIND_LIST and not self._node)
 
     def temp_list(self, *vargs):
         """
@@ -104,7 +160,7 @@ class CustomAST:
     def ordered_children(self):
         """Order child names if this is a list."""
 
-        if self.is_list():
+        if self.kind == KIND_LIST:
             return (str(i) for i in range(len(self._node)))
 
         return self.children.keys()
@@ -120,8 +176,165 @@ class CustomAST:
         if not self.is_list() or not node.is_list():
             raise TypeError("become() operation is only supported between lists currently.")
 
+        # Anything we are dropping no longer hangs from us
+        keep = {id(c) for c in node.children.values()}
+        for child in self.children.values():
+            if child.parent is self and id(child) not in keep:
+                child._adopt(None, None)
+
+        types = getattr(self.root(), "_types", None)
+        if types != None:
+            span = types.span(self)
+            types.clear(span)
+
         self._node[:] = node._node
         self.children = node.children.copy()
+        self._relink()
+        self._edited()
+
+        if types != None:
+            types.fill(self, span)
+
+        for listener in EDIT_LISTENERS:
+            listener(self)
+
+    def nodes_of_type(self, typename : "Name of the node type to find"):
+        """
+        Get all nodes of the given type in this subtree, in document order.
+
+        This uses an index kept on the root of the tree, which is built on
+        first use (or while wrapping if index is set) and kept up to date
+        by become().
+
+        >>> tree = CustomAST(ast.parse("a = b\\nc = d"), index=True)
+        >>> [n["id"].node() for n in tree.nodes_of_type("Name")]
+        ['a', 'b', 'c', 'd']
+        >>> [n["id"].node() for n in tree["body"]["1"].nodes_of_type("Name")]
+        ['c', 'd']
+
+        """
+
+        root = self.root()
+        try:
+            types = root._types
+        except AttributeError:
+            types = root._types = TypeIndex(root)
+        return types.between(typename, types.span(self))
+
+    def _relink(self):
+        """
+        Make sure everything below us points back up the right way.
+
+        Nodes built for an edit usually still point at where they came
+        from, so we walk the new subtree and fix any links that are wrong.
+
+        """
+
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            for key in node.children:
+                child = node.children[key]
+                if child.parent is not node or child.link != key:
+                    child._adopt(node, key)
+                stack.append(child)
+
+    def _adopt(self, parent, link):
+        """Record the node we hang from and the field linking us to it."""
+
+        self.parent = parent
+        self.link = link
+
+    def _marked(self):
+        """Called when a MarkStore first keeps markings for us."""
+
+    def _edited(self):
+        """Drop any cached information that relied on this subtree."""
+
+        node = self
+        while node != None:
+            node._drop_caches()
+            node = node.parent
+
+    def _drop_caches(self):
+        """Drop cached information held on this node."""
+
+        for cached in ("_locations", "_shash", "_derived"):
+            try:
+                delattr(self, cached)
+            except AttributeError:
+                pass
+
+    def structural_hash(self):
+        """
+        Get a stable hash of the type and content of this subtree.
+
+        Locations are ignored, so the same code anywhere hashes the same.
+        Hashes are calculated bottom up, cached on each node and dropped
+        when the subtree is edited.
+
+        >>> a = CustomAST(ast.parse("a = b"))
+        >>> a.structural_hash() == CustomAST(ast.parse("\\na = b")).structural_hash()
+        True
+        >>> a.structural_hash() == CustomAST(ast.parse("a = c")).structural_hash()
+        False
+
+        """
+
+        try:
+            return self._shash
+        except AttributeError:
+            pass
+
+        # Post-order so children are always ready before their parent
+        stack = [(self, False)]
+        while stack:
+            node, ready = stack.pop()
+            if hasattr(node, "_shash"):
+                continue
+            if not ready:
+                stack.append((node, True))
+                stack.extend((node[c], False) for c in node.ordered_children())
+                continue
+
+            h = hashlib.sha1(node.type().encode())
+            if node.is_basic():
+                h.update(repr(node.node()).encode())
+            for c in node.ordered_children():
+                h.update(b"\0" + c.encode() + b"=" + node[c]._shash.encode())
+            node._shash = h.hexdigest()
+
+        return self._shash
+
+    def derived(self,
+                key : "Hashable naming what is being worked out",
+                make : "Function taking this node and working it out"):
+        """
+        Get make(self), only calling make once until the subtree is edited.
+
+        >>> a = CustomAST(ast.parse("a = b"))
+        >>> a.derived("size", lambda n: len(list(n.walk()))) is a.derived("size", None)
+        True
+
+        """
+
+        try:
+            found = self._derived
+        except AttributeError:
+            found = self._derived = {}
+        try:
+            return found[key]
+        except KeyError:
+            value = found[key] = make(self)
+            return value
+
+    def _share_child(self, link, value):
+        """Point the underlying node for a child at a shared value."""
+
+        if self.is_list():
+            self._node[int(link)] = value
+        else:
+            setattr(self._node, link, value)
 
     def _gen_children(self):
         """
@@ -132,38 +345,200 @@ class CustomAST:
         dict, but converts any CustomASTs in the simple node to other simple
         nodes.
 
+        The new CustomASTs have not generated their own children yet, so
+        they are returned for the caller to deal with.
+
         """
 
         self.children = dict()
-        if self.is_ast():
+        kind = self.kind
+        if kind == KIND_AST:
             # Then we have an AST node
             self.children = {
                 field: getattr(self._node, field)
                 for field in self._node._fields
             }
 
-        elif self.is_list():
+        elif kind == KIND_LIST:
             # We have a list of nodes
             self.children = {
                 str(idx): self._node[idx]
                 for idx in range(len(self._node))
             }
 
-        elif not self.is_empty() and not self.is_basic():
+        elif kind == KIND_OTHER:
             # We have not met this guy before
             raise TypeError("Not a recognised node type ("+self.type()+").")
 
+        created = []
         for key in self.children:
             if isinstance(self.children[key], CustomAST):
                 # Convert CustomAST node-children to normal nodes
-                if self.is_list():
+                if kind == KIND_LIST:
                     self._node[int(key)] = self.children[key]._node
                 else:
                     setattr(self._node, key, self.children[key]._node)
+                # Only take in orphans, others already belong to a tree
+                if self.children[key].parent == None:
+                    self.children[key]._adopt(self, key)
             else:
                 # And our normal ast children to CustomAST
-                self.children[key] = CustomAST(self.children[key])
+                child = CustomAST.__new__(CustomAST)
+                child._setup(self.children[key])
+                child._adopt(self, key)
+                self.children[key] = child
+                created.append(child)
+        return created
+
+    def walk(self, post : "Give nodes after their children instead of before" = False):
+        """
+        Generate every node in this subtree, in pre-order or post-order.
+
+        This uses an explicit stack so works on trees of any depth.
+
+        >>> tree = CustomAST(ast.parse("a = b"))
+        >>> [n.type() for n in tree.walk() if n.is_ast()][:3]
+        ['Module', 'Assign', 'Name']
+        >>> [n.type() for n in tree.walk(post=True)][-1]
+        'Module'
+
+        """
+
+        stack = [(self, False)]
+        while stack:
+            node, done = stack.pop()
+            if done:
+                yield node
+                continue
+
+            if post:
+                stack.append((node, True))
+            else:
+                yield node
+            stack.extend((node[c], False) for c in reversed(list(node.ordered_children())))
+
+    def root(self):
+        """Get the top node of the tree we belong to."""
+
+        node = self
+        while node.parent != None:
+            node = node.parent
+        return node
+
+    def path(self, relative_to : "Ancestor to stop at, or None for the root" = None):
+        """
+        Get the chain of fields leading from the root (or an ancestor) to us.
+
+        >>> tree = CustomAST(ast.parse("a = b"))
+        >>> tree["body"]["0"]["value"].path()
+        ('body', '0', 'value')
+
+        """
+
+        links = []
+        node = self
+        while node.parent != None and node is not relative_to:
+            links.append(node.link)
+            node = node.parent
+        return tuple(reversed(links))
+
+    def at_path(self, path : "Sequence of fields as returned by path()"):
+        """
+        Get the node at the end of the given chain of fields.
+
+        Raises KeyError if the path does not exist.
+
+        >>> tree = CustomAST(ast.parse("a = b"))
+        >>> tree.at_path(("body", "0", "value")).type()
+        'Name'
+
+        """
+
+        node = self
+        for link in path:
+            node = node[link]
+        return node
+
+    def locate(self,
+               line : "Line number to find",
+               col : "Column offset, or None for the first node on the line" = None):
+        """
+        Find the outermost node starting at the given position.
+
+        If no node starts on the line we take the innermost statement running
+        over it. Trees do not record where nodes end, so a statement is taken
+        to run to the last line any node inside it starts on, and lines after
+        that go to the last statement before them. Otherwise, if no node
+        starts at the exact column we take the closest one before it on the
+        line. Returns None if there is no such node. The index this uses is
+        kept on the root node and dropped when the tree is edited.
+
+        >>> tree = CustomAST(ast.parse("a = b\\nc = d\\nif c:\\n    e = [1,\\n\\n         2]"))
+        >>> tree.locate(2).type()
+        'Assign'
+        >>> tree.locate(2, 4)["id"].node()
+        'd'
+        >>> tree.locate(5).type(), tree.locate(5).location()
+        ('Assign', (4, 4))
+
+        """
+
+        keys, nodes, lasts = self.root()._location_index()
+
+        i = bisect.bisect_left(keys, (line, -1, -1))
+        if i == len(keys) or keys[i][0] != line:
+            return self._statement_over(line, i, nodes, lasts)
+        if col == None:
+            return nodes[i]
+
+        i = max(i, bisect.bisect_right(keys, (line, col, len(keys))) - 1)
+        # Several nodes can start in the same place, we want the outermost
+        while i > 0 and keys[i-1][:2] == keys[i][:2]:
+            i -= 1
+        return nodes[i]
+
+    def _statement_over(self, line, before : "Number of indexed nodes starting before line", nodes, lasts):
+        """Get the innermost statement running over a line, or else the last statement before it."""
+
+        previous = None
+        # The statement starting last is inside any others running over the line
+        for i in range(before - 1, -1, -1):
+            if issubclass(nodes[i].type(asclass=True), ast.stmt):
+                if lasts[i] >= line:
+                    return nodes[i]
+                if previous == None:
+                    previous = nodes[i]
+        return previous
+
+    def _location_index(self):
+        """Get (or build) sorted position keys, their nodes and the last line in each node for this tree."""
 
+        try:
+            return self._locations
+        except AttributeError:
+            pass
+
+        found = []
+        outer = [] # Closest enclosing node in found for each node in found
+        stack = [(self, None)]
+        while stack:
+            node, up = stack.pop()
+            loc = node.location()
+            if loc != None:
+                outer.append(up)
+                up = len(found)
+                found.append((loc[0], loc[1], len(found), node))
+            stack.extend((node[c], up) for c in reversed(list(node.ordered_children())))
+
+        # Nodes come after the nodes enclosing them, so work backwards
+        lasts = [f[0] for f in found]
+        for i in range(len(found) - 1, -1, -1):
+            if outer[i] != None and lasts[i] > lasts[outer[i]]:
+                lasts[outer[i]] = lasts[i]
+
+        found.sort(key=lambda f: f[:3])
+        self._locations = ([f[:3] for f in found], [f[3] for f in found], [lasts[f[2]] for f in found])
+        return self._locations
 
     def location(self):
         """Get the node's location in a file if it exists."""
@@ -207,6 +582,26 @@ class CustomAST:
         
         return d + " (" + l + ")" if l else d
 
+    # Caches are cheaper to rebuild than to store
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for cached in ("_locations", "_types", "_derived"):
+            state.pop(cached, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if "kind" not in state:
+            # Saved by older versions, before nodes knew their kind or
+            # parent. Our children are always loaded before us.
+            self.kind = node_kind(self._node.__class__)
+            self.parent = None
+            self.link = None
+            for key, child in self.children.items():
+                if child.parent == None:
+                    child._adopt(self, key)
+
     # For dictionary lookup of children and iteration
 
     def __getitem__(self, key):
@@ -225,3 +620,181 @@ class CustomAST:
 
     def __len__(self):
         return len(self.children)
+
+
+class TypeIndex:
+    """
+    Lists of the nodes of each type in a tree, in document order.
+
+    Each node is given an order number, spaced out so that edited blocks
+    can be numbered again without touching the rest of the tree. The nodes
+    under any node then have order numbers in a single range, so finding
+    them is a matter of slicing each list.
+
+    """
+
+    GAP = 1 << 10
+
+    def __init__(self, tree : "Root to index, or None to fill with append" = None):
+        self._orders = {}
+        self._types = {}
+        self._next = 0
+        if tree != None:
+            for node in tree.walk():
+                self.append(node)
+
+    def append(self, node : "Node coming after all others in the index"):
+        """Add a node to the end of the index."""
+
+        self._add(node, self._next)
+        self._next += self.GAP
+
+    def _add(self, node, order):
+        self._orders[id(node)] = order
+        try:
+            orders, nodes = self._types[node.type()]
+        except KeyError:
+            orders, nodes = self._types[node.type()] = ([], [])
+        orders.append(order)
+        nodes.append(node)
+
+    def order(self, node):
+        """Get the order number of a node, or None if it is not indexed."""
+
+        order = self._orders.get(id(node))
+        if order == None:
+            return None
+        orders, nodes = self._types.get(node.type(), ((), ()))
+        i = bisect.bisect_left(orders, order)
+        if i < len(nodes) and nodes[i] is node:
+            return order
+        return None
+
+    def span(self, node):
+        """Get the (start, end) range of order numbers used by the node's subtree."""
+
+        start = self.order(node)
+        if start == None:
+            self._rebuild(node.root())
+            start = self.order(node)
+            if start == None:
+                raise ValueError("Node is not part of the indexed tree.")
+
+        # The subtree ends where the next node after it begins
+        while node.parent != None:
+            links = list(node.parent.ordered_children())
+            for link in links[links.index(node.link)+1:]:
+                return (start, self.order(node.parent[link]))
+            node = node.parent
+        return (start, None)
+
+    def between(self, typename, span):
+        """Get the nodes of a type with order numbers in the span."""
+
+        try:
+            orders, nodes = self._types[typename]
+        except KeyError:
+            return []
+        start, end = span
+        i = bisect.bisect_left(orders, start)
+        j = len(orders) if end == None else bisect.bisect_left(orders, end)
+        return nodes[i:j]
+
+    def clear(self, span):
+        """Remove everything inside the span, except its first node."""
+
+        start, end = span
+        for orders, nodes in self._types.values():
+            i = bisect.bisect_right(orders, start)
+            j = len(orders) if end == None else bisect.bisect_left(orders, end)
+            for node in nodes[i:j]:
+                self._orders.pop(id(node), None)
+            del orders[i:j]
+            del nodes[i:j]
+
+    def fill(self, node, span):
+        """Index everything below node, which must have an empty span."""
+
+        start, end = span
+        below = list(node.walk())[1:]
+        if end == None:
+            end = start + (len(below) + 1) * self.GAP
+            self._next = max(self._next, end)
+        step = (end - start) // (len(below) + 1)
+        if step < 1:
+            self._rebuild(node.root())
+            return
+
+        added = {}
+        for i, n in enumerate(below, 1):
+            self._orders[id(n)] = start + i * step
+            added.setdefault(n.type(), ([], []))
+            added[n.type()][0].append(start + i * step)
+            added[n.type()][1].append(n)
+
+        for typename in added:
+            orders, nodes = self._types.setdefault(typename, ([], []))
+            i = bisect.bisect_right(orders, start)
+            orders[i:i] = added[typename][0]
+            nodes[i:i] = added[typename][1]
+
+    def _rebuild(self, tree):
+        """Number the whole tree again from scratch."""
+
+        self.__init__(tree)
+
+
+class Visitor:
+    """
+    Base class for anything that needs to visit a whole tree.
+
+    Subclasses can define enter_<type> and leave_<type> methods for the
+    node types they care about, and enter and leave for everything else.
+    Enter methods are called before the children are visited and leave
+    methods after. If an enter method returns False the children of that
+    node are skipped. An explicit stack is used rather than recursion.
+
+    >>> class Names(Visitor):
+    ...     def __init__(self):
+    ...         self.found = []
+    ...     def enter_Name(self, node):
+    ...         self.found.append(node["id"].node())
+    >>> names = Names()
+    >>> names.visit(CustomAST(ast.parse("a = b + c")))
+    >>> names.found
+    ['a', 'b', 'c']
+
+    """
+
+    def visit(self, tree : "CustomAST to visit"):
+        """Visit every node in the tree."""
+
+        handlers = {}
+        def handler(event, cls):
+            try:
+                return handlers[event, cls]
+            except KeyError:
+                found = getattr(self, event + "_" + cls.__name__, None)
+                if found == None:
+                    found = getattr(self, event)
+                handlers[event, cls] = found
+                return found
+
+        stack = [(tree, False)]
+        while stack:
+            node, done = stack.pop()
+            cls = node.type(asclass=True)
+            if done:
+                handler("leave", cls)(node)
+                continue
+
+            stack.append((node, True))
+            if handler("enter", cls)(node) == False:
+                continue
+            stack.extend((node[c], False) for c in reversed(list(node.ordered_children())))
+
+    def enter(self, node):
+        """Called on entering a node without its own enter method."""
+
+    def leave(self, node):
+        """Called on leaving a node without its own leave method."""
@@ -0,0 +1,206 @@
+"""
+Update a parsed tree to match edited source, keeping what has not changed.
+
+Statements are compared by their code, first at the top level and then
+inside the bodies of changed functions and classes. Comments and blank
+lines are left out, so only changes to the code itself count. Statements
+whose code is unchanged keep their CustomAST nodes, and so their markings,
+and are just moved to their new lines.
+
+"""
+
+# OAT - Obfuscation and Analysis Tool
+# Copyright (C) 2011  Andy Gurden
+#
+#     This file is part of OAT.
+#
+#     OAT is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     OAT is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with OAT.  If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import ast
+import difflib
+import tokenize
+
+from .customast import CustomAST
+from .markers import store
+
+# Statements whose bodies we will look inside rather than replace whole
+_NESTED = ("FunctionDef", "ClassDef")
+
+def update(tree : "CustomAST Module parsed from old_source",
+           old_source : "Source the tree was parsed from",
+           new_source : "Edited source",
+           filename : "Name of the source file" = "<unknown>"):
+    """
+    Bring tree up to date with new_source.
+
+    Returns the number of statements added, removed or replaced.
+
+    The tree is edited in place. Raises SyntaxError if the new source is
+    invalid, in which case the tree is left alone.
+
+    >>> tree = CustomAST(ast.parse("a = 1\\ndef f():\\n    b = 2\\n    c = 3\\n"))
+    >>> kept = tree["body"]["1"]["body"]["1"]
+    >>> update(tree, "a = 1\\ndef f():\\n    b = 2\\n    c = 3\\n",
+    ...        "x = 0\\na = 1\\ndef f():\\n    b = 5\\n    c = 3\\n")
+    2
+    >>> tree["body"]["2"]["body"]["1"] is kept, kept.location()
+    (True, (5, 4))
+    >>> tree = CustomAST(ast.parse("x = 0\\na = 1\\n"))
+    >>> update(tree, "x = 0\\na = 1\\n", "x = 0  # Start\\n\\n# Then\\na = 1\\n")
+    0
+
+    """
+
+    new_tree = ast.parse(new_source, filename=filename)
+
+    changer = _Updater(old_source, new_source)
+    body = tree["body"]
+    stmts = changer.block(body,
+                          new_tree.body,
+                          len(changer.old_lines) + 1,
+                          len(changer.new_lines) + 1)
+    if changer.changed:
+        body.become(CustomAST(stmts))
+        _forget_markings(body)
+        _forget_markings(tree)
+    tree._edited() # Locations have moved even if nothing else did
+    return changer.changed
+
+class _Updater:
+    """Matches up blocks of statements between the old and new source."""
+
+    def __init__(self, old_source, new_source):
+        self.old_lines = _code_lines(old_source)
+        self.new_lines = _code_lines(new_source)
+        self.changed = 0
+
+    def block(self, old, new, old_end, new_end):
+        """Get the list of statements to replace the old block with."""
+
+        old_stmts = [old[c] for c in old.ordered_children()]
+        old_keys = _keys([s.node() for s in old_stmts], self.old_lines, old_end)
+        new_keys = _keys(new, self.new_lines, new_end)
+
+        result = []
+        matcher = difflib.SequenceMatcher(None, [k[2:] for k in old_keys], [k[2:] for k in new_keys], False)
+        for op, i1, i2, j1, j2 in matcher.get_opcodes():
+            if op == "equal":
+                for o, n in zip(range(i1, i2), range(j1, j2)):
+                    ast.increment_lineno(old_stmts[o].node(), new_keys[n][0] - old_keys[o][0])
+                    result.append(old_stmts[o])
+                continue
+
+            if op == "replace" and i2 - i1 == j2 - j1:
+                pairs = zip(range(i1, i2), range(j1, j2))
+            else:
+                pairs = ()
+                self.changed += i2 - i1 # Removed
+                result.extend(self._fresh(new[j1:j2]))
+
+            for o, n in pairs:
+                kept = self._nested(old_stmts[o], new[n], old_keys[o], new_keys[n])
+                result.extend(self._fresh([new[n]]) if kept == None else [kept])
+
+        return result
+
+    def _nested(self, old, new, old_key, new_key):
+        """Try to update a function or class in place, or return None."""
+
+        if old.type() not in _NESTED or old.type() != new.__class__.__name__:
+            return None
+
+        old_node = old.node()
+        old_body = old_node.body[0].lineno
+        new_body = new.body[0].lineno
+        old_start, new_start = old_key[0], new_key[0]
+        if old_body == old_start or new_body == new_start:
+            return None # Body on the same line as the header
+        if self.old_lines[old_start-1:old_body-1] != self.new_lines[new_start-1:new_body-1]:
+            return None # Header has changed
+
+        stmts = self.block(old["body"], new.body, old_key[1], new_key[1])
+
+        # Move everything but the body, which has been dealt with
+        delta = new_start - old_start
+        for field in old_node._fields:
+            if field != "body":
+                value = getattr(old_node, field)
+                for child in (value if isinstance(value, list) else [value]):
+                    if isinstance(child, ast.AST):
+                        ast.increment_lineno(child, delta)
+        for attr in ("lineno", "end_lineno", "end_col_offset"):
+            if hasattr(new, attr):
+                setattr(old_node, attr, getattr(new, attr))
+
+        old["body"].become(CustomAST(stmts))
+        _forget_markings(old["body"])
+        _forget_markings(old)
+        return old
+
+    def _fresh(self, stmts):
+        """Wrap newly parsed statements."""
+
+        self.changed += len(stmts)
+        return [CustomAST(s) for s in stmts]
+
+def _keys(stmts, lines, end):
+    """
+    Get a (first line, last line, column, code) key for each statement.
+
+    Each statement takes every line up to the start of the next one, so
+    equal code means an equal statement. The code of each line is from
+    _code_lines, and lines without any are left out.
+
+    """
+
+    starts = [_first_line(s) for s in stmts] + [end]
+    keys = []
+    for i, s in enumerate(stmts):
+        stop = max(starts[i+1], starts[i] + 1)
+        code = tuple((n - starts[i], line) for n, line in enumerate(lines[starts[i]-1:stop-1], starts[i]) if line)
+        keys.append((starts[i], stop, s.col_offset, code))
+    return keys
+
+def _code_lines(source : "Source code as a string"):
+    """
+    Get the tokens of code starting on each line, leaving out comments.
+
+    Each line is given as a tuple of (column, text) pairs, so changing the
+    code or where it sits changes the line, but comments do not.
+
+    >>> _code_lines("a = b  # c\\n\\n# d\\n")
+    [((0, 'a'), (2, '='), (4, 'b')), (), ()]
+
+    """
+
+    lines = [[] for l in source.splitlines()]
+    skip = (tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT, tokenize.ENDMARKER)
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(source).readline):
+            if tok[0] not in skip:
+                lines[tok[2][0] - 1].append((tok[2][1], tok[1]))
+    except (tokenize.TokenError, SyntaxError): # Compare the lines as they are
+        return [((0, l),) for l in source.splitlines()]
+    return [tuple(l) for l in lines]
+
+def _first_line(stmt):
+    """Get the first line of a statement, including any decorators."""
+
+    return min([stmt.lineno] + [d.lineno for d in getattr(stmt, "decorator_list", [])])
+
+def _forget_markings(node):
+    """Drop markings which described the old contents of the node."""
+
+    store.STORE.forget(node)
@@ -0,0 +1,266 @@
+"""
+Keep calculated markings on disk so unchanged code is not marked again.
+
+Entries are named by a hash of everything their markings were calculated
+from, so an entry never needs updating, only adding or evicting. Once the
+cache grows past its size limit the least recently used entries are
+dropped.
+
+Each entry holds the markings below one node, as written by
+analysis.markers.sidecar, followed by which of them were calculated and
+the names of any other entries that go with it.
+
+"""
+
+# OAT - Obfuscation and Analysis Tool
+# Copyright (C) 2011  Andy Gurden
+#
+#     This file is part of OAT.
+#
+#     OAT is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     OAT is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with OAT.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import json
+import struct
+import hashlib
+
+from .markers import sidecar
+from .markers import store
+
+# Change this whenever the way markings are calculated changes
+VERSION = 3
+
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".oat", "markcache")
+DEFAULT_LIMIT = 64 * 1024 * 1024
+
+_LENGTH = struct.Struct("<I")
+
+def key(*parts : "Everything the markings were calculated from"):
+    """Get the name of the entry for the given parts."""
+
+    h = hashlib.sha224(str(VERSION).encode())
+    for p in parts:
+        h.update(b"\0" + str(p).encode())
+    return h.hexdigest()
+
+def pack(tree : "Node to store the markings below",
+         marks : "MarkStore holding the markings" = None,
+         keep : "Function saying which marked nodes to store, or None for all" = None,
+         links : "Names of other entries to load along with this one" = ()):
+    """
+    Get the markings below tree as bytes, see unpack.
+
+    >>> import ast
+    >>> from analysis.customast import CustomAST
+    >>> tree = CustomAST(ast.parse("a = b"))
+    >>> marks = store.MarkStore()
+    >>> marks.set(tree["body"]["0"], "reads", {"b"})
+    >>> marks.derive(tree["body"]["0"], {"reads"}, [])
+    >>> fresh, found = CustomAST(ast.parse("a = b")), store.MarkStore()
+    >>> unpack(pack(tree, marks, links=["other"]), fresh, found)
+    ['other']
+    >>> found.get(fresh["body"]["0"])["reads"], found.is_derived(fresh["body"]["0"], "reads")
+    (frozenset({'b'}), True)
+
+    """
+
+    marks = store.STORE if marks == None else marks
+
+    nodes = []
+    data = sidecar.dumps(tree, "", marks, keep, nodes)
+
+    # Calculated marking names -> positions of the nodes with them
+    derived = {}
+    for i, node in enumerate(nodes):
+        names = [m for m in marks.get(node) if marks.is_derived(node, m)]
+        if names:
+            derived.setdefault(",".join(sorted(names)), []).append(i)
+
+    trailer = json.dumps({"derived": derived, "links": list(links)}, separators=(",", ":"))
+    return b"".join([_LENGTH.pack(len(data)), data, trailer.encode()])
+
+def unpack(data : "Bytes from pack",
+           tree : "Node with the same structure as the one packed",
+           marks : "MarkStore to put the markings in" = None,
+           nodes : "List to add each node marked to" = None):
+    """
+    Put packed markings back on tree. Returns the names of linked entries.
+
+    Calculated markings are recorded as depending on the children of their
+    node. Raises TypeError if the data cannot be used.
+
+    """
+
+    marks = store.STORE if marks == None else marks
+
+    try:
+        size, = _LENGTH.unpack_from(data)
+        trailer = json.loads(data[_LENGTH.size + size:].decode())
+        derived, links = trailer["derived"], trailer["links"]
+    except (struct.error, ValueError, KeyError, TypeError):
+        raise TypeError("Not packed markings.")
+
+    nodes = [] if nodes == None else nodes
+    start = len(nodes)
+    try:
+        sidecar.loads(data[_LENGTH.size:_LENGTH.size + size], tree, "", marks, nodes)
+        for names, positions in derived.items():
+            names = frozenset(names.split(","))
+            for i in positions:
+                node = nodes[start + i]
+                marks.derive(node, names, node.children.values())
+    except (ValueError, IndexError):
+        raise TypeError("Packed markings do not match the tree.")
+    return links
+
+class MarkCache:
+    """
+    Directory of packed markings with a limit on its total size.
+
+    Problems reading or writing the directory are treated as misses, so
+    the cache can only ever make marking faster.
+
+    >>> import tempfile
+    >>> cache = MarkCache(tempfile.mkdtemp(), limit=10)
+    >>> cache.put(key("a"), b"123456"); cache.put(key("b"), b"123456")
+    >>> cache.get(key("a")), cache.get(key("b"))
+    (None, b'123456')
+    >>> stats = cache.stats()
+    >>> stats["entries"], stats["size"], stats["hits"], stats["misses"]
+    (1, 6, 1, 1)
+    >>> cache.clear()
+    1
+
+    """
+
+    def __init__(self,
+                 directory : "Where to keep the entries" = None,
+                 limit : "Largest total size in bytes" = DEFAULT_LIMIT):
+        self.directory = DEFAULT_DIR if directory == None else directory
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+        self._entries = None # Name -> [size, (last used, order)], read on first need
+        self._uses = 0 # Orders uses made at the same time
+
+    def _path(self, name):
+        return os.path.join(self.directory, name[:2], name)
+
+    def get(self, name : "Entry name from key"):
+        """Get the data for an entry, or None if it is not there."""
+
+        try:
+            with open(self._path(name), "rb") as file:
+                data = file.read()
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        entries = self._scan()
+        if name in entries:
+            entries[name][1] = self._stamp()
+        try:
+            os.utime(self._path(name), None) # Recently used for later sessions
+        except (IOError, OSError):
+            pass
+        return data
+
+    def put(self, name : "Entry name from key", data : "Bytes to keep"):
+        """Add an entry, evicting old ones if we are now too big."""
+
+        path = self._path(name)
+        temp = path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp, "wb") as file:
+                file.write(data)
+            os.replace(temp, path)
+        except (IOError, OSError):
+            return
+
+        self._scan()[name] = [len(data), self._stamp()]
+        self._evict()
+
+    def clear(self):
+        """Remove every entry. Returns the number removed."""
+
+        count = 0
+        for name in list(self._scan()):
+            if self._remove(name):
+                count += 1
+        self._entries = None
+        return count
+
+    def stats(self):
+        """Get a dictionary of the number of entries, their size, the limit and hits and misses so far."""
+
+        entries = self._scan()
+        return {
+            "entries": len(entries),
+            "size": sum(e[0] for e in entries.values()),
+            "limit": self.limit,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _scan(self):
+        """Get our table of entries, reading the directory the first time."""
+
+        if self._entries == None:
+            self._entries = {}
+            try:
+                subdirs = os.listdir(self.directory)
+            except (IOError, OSError):
+                subdirs = []
+            for sub in subdirs:
+                try:
+                    names = os.listdir(os.path.join(self.directory, sub))
+                except (IOError, OSError):
+                    continue
+                for name in names:
+                    if name.endswith(".tmp"):
+                        continue
+                    try:
+                        info = os.stat(os.path.join(self.directory, sub, name))
+                    except (IOError, OSError):
+                        continue
+                    self._entries[name] = [info.st_size, (info.st_mtime, 0)]
+        return self._entries
+
+    def _stamp(self):
+        self._uses += 1
+        return (time.time(), self._uses)
+
+    def _evict(self):
+        """Drop the least recently used entries until we are within the limit."""
+
+        entries = self._scan()
+        size = sum(e[0] for e in entries.values())
+        if size <= self.limit:
+            return
+        for name in sorted(entries, key=lambda n: entries[n][1]):
+            if size <= self.limit:
+                break
+            size -= entries[name][0]
+            self._remove(name)
+
+    def _remove(self, name):
+        self._scan().pop(name, None)
+        try:
+            os.remove(self._path(name))
+        except (IOError, OSError):
+            return False
+        return True
@@ -20,3 +20,5 @@ Contains markers for the AST.
 # 
 #     You should have received a copy of the GNU General Public License
 #     along with OAT.  If not, see <http://www.gnu.org/licenses/>.
+
+from .block import block_marks, BlockMarks
@@ -24,12 +24,23 @@ Basic functions that a marker should do.
 import ast
 import abc
 from ..customast import CustomAST
+from . import store
 
 class BasicMarker(metaclass=abc.ABCMeta):
+    """
+    View of one type of marking on a node.
+
+    The markings themselves are kept in a MarkStore, the shared one unless
+    another is given, so markers are cheap to create and throw away.
+
+    """
+
     def __init__(self,
                  mark : "Name of the marking",
-                 node : "Node to mark" = None):
+                 node : "Node to mark" = None,
+                 marks : "MarkStore holding the markings" = None):
         self.mark = mark
+        self.marks = store.STORE if marks == None else marks
         if node == None:
             self.node = CustomAST(None)
         elif not isinstance(node, CustomAST):
@@ -45,38 +56,22 @@ class BasicMarker(metaclass=abc.ABCMeta):
     def has_markings(self):
         """Check if our node has markings."""
 
-        return hasattr(self.node, "_markings")
-
-    def _get_markings(self, create : "Should we add markings if possible?" = False):
-        """Get markings if the node has them, or None."""
-
-        if self.has_markings():
-            return self.node._markings
-        elif create:
-            self.node._markings = {}
-            return self.node._markings
-        else:
-            return None
+        return self.marks.has(self.node)
 
     def is_marked(self):
         """Check if the node contains this type of marking."""
 
-        marks = self._get_markings()
-        return marks != None and self.mark in marks
+        return self.mark in self.marks.get(self.node)
 
     def get_mark(self):
-        """Get the value of our marking, or the default."""
-
-        marks = self._get_markings()
-        if marks == None:
-            return self.get_default()
+        """Get the value of our marking, or the default. The value is immutable."""
 
-        return marks.get(self.mark, self.get_default())
+        return self.marks.get(self.node).get(self.mark, self.get_default())
 
     def set_mark(self, val):
         """Set the value of our marking."""
 
-        self._get_markings(True)[self.mark] = val
+        self.marks.set(self.node, self.mark, val)
         return True
 
     @abc.abstractmethod
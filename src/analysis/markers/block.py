@@ -0,0 +1,85 @@
+"""
+Snapshot of the markings for every statement in a block.
+
+"""
+
+# OAT - Obfuscation and Analysis Tool
+# Copyright (C) 2011  Andy Gurden
+#
+#     This file is part of OAT.
+#
+#     OAT is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     OAT is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with OAT.  If not, see <http://www.gnu.org/licenses/>.
+
+from . import store
+
+# Markings a statement needs before it can be reordered
+MARKINGS = ("visible", "breaks", "reads", "writes")
+
+def block_marks(block : "CustomAST list of statements",
+                marks : "MarkStore holding the markings" = None):
+    """
+    Read the markings of every statement in block at once.
+
+    >>> import ast
+    >>> from analysis.customast import CustomAST
+    >>> from analysis.markers import read
+    >>> block = CustomAST([ast.Pass(), ast.Pass()])
+    >>> read.ReadMarker(block["0"]).set_mark({"a"})
+    True
+    >>> bm = block_marks(block)
+    >>> bm.reads, bm.can_break, bm.all_marked()
+    ([NameSet(['a']), NameSet([])], [True, True], False)
+
+    """
+
+    return BlockMarks(block, marks)
+
+class BlockMarks:
+    """
+    The markings of a block of statements, as one list for each marking.
+
+    Item i of every list belongs to the i-th statement of the block. Missing
+    markings are given the same defaults the markers would use.
+
+    """
+
+    def __init__(self, block, marks=None):
+        marks = store.STORE if marks == None else marks
+        no_names = marks.name_set((), block)
+
+        self.nodes = [block[c] for c in block.ordered_children()]
+        self.marked = []
+        self.visible = []
+        self.breaks = []
+        self.can_break = []
+        self.reads = []
+        self.writes = []
+
+        for node in self.nodes:
+            record = marks.get(node)
+            brks = record.get("breaks")
+            self.marked.append(all(m in record for m in MARKINGS))
+            self.visible.append(record.get("visible", True))
+            self.breaks.append(frozenset() if brks == None else brks)
+            self.can_break.append(True if brks == None else bool(brks))
+            self.reads.append(record.get("reads", no_names))
+            self.writes.append(record.get("writes", no_names))
+
+    def all_marked(self):
+        """Check if every statement has all the markings needed to reorder."""
+
+        return all(self.marked)
+
+    def __len__(self):
+        return len(self.nodes)
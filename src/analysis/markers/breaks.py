@@ -26,16 +26,16 @@ from . import basic
 class BreakMarker(basic.BasicMarker):
     """Marks and shows markings for flow breaking nodes."""
 
-    def __init__(self, node = None):
-        basic.BasicMarker.__init__(self, "breaks", node)
+    def __init__(self, node = None, marks = None):
+        basic.BasicMarker.__init__(self, "breaks", node, marks)
 
     def get_default(self):
         """Get the default value for this marking."""
 
-        return set()
+        return frozenset()
 
     def duplicate(self):
-        return self.get_mark().copy()
+        return set(self.get_mark())
 
     def canBreak(self):
         """Check if the node can break from normal flow. Use safe default if unsure."""
@@ -51,9 +51,7 @@ class BreakMarker(basic.BasicMarker):
         if type not in ["except", "return", "break", "continue", "yield"]:
             return False
 
-        breakers = self.get_mark()
-        breakers.add(type)
-        return self.set_mark(breakers)
+        return self.set_mark(self.get_mark() | {type})
 
     def removeBreak(self, type):
         """Remove a break type from the possibilities. Return whether we were successful."""
@@ -61,9 +59,4 @@ class BreakMarker(basic.BasicMarker):
         if type not in ["except", "return", "break", "continue", "yield"]:
             return False
 
-        breakers = self.get_mark()
-        try:
-            breakers.remove(type)
-        except KeyError:
-            pass
-        return self.set_mark(breakers)
+        return self.set_mark(self.get_mark() - {type})
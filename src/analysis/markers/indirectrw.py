@@ -22,20 +22,21 @@ Keeps track of indirect accesses of names, those accessed in an enclosed scope.
 #     along with OAT.  If not, see <http://www.gnu.org/licenses/>.
 
 from . import basic
+from . import store
 
 class IndirectRWMarker(basic.BasicMarker):
     """Marks and shows markings for node's indirect accesses."""
 
-    def __init__(self, node = None):
-        basic.BasicMarker.__init__(self, "indirectrw", node)
+    def __init__(self, node = None, marks = None):
+        basic.BasicMarker.__init__(self, "indirectrw", node, marks)
 
     def get_default(self):
         """Get the default value for this marking."""
 
-        return {}
+        return store.EMPTY
 
     def duplicate(self):
-        return self.get_mark().copy()
+        return dict(self.get_mark())
 
     def getVariable(self, name, scope):
         """Get a tuple (read, write) containing whether the given variable it read or written. None is used if we don't know."""
@@ -49,7 +50,7 @@ class IndirectRWMarker(basic.BasicMarker):
     def _add_variable(self, name, scope, *, read=None, write=None):
         """Add variable ref to our node. Return whether we were successful."""
         
-        marks = self.get_mark()
+        marks = self.duplicate()
         p_r, p_w = self.getVariable(name, scope)
         if read != None:
             p_r = read
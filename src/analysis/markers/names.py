@@ -0,0 +1,209 @@
+"""
+Sets of variable names stored as bits of an integer.
+
+Names are given small numbers by a symbol table, so a set of names is just
+an int with those bits set. Unions, intersections and differences of sets
+from the same table are then a single integer operation.
+
+"""
+
+# OAT - Obfuscation and Analysis Tool
+# Copyright (C) 2011  Andy Gurden
+#
+#     This file is part of OAT.
+#
+#     OAT is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     OAT is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with OAT.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections.abc import Set
+
+class SymbolTable:
+    """Gives each name a small number, in the order they are first seen."""
+
+    def __init__(self):
+        self.names = []
+        self._ids = {}
+
+    def index(self, name : "Name to look up", add : "Number the name if it is new" = True):
+        """Get the number for a name, or None if it is new and add is False."""
+
+        try:
+            return self._ids[name]
+        except KeyError:
+            if not add:
+                return None
+            self._ids[name] = len(self.names)
+            self.names.append(name)
+            return self._ids[name]
+
+    def mask(self, names : "Iterable of names"):
+        """Get the bits for a collection of names."""
+
+        bits = 0
+        for n in names:
+            bits |= 1 << self.index(n)
+        return bits
+
+    def __len__(self):
+        return len(self.names)
+
+# The table used by name sets that do not belong to any tree
+SYMBOLS = SymbolTable()
+
+def table(node : "Any node of the tree"):
+    """
+    Get the symbol table for the names in a tree, kept on its root.
+
+    Each tree numbers its own names, so the sets for one file stay as small
+    as the names in it. The table is kept when the tree is edited, so sets
+    made before and after an edit still work on their bits alone.
+
+    >>> import ast
+    >>> from analysis.customast import CustomAST
+    >>> a, b = CustomAST(ast.parse("x = y")), CustomAST(ast.parse("x = y"))
+    >>> table(a["body"]["0"]) is table(a), table(a) is table(b)
+    (True, False)
+    >>> before = table(a)
+    >>> a["body"].become(CustomAST(ast.parse("z = x").body))
+    >>> table(a) is before
+    True
+
+    """
+
+    root = node.root()
+    try:
+        return root._symbols
+    except AttributeError:
+        root._symbols = SymbolTable()
+        return root._symbols
+
+class NameSet(Set):
+    """
+    Immutable set of names, kept as bits in a symbol table.
+
+    Works with other sets like a frozenset, but operations between sets from
+    the same table never look at the names themselves.
+
+    >>> a, b = NameSet({"x", "y"}), NameSet({"y", "z"})
+    >>> a & b, a | b, a - b
+    (NameSet(['y']), NameSet(['x', 'y', 'z']), NameSet(['x']))
+    >>> (a & b).bits == a.bits & b.bits
+    True
+    >>> a == {"x", "y"}, "z" in a, {"q"} | a
+    (True, False, NameSet(['q', 'x', 'y']))
+
+    """
+
+    __slots__ = ("bits", "table", "_hash")
+
+    def __init__(self,
+                 names : "Iterable of names" = (),
+                 table : "SymbolTable to number the names" = None):
+        self.table = SYMBOLS if table == None else table
+        self.bits = self._coerce(names)
+        self._hash = None
+
+    @classmethod
+    def from_bits(cls, bits : "Integer of name bits", table : "SymbolTable the bits refer to"):
+        """Make a set straight from bits without looking at any names."""
+
+        s = cls.__new__(cls)
+        s.table = table
+        s.bits = bits
+        s._hash = None
+        return s
+
+    def _coerce(self, other):
+        """Get the bits for other in our table."""
+
+        if isinstance(other, NameSet) and other.table is self.table:
+            return other.bits
+        return self.table.mask(other)
+
+    def _make(self, bits):
+        return NameSet.from_bits(bits, self.table)
+
+    def __contains__(self, name):
+        i = self.table.index(name, add=False)
+        return i != None and bool(self.bits >> i & 1)
+
+    def __iter__(self):
+        names = self.table.names
+        bits = self.bits
+        while bits:
+            low = bits & -bits
+            yield names[low.bit_length() - 1]
+            bits ^= low
+
+    def __len__(self):
+        return bin(self.bits).count("1")
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __and__(self, other):
+        return self._make(self.bits & self._coerce(other))
+
+    def __or__(self, other):
+        return self._make(self.bits | self._coerce(other))
+
+    def __sub__(self, other):
+        return self._make(self.bits & ~self._coerce(other))
+
+    def __xor__(self, other):
+        return self._make(self.bits ^ self._coerce(other))
+
+    def __rsub__(self, other):
+        return self._make(self._coerce(other) & ~self.bits)
+
+    __rand__ = __and__
+    __ror__ = __or__
+    __rxor__ = __xor__
+
+    def union(self, *others):
+        bits = self.bits
+        for o in others:
+            bits |= self._coerce(o)
+        return self._make(bits)
+
+    def intersection(self, *others):
+        bits = self.bits
+        for o in others:
+            bits &= self._coerce(o)
+        return self._make(bits)
+
+    def difference(self, *others):
+        bits = self.bits
+        for o in others:
+            bits &= ~self._coerce(o)
+        return self._make(bits)
+
+    def isdisjoint(self, other):
+        return not self.bits & self._coerce(other)
+
+    def __eq__(self, other):
+        if isinstance(other, NameSet) and other.table is self.table:
+            return self.bits == other.bits
+        return Set.__eq__(self, other)
+
+    def __hash__(self):
+        # Equal to the frozenset of the same names, so hash the same
+        if self._hash == None:
+            self._hash = hash(frozenset(self))
+        return self._hash
+
+    def __repr__(self):
+        return "NameSet(" + repr(sorted(self)) + ")"
+
+    def __reduce__(self):
+        return (NameSet, (tuple(self),))
@@ -22,25 +22,26 @@ Keeps track of scopes markings inside this node.
 #     along with OAT.  If not, see <http://www.gnu.org/licenses/>.
 
 from . import basic
+from . import store
 
 class ScopeMarker(basic.BasicMarker):
     """Marks and shows markings for node's scope modifiers."""
 
-    def __init__(self, node = None):
-        basic.BasicMarker.__init__(self, "scope", node)
+    def __init__(self, node = None, marks = None):
+        basic.BasicMarker.__init__(self, "scope", node, marks)
 
     def get_default(self):
         """Get the default value for this marking."""
 
-        return {}
+        return store.EMPTY
 
     def duplicate(self):
-        return self.get_mark().copy()
+        return dict(self.get_mark())
 
     def _add_variable(self, variable, type):
         """Add variable scope to our node. Return whether we were successful."""
         
-        marks = self.get_mark()
+        marks = self.duplicate()
         marks[variable] = type
         return self.set_mark(marks)
 
@@ -57,7 +58,7 @@ class ScopeMarker(basic.BasicMarker):
     def remove(self, variable):
         """Remove a variable from the set."""
 
-        marks = self.get_mark()
+        marks = self.duplicate()
         try:
             del marks[variable]
         except KeyError:
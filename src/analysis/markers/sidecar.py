@@ -0,0 +1,323 @@
+"""
+Save and load markings in a small binary file next to the source.
+
+Only the markings are stored, each under the path of its node, along with
+a hash of the source they were made for. To get the markings back the
+source is parsed fresh and the markings attached to the new tree.
+
+The file is a fixed header followed by three sections, all little-endian:
+
+    header    magic, format version, sha224 of the source,
+              number of strings, number of words
+    lengths   one 32 bit length for each string
+    words     32 bit words describing the markings
+    strings   the UTF-8 strings, one after another
+
+The words start with the number of distinct sets of markings, then each
+set as a count of (name, value) pairs. Nodes with the same markings share
+one set. Then for each marked node, in document order, there is the path
+to the node, given as the number of links it shares with the previous
+node's path followed by the new links, and the index of its set of
+markings. Strings are always given by their index.
+
+"""
+
+# OAT - Obfuscation and Analysis Tool
+# Copyright (C) 2011  Andy Gurden
+#
+#     This file is part of OAT.
+#
+#     OAT is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     OAT is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with OAT.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import struct
+import hashlib
+from array import array
+from collections.abc import Mapping
+
+from . import store
+from . import names
+
+MAGIC = b"OATMARK\0"
+VERSION = 1
+
+_HEADER = struct.Struct("<8sH28sII")
+
+# Value tags
+_NONE, _FALSE, _TRUE, _STR, _INT, _SET, _NAMES, _TUPLE, _DICT = range(9)
+
+def source_hash(source : "Source code as a string"):
+    """Get the hash the markings are stored against."""
+
+    return hashlib.sha224(source.encode()).digest()
+
+def dumps(tree : "Root of the marked tree",
+          source : "Source the tree was parsed from",
+          marks : "MarkStore holding the markings" = None,
+          keep : "Function saying which marked nodes to store, or None for all" = None,
+          nodes : "List to add each node stored to, in order" = None):
+    """
+    Get the markings in tree as bytes.
+
+    Raises TypeError if a marking has a value we cannot store.
+
+    >>> import ast
+    >>> from analysis.customast import CustomAST
+    >>> from analysis.markers import read
+    >>> tree = CustomAST(ast.parse("a = b"))
+    >>> read.ReadMarker(tree["body"]["0"]).set_mark({"b"})
+    True
+    >>> data = dumps(tree, "a = b")
+    >>> fresh = CustomAST(ast.parse("a = b"))
+    >>> loads(data, fresh, "a = b")
+    1
+    >>> read.ReadMarker(fresh["body"]["0"]).get_mark()
+    NameSet(['b'])
+
+    """
+
+    marks = store.STORE if marks == None else marks
+    writer = _Writer()
+    entries = array("I")
+    sets = {}
+    previous = ()
+
+    stack = [(tree, ())]
+    while stack:
+        node, path = stack.pop()
+        if marks.has(node) and (keep == None or keep(node)):
+            if nodes != None:
+                nodes.append(node)
+            record = marks.get(node)
+            if record not in sets:
+                sets[record] = len(sets)
+                writer.pairs(record)
+
+            common = 0
+            for a, b in zip(previous, path):
+                if a != b:
+                    break
+                common += 1
+            entries.extend((common, len(path) - common))
+            entries.extend(writer.string_id(link) for link in path[common:])
+            entries.append(sets[record])
+            previous = path
+        stack.extend((node[c], path + (c,)) for c in reversed(list(node.ordered_children())))
+
+    return writer.finish(source_hash(source), len(sets), entries)
+
+def loads(data : "Bytes from dumps",
+          tree : "Root of a tree freshly parsed from source",
+          source : "Source the tree was parsed from",
+          marks : "MarkStore to put the markings in" = None,
+          nodes : "List to add each node marked to, in order" = None):
+    """
+    Attach the markings in data to tree. Returns the number of nodes marked.
+
+    Raises TypeError if data is not a markings file we understand, and
+    ValueError if the markings were made for different source.
+
+    """
+
+    marks = store.STORE if marks == None else marks
+
+    try:
+        magic, version, digest, n_strings, n_words = _HEADER.unpack_from(data)
+    except struct.error:
+        raise TypeError("Not a markings file.")
+    if magic != MAGIC:
+        raise TypeError("Not a markings file.")
+    if version != VERSION:
+        raise TypeError("Unknown markings file version (" + str(version) + ").")
+    if digest != source_hash(source):
+        raise ValueError("The markings are for different source.")
+
+    lengths = array("I")
+    words = array("I")
+    pos = _HEADER.size
+    lengths.frombytes(data[pos:pos + 4*n_strings])
+    pos += 4*n_strings
+    words.frombytes(data[pos:pos + 4*n_words])
+    pos += 4*n_words
+    if sys.byteorder == "big":
+        lengths.byteswap()
+        words.byteswap()
+    if len(lengths) != n_strings or len(words) != n_words or pos + sum(lengths) != len(data):
+        raise TypeError("Markings file is truncated.")
+
+    blob = data[pos:]
+    strings = []
+    pos = 0
+    for n in lengths:
+        strings.append(blob[pos:pos+n].decode())
+        pos += n
+
+    reader = _Reader(words, strings, marks, tree)
+    chain = [tree] # Nodes along the previous path
+    count = 0
+    try:
+        sets = [marks.freeze(reader.pairs()) for i in range(reader.word())]
+        while reader.pos < len(words):
+            common = reader.word()
+            del chain[common+1:]
+            node = chain[-1]
+            for i in range(reader.word()):
+                node = node[strings[reader.word()]]
+                chain.append(node)
+            marks.replace(node, sets[reader.word()])
+            if nodes != None:
+                nodes.append(node)
+            count += 1
+    except (IndexError, KeyError):
+        raise TypeError("Markings file does not match the tree.")
+
+    return count
+
+def marks_file(fname : "Source file the markings are for"):
+    """
+    Get the name of the file the markings for a source file are kept in.
+
+    >>> marks_file("code/mod.py"), marks_file("script")
+    ('code/mod.marks', 'script.marks')
+
+    """
+
+    if fname.endswith(".py"):
+        return fname[0:-3] + ".marks"
+    else:
+        return fname + ".marks"
+
+def save(fname : "File to write", tree, source, marks=None):
+    """Write the markings in tree to a file. Raises IOError or TypeError."""
+
+    data = dumps(tree, source, marks)
+    with open(fname, "wb") as file:
+        file.write(data)
+
+def load(fname : "File to read", tree, source, marks=None):
+    """Read markings from a file onto tree, see loads. Can also raise IOError."""
+
+    with open(fname, "rb") as file:
+        data = file.read()
+    return loads(data, tree, source, marks)
+
+class _Writer:
+    """Builds up the words and strings for a file."""
+
+    def __init__(self):
+        self.words = array("I")
+        self.strings = []
+        self._ids = {}
+
+    def string_id(self, s):
+        try:
+            return self._ids[s]
+        except KeyError:
+            self._ids[s] = len(self.strings)
+            self.strings.append(s)
+            return self._ids[s]
+
+    def string(self, s):
+        self.words.append(self.string_id(s))
+
+    def pairs(self, record):
+        self.words.append(len(record))
+        for mark, value in record.items():
+            self.string(mark)
+            self.value(value)
+
+    def value(self, v):
+        words = self.words
+        if v == None:
+            words.append(_NONE)
+        elif v is False or v is True:
+            words.append(_TRUE if v else _FALSE)
+        elif isinstance(v, str):
+            words.append(_STR)
+            self.string(v)
+        elif isinstance(v, int):
+            words.append(_INT)
+            self.string(str(v))
+        elif isinstance(v, names.NameSet):
+            words.extend((_NAMES, len(v)))
+            for n in v:
+                self.string(n)
+        elif isinstance(v, (set, frozenset, tuple, list)):
+            words.extend((_TUPLE if isinstance(v, (tuple, list)) else _SET, len(v)))
+            for item in v:
+                self.value(item)
+        elif isinstance(v, Mapping):
+            words.extend((_DICT, len(v)))
+            for key, item in v.items():
+                self.value(key)
+                self.value(item)
+        else:
+            raise TypeError("Cannot store marking value of type " + v.__class__.__name__ + ".")
+
+    def finish(self, digest, n_sets, nodes):
+        encoded = [s.encode() for s in self.strings]
+        lengths = array("I", map(len, encoded))
+        words = array("I", [n_sets]) + self.words + nodes
+        if sys.byteorder == "big":
+            lengths.byteswap()
+            words.byteswap()
+        header = _HEADER.pack(MAGIC, VERSION, digest, len(self.strings), len(words))
+        return b"".join([header, lengths.tobytes(), words.tobytes()] + encoded)
+
+class _Reader:
+    """Reads words and values back out of a file."""
+
+    def __init__(self, words, strings, marks, tree):
+        self.words = words
+        self.strings = strings
+        self.marks = marks
+        self.tree = tree
+        self.pos = 0
+
+    def word(self):
+        self.pos += 1
+        return self.words[self.pos - 1]
+
+    def string(self):
+        return self.strings[self.word()]
+
+    def value(self):
+        tag = self.word()
+        if tag == _NONE:
+            return None
+        elif tag == _FALSE or tag == _TRUE:
+            return tag == _TRUE
+        elif tag == _STR:
+            return self.string()
+        elif tag == _INT:
+            return int(self.string())
+        elif tag == _NAMES:
+            return self.marks.name_set([self.string() for i in range(self.word())], self.tree)
+        elif tag == _SET:
+            return frozenset(self.value() for i in range(self.word()))
+        elif tag == _TUPLE:
+            return tuple(self.value() for i in range(self.word()))
+        elif tag == _DICT:
+            return self.pairs(self.value)
+        raise TypeError("Unknown value in markings file.")
+
+    def pairs(self, key=None):
+        """Read a count and then that many (key, value) pairs into a dict."""
+
+        key = self.string if key == None else key
+        result = {}
+        for i in range(self.word()):
+            k = key()
+            result[k] = self.value()
+        return result
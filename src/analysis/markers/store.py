@@ -0,0 +1,415 @@
+"""
+Central store holding the markings for every node.
+
+Markings are kept here rather than on the nodes themselves. Every value is
+made immutable and interned, so identical markings on different nodes are
+shared, and the markings of a node are kept as a single interned record.
+Because nothing in the store is ever changed in place, taking a snapshot
+of all markings only needs to copy the table the next time it is changed.
+
+The store also remembers which markings were calculated and which nodes
+they were calculated from, so that editing a tree only drops the markings
+the edit could have changed.
+
+"""
+
+# OAT - Obfuscation and Analysis Tool
+# Copyright (C) 2011  Andy Gurden
+#
+#     This file is part of OAT.
+#
+#     OAT is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     OAT is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with OAT.  If not, see <http://www.gnu.org/licenses/>.
+
+import weakref
+from collections.abc import Mapping, Set
+
+from . import names
+from .. import customast
+
+class FrozenDict(Mapping):
+    """Immutable, hashable dictionary used for dictionary markings."""
+
+    def __init__(self, *vargs, **kwargs):
+        self._items = dict(*vargs, **kwargs)
+        self._hash = None
+
+    def __getitem__(self, key):
+        return self._items[key]
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    # The rest are only here to avoid the slower generic versions
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        return self._items.get(key, default)
+
+    def keys(self):
+        return self._items.keys()
+
+    def values(self):
+        return self._items.values()
+
+    def items(self):
+        return self._items.items()
+
+    def __eq__(self, other):
+        if isinstance(other, FrozenDict):
+            return self._items == other._items
+        return Mapping.__eq__(self, other)
+
+    def __hash__(self):
+        if self._hash == None:
+            self._hash = hash(frozenset(self._items.items()))
+        return self._hash
+
+    def copy(self):
+        """Get a normal dict with the same contents."""
+
+        return dict(self._items)
+
+    def __repr__(self):
+        return "FrozenDict(" + repr(self._items) + ")"
+
+    def __reduce__(self):
+        return (FrozenDict, (self._items,))
+
+EMPTY = FrozenDict()
+
+def _key(value):
+    """Get the key a value is interned under, keeping apart sets of names from different trees and the records holding them."""
+
+    if isinstance(value, names.NameSet):
+        return (names.NameSet, value.table, value.bits)
+    if isinstance(value, FrozenDict):
+        return (FrozenDict, value, frozenset(v.table for v in value.values() if isinstance(v, names.NameSet)))
+    return (value.__class__, value)
+
+class _NodeRef(weakref.ref):
+    """Weak reference to a marked node, knowing the key of its record."""
+
+    __slots__ = ("key",)
+
+    def __new__(cls, node, callback, key):
+        ref = super().__new__(cls, node, callback)
+        ref.key = key
+        return ref
+
+    def __init__(self, node, callback, key):
+        super().__init__(node, callback)
+
+class MarkStore:
+    """
+    Holds the markings of nodes, keyed by node identity.
+
+    Entries are dropped automatically when their node is garbage collected.
+
+    >>> from analysis.customast import CustomAST
+    >>> store = MarkStore()
+    >>> a, b = CustomAST([]), CustomAST([])
+    >>> store.set(a, "reads", {"x"})
+    >>> store.set(b, "reads", {"x"})
+    >>> store.get(a)["reads"] is store.get(b)["reads"]
+    True
+    >>> before = store.snapshot()
+    >>> store.set(a, "reads", set())
+    >>> before.get(a)["reads"], store.get(a)["reads"]
+    (frozenset({'x'}), frozenset())
+
+    """
+
+    def __init__(self, symbols : "SymbolTable for sets of names" = None):
+        self._records = {}
+        self._derived = {}
+        self._shared = False
+        self._interned = {}
+        self._released = 0 # Records let go of since _interned was last pruned
+        store = weakref.ref(self)
+        self._gone = lambda r: store() and store()._drop(r.key, r)
+        self.symbols = names.SymbolTable() if symbols == None else symbols
+
+    def get(self, node : "Node to get markings for"):
+        """Get the record of markings for a node, empty if it has none."""
+
+        try:
+            ref, record = self._records[id(node)]
+        except KeyError:
+            return EMPTY
+        return record if ref() is node else EMPTY
+
+    def has(self, node):
+        """Check if a node has any markings at all."""
+
+        return id(node) in self._records and self._records[id(node)][0]() is node
+
+    def set(self, node : "Node to mark", mark : "Name of the marking", value : "New value"):
+        """Set a single marking on a node."""
+
+        items = dict(self.get(node))
+        items[mark] = self.freeze(value)
+        self._put(node, self._intern(FrozenDict(items)))
+        self._underive(node, (mark,))
+
+    def update(self, node, markings : "Dictionary of marking names to values"):
+        """Set several markings on a node."""
+
+        items = dict(self.get(node))
+        items.update((m, self.freeze(v)) for m, v in markings.items())
+        self._put(node, self._intern(FrozenDict(items)))
+        self._underive(node, markings)
+
+    def replace(self, node, markings : "Dictionary of every marking for the node"):
+        """Set all the markings of a node at once, dropping any others."""
+
+        if not isinstance(markings, FrozenDict) or self._interned.get(_key(markings)) is not markings:
+            markings = self.freeze(markings)
+        self._put(node, markings)
+        self._underive(node, markings)
+
+    def forget(self, node):
+        """Remove all markings from a node."""
+
+        if self.has(node):
+            self._unshare()
+            del self._records[id(node)]
+            self._derived.pop(id(node), None)
+            self._released += 1
+
+    def derive(self,
+               node : "Node that was marked",
+               marks : "Names of the markings that were calculated",
+               sources : "Nodes whose markings or structure they were calculated from"):
+        """
+        Record that some markings of a node were calculated from other nodes.
+
+        Setting any of these markings again by hand stops them being treated
+        as calculated.
+
+        """
+
+        self._unshare()
+        entry = self._derived.get(id(node))
+        if entry == None:
+            self._derived[id(node)] = (frozenset(marks), frozenset(id(s) for s in sources))
+        else:
+            self._derived[id(node)] = (entry[0].union(marks), entry[1].union(id(s) for s in sources))
+
+    def drop(self, node, marks : "Names of the markings"):
+        """Remove some markings from a node, only if they were calculated."""
+
+        self._underive(node, marks, forget=True)
+
+    def is_derived(self, node, mark : "Name of the marking"):
+        """Check if a marking on a node was calculated rather than given."""
+
+        return self.has(node) and mark in self._derived.get(id(node), ((),))[0]
+
+    def invalidate(self, node : "Node whose subtree was edited"):
+        """
+        Drop the calculated markings that an edit to node could have changed.
+
+        These are the calculated markings of node itself and of any ancestor
+        calculated from node or from another dropped ancestor. Only the path
+        up to the root is looked at. Returns the number of nodes changed.
+
+        >>> import ast
+        >>> from analysis.customast import CustomAST
+        >>> store = MarkStore()
+        >>> tree = CustomAST(ast.parse("def f(x):\\n    a = b"))
+        >>> func, body = tree["body"]["0"], tree["body"]["0"]["body"]
+        >>> for n, srcs in ((body, [body["0"]]), (func, [func["args"]]), (tree, [tree["body"]])):
+        ...     store.set(n, "reads", {"b"})
+        ...     store.derive(n, {"reads"}, srcs)
+        >>> store.invalidate(body)
+        1
+        >>> store.has(body), store.has(func), store.has(tree)
+        (False, True, True)
+
+        """
+
+        if not self._derived:
+            return 0
+
+        changed = {id(node)}
+        count = 0
+        while node != None:
+            entry = self._derived.get(id(node))
+            if entry != None and self.has(node) and (id(node) in changed or not changed.isdisjoint(entry[1])):
+                self._underive(node, entry[0], forget=True)
+                changed.add(id(node))
+                count += 1
+            node = node.parent
+        return count
+
+    def _underive(self, node, marks, forget=False):
+        """Stop treating some markings as calculated, dropping them if forget is set."""
+
+        entry = self._derived.get(id(node))
+        if entry == None or entry[0].isdisjoint(marks):
+            return
+
+        self._unshare()
+        gone = entry[0].intersection(marks)
+        remaining = entry[0].difference(gone)
+        if remaining:
+            self._derived[id(node)] = (remaining, entry[1])
+        else:
+            del self._derived[id(node)]
+
+        if forget:
+            items = {m: v for m, v in self.get(node).items() if m not in gone}
+            if items:
+                self._put(node, self._intern(FrozenDict(items)))
+            else:
+                del self._records[id(node)]
+                self._released += 1
+
+    def freeze(self, value):
+        """Get an interned, immutable version of a marking value."""
+
+        if isinstance(value, (set, frozenset)): # NameSets are kept in their own table
+            value = frozenset(self.freeze(v) for v in value)
+        elif isinstance(value, (dict, FrozenDict)):
+            value = FrozenDict((self.freeze(k), self.freeze(v)) for k, v in value.items())
+        elif isinstance(value, (list, tuple)):
+            value = tuple(self.freeze(v) for v in value)
+        return self._intern(value)
+
+    def name_set(self,
+                 values : "Iterable of names",
+                 node : "Node the names are for, if any" = None):
+        """Get values as a NameSet numbered by the table of node's tree, or by ours without a node."""
+
+        table = self.symbols if node == None else names.table(node)
+        if isinstance(values, names.NameSet) and values.table is table:
+            return values
+        return names.NameSet(values, table)
+
+    def _intern(self, value):
+        key = _key(value)
+        try:
+            return self._interned[key]
+        except KeyError:
+            if self._released > len(self._records):
+                self._prune()
+            self._interned[key] = value
+            return value
+
+    def _prune(self):
+        """
+        Forget interned values that no record uses any more.
+
+        This is done once as many records have been let go of as are left,
+        so it costs little more than letting go of them did.
+
+        >>> from analysis.customast import CustomAST
+        >>> store = MarkStore()
+        >>> nodes = [CustomAST([]) for i in range(100)]
+        >>> for i, n in enumerate(nodes):
+        ...     store.set(n, "reads", {str(i)})
+        >>> del nodes, n
+        >>> store.set(CustomAST([]), "reads", {"x"})
+        >>> len(store._interned) < 10
+        True
+
+        """
+
+        live = {}
+        pending = [record for ref, record in list(self._records.values())]
+        while pending:
+            value = pending.pop()
+            key = _key(value)
+            if key in live:
+                continue
+            live[key] = self._interned.get(key, value)
+            if isinstance(value, FrozenDict):
+                pending.extend(value.keys())
+                pending.extend(value.values())
+            elif isinstance(value, (frozenset, tuple)):
+                pending.extend(value)
+        self._interned = live
+        self._released = 0
+
+    def _put(self, node, record):
+        self._unshare()
+        key = id(node)
+        entry = self._records.get(key)
+        if entry == None or entry[0]() is not node:
+            entry = (_NodeRef(node, self._gone, key), record)
+            node._marked()
+        elif entry[1] is not record:
+            self._released += 1
+        self._records[key] = (entry[0], record)
+
+    def _drop(self, key, ref):
+        """Forget a node that no longer exists."""
+
+        entry = self._records.get(key)
+        if entry != None and entry[0] is ref:
+            self._unshare()
+            del self._records[key]
+            self._derived.pop(key, None)
+            self._released += 1
+
+    def _unshare(self):
+        """Make sure we are not changing a table a snapshot is using."""
+
+        if self._shared:
+            self._records = dict(self._records)
+            self._derived = dict(self._derived)
+            self._shared = False
+
+    def snapshot(self):
+        """Get a read-only copy of every marking as it is now."""
+
+        self._shared = True
+        return MarkSnapshot(self._records, self._derived)
+
+    def restore(self, snapshot : "Snapshot from this store"):
+        """Put every marking back the way it was when the snapshot was taken."""
+
+        self._records = snapshot._records
+        self._derived = snapshot._derived
+        self._shared = True
+
+    def __len__(self):
+        return len(self._records)
+
+class MarkSnapshot:
+    """Read-only view of the markings in a store at some point."""
+
+    def __init__(self, records, derived):
+        self._records = records
+        self._derived = derived
+
+    def get(self, node):
+        """Get the record of markings for a node, empty if it had none."""
+
+        try:
+            ref, record = self._records[id(node)]
+        except KeyError:
+            return EMPTY
+        return record if ref() is node else EMPTY
+
+# The store used by markers unless they are given another
+STORE = MarkStore(names.SYMBOLS)
+
+# Drop calculated markings whenever a tree is edited
+customast.EDIT_LISTENERS.append(STORE.invalidate)
@@ -26,8 +26,8 @@ from . import basic
 class VisibleMarker(basic.BasicMarker):
     """Marks and shows markings for node visibility."""
 
-    def __init__(self, node = None):
-        basic.BasicMarker.__init__(self, "visible", node)
+    def __init__(self, node = None, marks = None):
+        basic.BasicMarker.__init__(self, "visible", node, marks)
 
     def get_default(self):
         """Get the default value for this marking."""
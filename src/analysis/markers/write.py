@@ -26,31 +26,26 @@ from . import basic
 class WriteMarker(basic.BasicMarker):
     """Marks and shows markings for node writes."""
 
-    def __init__(self, node = None):
-        basic.BasicMarker.__init__(self, "writes", node)
+    def __init__(self, node = None, marks = None):
+        basic.BasicMarker.__init__(self, "writes", node, marks)
 
     def get_default(self):
         """Get the default value for this marking."""
 
-        return set()
+        return self.marks.name_set((), self.node)
+
+    def set_mark(self, val):
+        return basic.BasicMarker.set_mark(self, self.marks.name_set(val, self.node))
 
     def duplicate(self):
-        return self.get_mark().copy()
+        return set(self.get_mark())
 
     def addVariable(self, variable):
         """Add written variable to our node. Return whether we were successful."""
         
-        marks = self.get_mark()
-        marks.add(variable)
-        return self.set_mark(marks)
+        return self.set_mark(self.get_mark() | {variable})
 
     def remove(self, variable):
         """Remove a variable from the set."""
 
-        marks = self.get_mark()
-        try:
-            marks.remove(variable)
-        except KeyError:
-            pass
-
-        return self.set_mark(marks)
+        return self.set_mark(self.get_mark() - {variable})
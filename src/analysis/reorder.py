@@ -23,10 +23,7 @@ Contains code ready for reordering statements.
 
 import random
 
-from .markers import visible
-from .markers import breaks
-from .markers import read
-from .markers import write
+from . import markers
 
 from .customast import CustomAST
 from . import valuers
@@ -40,10 +37,14 @@ class BasicReorderer:
     def __init__(self,
                  statements : "CustomAST list node of statements",
                  rng : "Permutation representing the original statement list" = None,
-                 limit : "Limit to number of output permutations." = None):
+                 limit : "Limit to number of output permutations." = None,
+                 marks : "BlockMarks for the statements, read when first needed if None" = None,
+                 provider : "Function giving the BlockMarks for a list of statements" = None):
         """Initialise reorderer or raise TypeError."""
 
         self.statements = statements
+        self.marks = marks
+        self.provider = markers.block_marks if provider == None else provider
         self.stat_order = list(statements.ordered_children())
         self.range = rng
         if self.range == None:
@@ -55,6 +56,13 @@ class BasicReorderer:
 
         return self.statements[self.stat_order[i]]
 
+    def block_marks(self):
+        """Get the markings of our statements, reading them if we have not yet."""
+
+        if self.marks == None:
+            self.marks = self.provider(self.statements)
+        return self.marks
+
     def permute(self, perm):
         """Permute the statements with the given permutation. Does not affect the original statement list."""
 
@@ -111,12 +119,10 @@ class BasicReorderer:
 
         """
 
-        stat = self.statement_at(s)
+        marks = self.block_marks()
         # Right now we only pay attention to locally read and written variables
         # So unique ids are just the names used
-        r = read.ReadMarker(stat).get_mark()
-        w = write.WriteMarker(stat).get_mark()
-        return (s, r, w)
+        return (s, marks.reads[s], marks.writes[s])
 
     def _statement_dependence(self,
                               t : "As returned by _statement_tuple",
@@ -134,18 +140,22 @@ class BasicReorderer:
         t_stat, t_reads, t_writes = t
         reads = dict.fromkeys(t_reads)
         # reads will end up with non-None values as closest write to our statement
-        for (b_stat, b_reads, b_writes) in before:
+        # so work back from the closest, only looking for reads not yet found
+        waiting = t_reads
+        for (b_stat, b_reads, b_writes) in reversed(before):
+            if not waiting:
+                break
             # Look for common reads for us and writes for the other
-            common = t_reads.intersection(b_writes)
-            # dict with common read/write as keys and this statement as a value
-            common_d = dict.fromkeys(common, b_stat)
-            reads.update(common_d)
+            common = waiting & b_writes
+            if common:
+                reads.update(dict.fromkeys(common, b_stat))
+                waiting = waiting - common
 
         writes = dict.fromkeys(t_writes, True)
         for (a_stat, a_reads, a_writes) in after:
-            common = t_writes.intersection(a_writes)
-            common_d = dict.fromkeys(common, False)
-            writes.update(common_d)
+            common = t_writes & a_writes
+            if common:
+                writes.update(dict.fromkeys(common, False))
 
         return (t_stat, reads, writes)
 
@@ -173,20 +183,16 @@ class ReorderChecker:
 
 
     def check_markings(self):
-        """Check if all statements have the correct markings."""
+        """
+        Check if all statements have the correct markings.
 
-        for s in self.statements:
-            stat = self.statements[s]
-            if not breaks.BreakMarker(stat).is_marked():
-                return False
-            if not visible.VisibleMarker(stat).is_marked():
-                return False
-            if not read.ReadMarker(stat).is_marked():
-                return False
-            if not write.WriteMarker(stat).is_marked():
-                return False
+        The markings are got again from our provider, and kept for working
+        out permutations.
 
-        return True
+        """
+
+        self.marks = self.provider(self.statements)
+        return self.marks.all_marked()
     
 
 class SingleReorderer(BasicReorderer, ReorderChecker):
@@ -199,10 +205,12 @@ class SingleReorderer(BasicReorderer, ReorderChecker):
                  statements : "CustomAST list node of statements",
                  rng : "Permutation representing the original statement list" = None,
                  precond : "Perform precondition checks for input values" = True,
-                 limit : "Limit to number of output permutations." = None):
+                 limit : "Limit to number of output permutations." = None,
+                 marks : "BlockMarks for the statements, read when first needed if None" = None,
+                 provider : "Function giving the BlockMarks for a list of statements" = None):
         """Initialise reorderer or raise TypeError."""
 
-        BasicReorderer.__init__(self, statements, rng=rng, limit=limit)
+        BasicReorderer.__init__(self, statements, rng=rng, limit=limit, marks=marks, provider=provider)
         ReorderChecker.__init__(self, precond=precond)
 
     def permutations(self, convtuple=True):
@@ -227,10 +235,11 @@ class SingleReorderer(BasicReorderer, ReorderChecker):
 
         """
 
+        visible = self.block_marks().visible
         vis = []
         rem = []
         for d in dependencies:
-            if visible.VisibleMarker(self.statement_at(d[0])).isVisible():
+            if visible[d[0]]:
                 vis.append(d)
             else:
                 rem.append(d)
@@ -468,10 +477,11 @@ class Reorderer(BasicReorderer, ReorderChecker):
                  rng : "Permutation representing the original statement list" = None,
                  precond : "Perform precondition checks for input values" = True,
                  safe : "Perform sanity checks for things that won't need them if this is coded correctly" = False,
-                 limit : "Limit to number of output permutations." = None):
+                 limit : "Limit to number of output permutations." = None,
+                 provider : "Function giving the BlockMarks for a list of statements" = None):
         """Initialise reorderer or raise TypeError."""
 
-        BasicReorderer.__init__(self, statements, rng=rng, limit=limit)
+        BasicReorderer.__init__(self, statements, rng=rng, limit=limit, provider=provider)
         ReorderChecker.__init__(self, precond=precond)
 
         self.PartReorderer = SafeReorderer if safe else SingleReorderer
@@ -494,7 +504,7 @@ class Reorderer(BasicReorderer, ReorderChecker):
         else:
             head, *tail = partitions
 
-            reord = self.PartReorderer(self.statements, rng=head, precond=False)
+            reord = self.PartReorderer(self.statements, rng=head, precond=False, marks=self.block_marks())
 
             # Record calculated head perms during first iteration
             # These can be used in next iteration
@@ -522,11 +532,12 @@ class Reorderer(BasicReorderer, ReorderChecker):
 
         """
 
+        can_break = self.block_marks().can_break
         begin_partition = 0
         partitions = []
 
         for i in range(len(self.range)):
-            if breaks.BreakMarker(self.statement_at(self.range[i])).canBreak():
+            if can_break[self.range[i]]:
                 before = self.range[begin_partition : i]
                 if before:
                     partitions.append(before)
@@ -547,10 +558,12 @@ class SafeReorderer(SingleReorderer):
                  statements : "CustomAST list node of statements",
                  rng : "Permutation representing the original statement list" = None,
                  precond : "Perform precondition checks for input values" = True,
-                 limit : "Limit to number of output permutations." = None):
+                 limit : "Limit to number of output permutations." = None,
+                 marks : "BlockMarks for the statements, read when first needed if None" = None,
+                 provider : "Function giving the BlockMarks for a list of statements" = None):
         """Initialise reorderer or raise TypeError."""
 
-        SingleReorderer.__init__(self, statements, rng=rng, precond=precond, limit=limit)
+        SingleReorderer.__init__(self, statements, rng=rng, precond=precond, limit=limit, marks=marks, provider=provider)
 
     def permutations(self):
         """As in permutations, but with safety checks."""
@@ -0,0 +1,268 @@
+"""
+Work out the scope and indirect access markings of a whole tree at once.
+
+Every function, lambda and class is marked with the names it declares
+global or nonlocal (the scope marking), and with every name read or
+written by its body, or anything nested in it, that is not local to it
+(the indirectrw marking). These are labelled global, nonlocal or free as
+seen from the scope that uses them.
+
+The tree is walked once to find what each scope binds, declares and uses,
+and each use is then followed up only as far as the scope it belongs to.
+Editing the tree drops the markings of every scope that could be affected.
+
+"""
+
+# OAT - Obfuscation and Analysis Tool
+# Copyright (C) 2011  Andy Gurden
+#
+#     This file is part of OAT.
+#
+#     OAT is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     OAT is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with OAT.  If not, see <http://www.gnu.org/licenses/>.
+
+import weakref
+
+from . import customast
+from .markers import store
+
+# Node types with their own namespace
+SCOPES = {"Module", "FunctionDef", "ClassDef", "Lambda", "GeneratorExp", "ListComp", "SetComp", "DictComp"}
+
+# Scopes that are given markings
+MARKED = {"FunctionDef", "ClassDef", "Lambda"}
+
+MARKINGS = ("scope", "indirectrw")
+
+_TREES = weakref.WeakSet() # Roots of trees we have marked
+
+def mark_scopes(tree : "Any node of the tree to mark",
+                marks : "MarkStore to put the markings in" = None):
+    """
+    Mark every function, lambda and class below tree. Returns the number marked.
+
+    >>> import ast
+    >>> from analysis.customast import CustomAST
+    >>> tree = CustomAST(ast.parse(
+    ...     "def f(x):\\n"
+    ...     "    global g\\n"
+    ...     "    y = x\\n"
+    ...     "    def h():\\n"
+    ...     "        nonlocal y\\n"
+    ...     "        y = z + g\\n"))
+    >>> mark_scopes(tree)
+    2
+    >>> f = tree["body"]["0"]
+    >>> h = f["body"]["2"]
+    >>> marks = store.STORE.get(f)
+    >>> dict(marks["scope"]), sorted(marks["indirectrw"].items())
+    ({'g': 'global'}, [(('g', 'global'), (True, False)), (('z', 'global'), (True, False))])
+    >>> marks = store.STORE.get(h)
+    >>> dict(marks["scope"]), sorted(marks["indirectrw"].items())
+    ({'y': 'nonlocal'}, [(('g', 'global'), (True, False)), (('y', 'nonlocal'), (False, True)), (('z', 'global'), (True, False))])
+
+    """
+
+    marks = store.STORE if marks == None else marks
+    tree = tree.root()
+    scopes = find_scopes(tree)
+
+    accesses = {id(s): {} for s in scopes}
+    for scope in scopes:
+        for name, (read, write) in scope.uses.items():
+            kind, owner = resolve(scope, name)
+            if kind == None:
+                continue # Local
+            # Indirect for every scope from here out to the one it belongs to
+            current = scope
+            while current is not owner and current.parent != None:
+                found = accesses[id(current)]
+                r, w = found.get((name, kind), (False, False))
+                found[(name, kind)] = (r or read, w or write)
+                current = current.parent
+
+    count = 0
+    for scope in scopes:
+        if scope.node.type() in MARKED:
+            marks.update(scope.node, {"scope": scope.declared, "indirectrw": accesses[id(scope)]})
+            marks.derive(scope.node, MARKINGS, [])
+            count += 1
+
+    _TREES.add(tree)
+    return count
+
+class Scope:
+    """What a single scope binds, declares and uses."""
+
+    def __init__(self, node, parent):
+        self.node = node
+        self.parent = parent
+        self.declared = {} # Name -> "global" or "nonlocal"
+        self.bound = {} # Name -> number of times it is bound
+        self.uses = {} # Name -> (read, write)
+        self.calls = [] # Call nodes made by name
+        self.yields = False
+        self.star = False # Has from ... import *
+
+    def use(self, name, read=False, write=False):
+        r, w = self.uses.get(name, (False, False))
+        self.uses[name] = (r or read, w or write)
+
+    def bind(self, name):
+        self.bound[name] = self.bound.get(name, 0) + 1
+        self.use(name, write=True)
+
+def find_scopes(tree):
+    """Walk the tree once, giving every scope found in document order."""
+
+    outer = Scope(tree, None) # Whatever the root is, treat it as the module
+    scopes = [outer]
+
+    stack = [(tree, outer)]
+    while stack:
+        node, scope = stack.pop()
+        kind = node.type()
+        children = [(node[c], scope) for c in node.ordered_children()]
+
+        if node is not tree and kind in SCOPES:
+            inner = Scope(node, scope)
+            scopes.append(inner)
+            children = _split_scope(node, scope, inner)
+        elif kind == "Name":
+            if node["ctx"].type() in ("Store", "Del"):
+                scope.bind(node["id"].node())
+            else:
+                scope.use(node["id"].node(), read=True)
+        elif kind == "AugAssign" and node["target"].type() == "Name":
+            scope.use(node["target"]["id"].node(), read=True)
+        elif kind == "Call" and node["func"].type() == "Name":
+            scope.calls.append(node)
+        elif kind in ("Yield", "YieldFrom"):
+            scope.yields = True
+        elif kind in ("Global", "Nonlocal"):
+            for n in node["names"]:
+                scope.declared[node["names"][n].node()] = kind.lower()
+        elif kind == "alias":
+            name = node["name"].node()
+            if not node["asname"].is_empty():
+                scope.bind(node["asname"].node())
+            elif name != "*":
+                scope.bind(name.split(".", 1)[0])
+            else:
+                scope.star = True
+        elif kind == "ExceptHandler" and node["name"].is_basic():
+            scope.bind(node["name"].node())
+
+        stack.extend(reversed(children))
+
+    return scopes
+
+def _split_scope(node, outer, inner):
+    """Get the children of a new scope, each with the scope it runs in."""
+
+    kind = node.type()
+    children = []
+
+    if kind in ("FunctionDef", "ClassDef"):
+        outer.bind(node["name"].node())
+
+    if kind in ("FunctionDef", "Lambda"):
+        args = node["args"]
+        for field in args.ordered_children():
+            value = args[field]
+            if field in ("defaults", "kw_defaults") or field.endswith("annotation"):
+                children.append((value, outer))
+            elif value.is_basic(): # Older trees give *args and **kwargs as names
+                inner.bind(value.node())
+            elif value.is_ast():
+                _bind_arg(value, outer, inner, children)
+            elif value.is_list():
+                for a in value:
+                    _bind_arg(value[a], outer, inner, children)
+        for field in ("decorator_list", "returns"):
+            if field in node:
+                children.append((node[field], outer))
+        children.append((node["body"], inner))
+
+    elif kind == "ClassDef":
+        for field in node.ordered_children():
+            if field != "name":
+                children.append((node[field], inner if field == "body" else outer))
+
+    else: # Comprehensions, where only the first iterator is worked out outside
+        for field in node.ordered_children():
+            if field != "generators":
+                children.append((node[field], inner))
+        gens = node["generators"]
+        for i, g in enumerate(gens.ordered_children()):
+            for field in gens[g].ordered_children():
+                first = (i == 0 and field == "iter")
+                children.append((gens[g][field], outer if first else inner))
+
+    return children
+
+def _bind_arg(arg, outer, inner, children):
+    inner.bind(arg["arg"].node())
+    if "annotation" in arg:
+        children.append((arg["annotation"], outer))
+
+def resolve(scope, name):
+    """
+    Find how a scope uses a name.
+
+    Gives (kind, owner) where kind is None for local names and otherwise
+    "global", "nonlocal" or "free", and owner is the scope the name belongs
+    to, or None for globals.
+
+    """
+
+    declared = scope.declared.get(name)
+    if declared == "global":
+        return ("global", None)
+    if declared == None and name in scope.bound:
+        return (None, scope)
+
+    # Find the enclosing function it belongs to, class bodies are not seen
+    current = scope.parent
+    while current != None and current.parent != None:
+        if current.node.type() != "ClassDef":
+            found = current.declared.get(name)
+            if found == "global":
+                return ("global", None)
+            if found == None and name in current.bound:
+                return ("free" if declared == None else declared, current)
+        current = current.parent
+    return ("global" if declared == None else declared, None)
+
+def _edited(node):
+    """Drop the markings of every scope an edit below node could change."""
+
+    if not _TREES or node.root() not in _TREES:
+        return
+
+    # Anything nested in the outermost scope around node could see the edit
+    top = None
+    current = node
+    while current != None:
+        if current.type() in MARKED:
+            top = current
+        current = current.parent
+    if top == None:
+        return
+
+    marks = store.STORE
+    for kind in MARKED:
+        for n in top.nodes_of_type(kind):
+            marks.drop(n, MARKINGS)
+
+customast.EDIT_LISTENERS.append(_edited)
@@ -24,8 +24,7 @@ Contains valuers for the reorderer.
 import random
 import math
 
-from .markers import read
-from .markers import write
+from . import markers
 
 def InvertValuer(valuer):
     """Return an inverted version of another valuer."""
@@ -49,10 +48,9 @@ def WriteRangeValuer(statements):
     """Gives the sum of spread of written variables."""
 
     variables = {}
+    marks = markers.block_marks(statements)
     # Collect ranges for all variables
-    for i, s in enumerate(statements):
-        stat = statements[s]
-        written = write.WriteMarker(stat).get_mark()
+    for i, written in enumerate(marks.writes):
         for w in written:
             try:
                 (start, end) = variables[w]
@@ -69,11 +67,9 @@ def WriteUseValuer(statements):
 
     total = 0
     variables = {} # Where written
+    marks = markers.block_marks(statements)
     # Collect ranges for all variables
-    for i, s in enumerate(statements):
-        stat = statements[s]
-        reads = read.ReadMarker(stat).get_mark()
-        written = write.WriteMarker(stat).get_mark()
+    for i, (reads, written) in enumerate(zip(marks.reads, marks.writes)):
         for var in reads:
             try:
                 (w, r) = variables[var]
@@ -100,11 +96,9 @@ def WriteUseLogValuer(statements):
 
     total = 0
     variables = {} # Where written
+    marks = markers.block_marks(statements)
     # Collect ranges for all variables
-    for i, s in enumerate(statements):
-        stat = statements[s]
-        reads = read.ReadMarker(stat).get_mark()
-        written = write.WriteMarker(stat).get_mark()
+    for i, (reads, written) in enumerate(zip(marks.reads, marks.writes)):
         for var in reads:
             try:
                 (w, r) = variables[var]
@@ -156,11 +150,9 @@ def _generate_providing_statements(statements):
 
     variables = {} # Where written
     providers = []
-    for i, s in enumerate(statements):
-        stat = statements[s]
+    marks = markers.block_marks(statements)
+    for i, (reads, written) in enumerate(zip(marks.reads, marks.writes)):
         provided = set()
-        reads = read.ReadMarker(stat).get_mark()
-        written = write.WriteMarker(stat).get_mark()
         for var in reads:
             provided.add(variables.get(var, None))
         for var in written:
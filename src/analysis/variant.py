@@ -0,0 +1,210 @@
+"""
+Versions of a tree with some nodes replaced, sharing everything else.
+
+A variant never changes the tree it is made from. It only records the
+nodes that have been replaced, by their path, and shows the tree through
+views of single nodes made when they are asked for, as flat trees do.
+Every view knows the parent and path it has in the variant, even where
+the node underneath is shared with the original, so making many variants
+of a large module costs about the size of the edits.
+
+"""
+
+# OAT - Obfuscation and Analysis Tool
+# Copyright (C) 2011  Andy Gurden
+#
+#     This file is part of OAT.
+#
+#     OAT is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     OAT is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with OAT.  If not, see <http://www.gnu.org/licenses/>.
+
+import ast
+import copy
+import hashlib
+import weakref
+
+from .customast import CustomAST
+from .flatast import ReadOnlyTree
+
+class Variant:
+    """
+    A version of a tree with some of its nodes replaced.
+
+    >>> tree = CustomAST(ast.parse("a = b\\nc = d"))
+    >>> variant = Variant(tree).replaced(("body", "0", "value"), ast.Name("x", ast.Load()))
+    >>> value = variant.root["body"]["0"]["value"]
+    >>> value["id"].node(), tree["body"]["0"]["value"]["id"].node()
+    ('x', 'b')
+    >>> value.path(), value.root() is variant.root
+    (('body', '0', 'value'), True)
+    >>> shared = variant.root["body"]["1"]
+    >>> shared.node() is tree["body"]["1"].node(), shared.parent is variant.root["body"]
+    (True, True)
+    >>> tree["body"]["1"].parent is tree["body"]
+    True
+
+    """
+
+    def __init__(self,
+                 tree : "Root of the tree this is a version of",
+                 edits : "Dictionary of paths to the CustomASTs replacing the nodes there" = None):
+        self.tree = tree
+        self._edits = {} if edits == None else edits
+        self._under = set() # Paths with an edit at or below them
+        for path in self._edits:
+            for i in range(len(path) + 1):
+                self._under.add(path[:i])
+        self._views = weakref.WeakValueDictionary() # Path -> view, while in use
+        self._marked = {} # Path -> view with markings, kept so they are not lost
+        self.root = VariantNode(self, (), tree, None, None)
+
+    def replaced(self,
+                 path : "Sequence of fields leading to the node to replace",
+                 node : "Replacement node, CustomAST or normal AST"):
+        """
+        Get a new variant with the node at path replaced as well.
+
+        Neither variant is changed. Raises KeyError if the path does not
+        exist. A CustomAST given as the replacement is shared, not moved, so
+        it can be part of another tree.
+
+        >>> tree = CustomAST(ast.parse("a = b\\nc = d"))
+        >>> body = tree["body"]
+        >>> swapped = Variant(tree).replaced(("body",), CustomAST([body["1"], body["0"]]))
+        >>> [s["targets"]["0"]["id"].node() for s in swapped.root["body"].children.values()]
+        ['c', 'a']
+        >>> swapped.root["body"]["0"].path(), body["1"].path()
+        (('body', '0'), ('body', '1'))
+        >>> again = swapped.replaced(("body", "1", "value", "id"), "e")
+        >>> again.root["body"]["1"].node().value.id, swapped.root["body"]["1"].node().value.id
+        ('e', 'b')
+
+        """
+
+        path = tuple(path)
+        self.root.at_path(path)
+        if not isinstance(node, CustomAST):
+            node = CustomAST(node)
+        # Anything replaced below path is replaced again along with it
+        edits = {p: n for p, n in self._edits.items() if p[:len(path)] != path}
+        edits[path] = node
+        return Variant(self.tree, edits)
+
+class VariantNode(CustomAST):
+    """
+    Read-only CustomAST view onto a single node of a variant.
+
+    Anything that only reads a CustomAST (markers, writers, the explore
+    and visualise views) can work over these.
+
+    """
+
+    def __init__(self, variant, path, source : "CustomAST node we show", parent, link):
+        self._variant = variant
+        self._path = path
+        self._source = source
+        self.kind = source.kind
+        self.parent = parent
+        self.link = link
+
+    @property
+    def _node(self):
+        return self.node()
+
+    def _adopt(self, parent, link):
+        pass # Our place in the variant is fixed
+
+    def _marked(self):
+        self._variant._marked[self._path] = self
+
+    @property
+    def children(self):
+        # Made each time, as keeping them would keep every view below us
+        return {key: self[key] for key in self.ordered_children()}
+
+    def type(self, asclass=False):
+        return self._source.type(asclass)
+
+    def node(self):
+        if self._path not in self._variant._under:
+            return self._source.node()
+        try:
+            return self._built
+        except AttributeError:
+            pass
+
+        # Copy only what leads to an edit, sharing the rest
+        built = copy.copy(self._source.node())
+        for key in self.ordered_children():
+            if self.is_list():
+                built[int(key)] = self[key].node()
+            else:
+                setattr(built, key, self[key].node())
+        self._built = built
+        return built
+
+    def is_empty(self):
+        return self._source.is_empty()
+
+    def ordered_children(self):
+        return self._source.ordered_children()
+
+    def has_children(self):
+        return self._source.has_children()
+
+    def location(self):
+        return self._source.location()
+
+    def structural_hash(self):
+        if self._path not in self._variant._under:
+            return self._source.structural_hash()
+        try:
+            return self._shash
+        except AttributeError:
+            pass
+
+        # The same as CustomAST, only recursing down the paths to edits
+        h = hashlib.sha1(self.type().encode())
+        if self.is_basic():
+            h.update(repr(self.node()).encode())
+        for c in self.ordered_children():
+            h.update(b"\0" + c.encode() + b"=" + self[c].structural_hash().encode())
+        self._shash = h.hexdigest()
+        return self._shash
+
+    def nodes_of_type(self, typename):
+        # An index would need a view of every node, so look through them instead
+        return [n for n in self.walk() if n.type() == typename]
+
+    def become(self, node):
+        raise ReadOnlyTree("Variants are changed with Variant.replaced().")
+
+    def __getitem__(self, key):
+        if not isinstance(key, str):
+            raise TypeError("Keys for nodes must be strings.")
+        variant = self._variant
+        path = self._path + (key,)
+        view = variant._views.get(path)
+        if view != None:
+            return view
+        source = variant._edits.get(path)
+        if source == None:
+            source = self._source[key]
+        view = variant._views[path] = VariantNode(variant, path, source, self, key)
+        return view
+
+    def __contains__(self, item):
+        return item in self._source
+
+    def __len__(self):
+        return len(self._source)
@@ -24,6 +24,8 @@ Display a tree view of the current abstract syntax tree.
 import tkinter
 from tkinter import ttk
 
+from analysis.customast import Visitor
+
 class ScrolledASTTreeview(ttk.Frame):
     """Scrolling version on ASTTreeview."""
 
@@ -63,10 +65,12 @@ class ASTTreeview(ttk.Treeview):
         self.tag_configure("current", background="#b2ff00")
 
         # Content
+        self._fulltree = fulltree
         self._fill_tree(fulltree)
-        self.selection_set(id(currenttree))
-        self.see(id(currenttree))
-        self.item(id(currenttree), tags=["current"], open=True)
+        current = self._iid(currenttree.path(relative_to=fulltree))
+        self.selection_set(current)
+        self.see(current)
+        self.item(current, tags=["current"], open=True)
 
         # Selection
         self.selection_handler = select_handler
@@ -83,40 +87,50 @@ class ASTTreeview(ttk.Treeview):
         except ValueError:
             return
 
+        # Item ids are paths from the top of the tree
         try:
-            node = self._node_lookup[nid]
+            node = self._fulltree.at_path(nid.split("/")[1:])
         except KeyError:
-            # Either we didn't create the lookup table in _fill_tree
-            # Or we haven't seen it
             return
         self.selection_handler(node)
 
-    def _fill_tree(self, tree, parent='', link='Root', index=0):
+    def _iid(self, path):
+        """Get the item id for the node at the given path."""
+
+        return "/".join(("Root",) + tuple(path))
+
+    def _fill_tree(self, tree):
         """Fill tree with given nodes."""
 
-        # Add node to lookup table
-        if not hasattr(self, "_node_lookup"):
-            self._node_lookup = {}
+        _TreeFiller(self).visit(tree)
 
-        self._node_lookup[str(id(tree))] = tree
 
+class _TreeFiller(Visitor):
+    """Visitor inserting every node it visits into an ASTTreeview."""
+
+    def __init__(self, view):
+        self.view = view
+        self.iids = []
+
+    def enter(self, node):
         # Insert item
-        self.insert(parent, index, iid=id(tree), text=link)
+        if self.iids:
+            parent = self.iids[-1]
+            iid = parent + "/" + node.link
+        else:
+            parent = ''
+            iid = self.view._iid(())
+        self.view.insert(parent, "end", iid=iid, text=iid.rsplit("/", 1)[-1])
+        self.iids.append(iid)
 
         # Tag item
-        if tree.is_empty():
-            self.item(id(tree), tags=["empty"])
+        if node.is_empty():
+            self.view.item(iid, tags=["empty"])
 
         # Fill columns
-        self.set(id(tree), "type", tree.type())
-        if tree.is_basic():
-            self.set(id(tree), "value", str(tree.node()))
-
-        # Add children
-        idx = 0
-        for child in tree:
-            self._fill_tree(tree[child],
-                            parent=id(tree),
-                            link=child,
-                            index=idx)
-            idx += 1
+        self.view.set(iid, "type", node.type())
+        if node.is_basic():
+            self.view.set(iid, "value", str(node.node()))
+
+    def leave(self, node):
+        self.iids.pop()
@@ -141,6 +141,12 @@ def tagging_writer(writer, display, **highlight):
 
     in_progress = set()
 
+    # Id of node -> names of the tags it starts, so most nodes are one lookup
+    targets = {}
+    for h in highlight:
+        if highlight[h] != None:
+            targets.setdefault(id(highlight[h]), []).append(h)
+
     def _highlight(name, state):
         """Start or stop tagging name."""
 
@@ -158,17 +164,27 @@ def tagging_writer(writer, display, **highlight):
             display.tag_add(name, "starthighlight"+name, "current")
 
 
+    def _highlight_node(writer, node, state):
+        """Start or stop tagging anything highlighted by node."""
+
+        names = targets.get(id(node))
+        if names:
+            writer._flush() # The display must be up to date to mark it
+            for h in names:
+                _highlight(h, state)
+
     def _highlighter(f):
-        """Can highlight innards of methods."""
+        """Can highlight innards of the generator methods writing lists."""
+
+        def highlighted(self, node, *varargs, **kwargs):
+            _highlight_node(self, node, True)
+            yield from f(self, node, *varargs, **kwargs)
+            _highlight_node(self, node, False)
 
         def f2(self, node, *varargs, **kwargs):
-            for h in highlight:
-                if node is highlight[h]:
-                    _highlight(h, True)
-            f(self, node, *varargs, **kwargs)
-            for h in highlight:
-                if node is highlight[h]:
-                    _highlight(h, False)
+            if id(node) in targets:
+                return highlighted(self, node, *varargs, **kwargs)
+            return f(self, node, *varargs, **kwargs)
         return f2
 
 
@@ -181,16 +197,18 @@ def tagging_writer(writer, display, **highlight):
         def __init__(self, node, *varargs, **kwargs):
             writer.__init__(self, node, DisplayIO(), *varargs, **kwargs)
 
-        @_highlighter
-        def _write(self, *varargs, **kwargs):
-            super()._write(*varargs, **kwargs)
+        def _node_started(self, node):
+            _highlight_node(self, node, True)
+
+        def _node_finished(self, node):
+            _highlight_node(self, node, False)
 
         @_highlighter
         def _interleave_write(self, *varargs, **kwargs):
-            super()._interleave_write(*varargs, **kwargs)
+            return super()._interleave_write(*varargs, **kwargs)
 
         @_highlighter
         def _write_block(self, *varargs, **kwargs):
-            super()._write_block(*varargs, **kwargs)
+            return super()._write_block(*varargs, **kwargs)
 
     return TaggingWriter
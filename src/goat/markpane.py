@@ -23,6 +23,9 @@ Display a view of the selected node's markings.
 
 import tkinter
 from tkinter import ttk
+from collections.abc import Mapping, Set
+
+from analysis.markers import store
 
 class MarkPane(ttk.Frame):
     """Create pane to display a node's markings."""
@@ -49,17 +52,10 @@ class MarkPane(ttk.Frame):
         else:
             ttk.Label(self, text="None").grid(column=2, row=0, stick="ns")
 
-    # NO NO NO THIS IS ALL WRONG!
-    # BAD ANDY! WHAT IF YOU EVER WANT TO CHANGE THE WORKINGS OF MARKINGS???
-    # CHANGE ALL OF THIS!!!
-
     def _marking_categories(self):
         """Get possible categories for markings."""
 
-        try:
-            return set(self.node._markings.keys())
-        except AttributeError:
-            return None
+        return set(store.STORE.get(self.node)) or None
 
     def _create_categories(self, categories):
         """Create and return the interface for the categories."""
@@ -90,7 +86,7 @@ class MarkPane(ttk.Frame):
         """Return the display text for a given category."""
 
         if category != None:
-            marks = self.node._markings[category]
+            marks = store.STORE.get(self.node)[category]
 
         if isinstance(marks, bool):
             return "Yes" if marks else "No"
@@ -101,13 +97,13 @@ class MarkPane(ttk.Frame):
             else:
                 return "-"
 
-        if isinstance(marks, set):
+        if isinstance(marks, Set):
             if marks:
                 return ", ".join([self._mark_text(marks=x) for x in marks])
             else:
                 return "None"
 
-        if isinstance(marks, dict):
+        if isinstance(marks, Mapping):
             if marks:
                 return ", ".join([
                     (self._mark_text(marks=k) +
@@ -28,6 +28,7 @@ from . import commandui
 
 from analysis.brancher import Brancher
 from analysis.customast import CustomAST
+from analysis.flatast import ReadOnlyTree
 import os.path
 
 from writer.sourcewriter import printSource
@@ -332,7 +333,10 @@ class BranchCommand(commandui.Command):
 
         print()
         if self._confirm("Would you like to commit this change to the AST", wishto=False):
-            self._set_block(newnode)
+            try:
+                self._set_block(newnode)
+            except ReadOnlyTree:
+                print("The tree is read-only so the change could not be committed.")
 
         return
 
@@ -0,0 +1,69 @@
+"""
+Look after the cache of calculated markings from the console.
+
+"""
+
+# OAT - Obfuscation and Analysis Tool
+# Copyright (C) 2011  Andy Gurden
+#
+#     This file is part of OAT.
+#
+#     OAT is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     OAT is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with OAT.  If not, see <http://www.gnu.org/licenses/>.
+
+from . import commandui
+
+from analysis import markcache
+
+class CacheCommand(commandui.Command):
+    """Look after the cache of calculated markings from the console."""
+
+    def __init__(self):
+        commandui.Command.__init__(self, "cache")
+
+        self._opts.add_argument("action", choices=["stats", "clear"], nargs="?", default="stats",
+                                help="Show how the cache is doing, or remove everything in it.")
+
+        self.cache = markcache.MarkCache()
+
+    def run(self, args):
+        """Show or clear the cache of calculated markings."""
+
+        if args.action == "clear":
+            count = self.cache.clear()
+            print("Removed " + str(count) + " cache entries.")
+        else:
+            self.status()
+
+    def autocomplete(self, before, arg, after):
+        if len(before):
+            return []
+        else:
+            return [a for a in ["stats", "clear"] if a.startswith(arg)]
+
+    def status(self):
+        """Show status for the current session."""
+
+        stats = self.cache.stats()
+        print("Mark cache: " + self.cache.directory)
+        print("  " + str(stats["entries"]) + " entries, " + _size(stats["size"]) + " of " + _size(stats["limit"]))
+        print("  " + str(stats["hits"]) + " hits, " + str(stats["misses"]) + " misses this session")
+
+def _size(n : "Number of bytes"):
+    """Get a readable size."""
+
+    for unit in ["B", "KB", "MB"]:
+        if n < 1024:
+            return str(round(n, 1)) + unit
+        n /= 1024
+    return str(round(n, 1)) + "GB"
@@ -38,6 +38,8 @@ class ExploreCommand(commandui.Command):
                            help="Show attributes of the current node.")
         group.add_argument("-p", "--parent", action="store_true", default=False,
                            help="Head up the tree to a parent.")
+        group.add_argument("-l", "--line", metavar="LINE[:COL]", default=None,
+                           help="Jump to the outermost node starting at a line (and column) in the source.")
 
         self._related_parsecmd = parsecmd
         self._ensure_node_sync()
@@ -46,23 +48,13 @@ class ExploreCommand(commandui.Command):
     def ast_current(self):
         """The ast node we are currently looking at."""
 
-        try:
-            *ignore, last = self.ast_parents
-        except ValueError:
-            return None
-        else:
-            return last
+        return self._current
 
     @property
     def ast_top(self):
         """The ast node at the top of our tree."""
 
-        try:
-            first, *ignore = self.ast_parents
-        except ValueError:
-            return None
-        else:
-            return first
+        return self._top
 
 
     def run(self, args):
@@ -82,6 +74,10 @@ class ExploreCommand(commandui.Command):
             if self.level_up():
                 print("Looking at: " + str(self.ast_current))
             return
+        elif args.line != None:
+            if self.jump_to(args.line):
+                print("Looking at: " + str(self.ast_current))
+            return
 
         current = self.ast_current
         print("Looking at: " + str(current))
@@ -122,25 +118,46 @@ class ExploreCommand(commandui.Command):
             print("Field does not exist.")
             return False
         else:
-            self.ast_parents.append(child)
+            self._current = child
 
         return True
 
     def level_up(self):
-        if len(self.ast_parents) > 1:
-            self.ast_parents.pop()
+        if self._current is not self._top and self._current.parent != None:
+            self._current = self._current.parent
             return True
         else:
             print("There is no parent node.")
         return False
 
-    def _ensure_node_sync(self):
-        """Ensure the current node stack is in sync with the main tree."""
+    def jump_to(self, position):
+        try:
+            line, sep, col = position.partition(":")
+            node = self._top.locate(int(line), int(col) if sep else None)
+        except ValueError:
+            print("Position should be given as LINE or LINE:COL.")
+            return False
+
+        if node == None:
+            print("There is no node at that position.")
+            return False
+
+        self._current = node
+        return True
 
-        if self._related_parsecmd.ast.tree == None:
-            self.ast_parents = []
-        elif not hasattr(self, "ast_parents") or self.ast_top != self._related_parsecmd.ast.tree:
-            self.ast_parents = [self._related_parsecmd.ast.tree]
+    def _ensure_node_sync(self):
+        """Ensure the current node is in sync with the main tree."""
+
+        tree = self._related_parsecmd.ast.tree
+        if tree == None:
+            self._top = None
+            self._current = None
+        elif not hasattr(self, "_top") or self._top != tree:
+            self._top = tree
+            self._current = tree
+        elif self._current.root() is not tree:
+            # Our node was cut out of the tree by an edit
+            self._current = tree
 
     def autocomplete(self, before, arg, after):
         if not arg.startswith("-"):
@@ -21,6 +21,7 @@ Write out source for the console.
 #     You should have received a copy of the GNU General Public License
 #     along with OAT.  If not, see <http://www.gnu.org/licenses/>.
 
+import io
 import os
 
 try:
@@ -82,14 +83,16 @@ class FormatCommand(commandui.Command):
             print("The specified file already exists. Use -f to overwrite.")
             return False
 
+        source = io.StringIO()
+        writer(tree, source).write()
         try:
             with open(filename, "w") as file:
-                writer(tree, file).write()
+                file.write(source.getvalue())
         except IOError:
             print("The file could not be written to.")
         else:
-            self._related_parsecmd.ast.file = filename
-            self._related_parsecmd.ast.modified = False
+            storage = self._related_parsecmd.ast
+            storage.written(filename, source.getvalue() if tree is storage.tree else None)
             print("Written to: " + filename)
 
 
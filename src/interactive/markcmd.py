@@ -26,6 +26,9 @@ import abc
 
 from util import pluginfinder
 from analysis import automarker
+from analysis import scopes
+from analysis.markers import store
+from analysis.markers import sidecar
 
 from . import markers
 from . import commandui
@@ -38,7 +41,7 @@ from analysis.customast import CustomAST
 class MarkCommand(commandui.Command):
     """Mark AST nodes with extra information from the console."""
 
-    def __init__(self, parsecmd, explorecmd):
+    def __init__(self, parsecmd, explorecmd, cachecmd=None):
         commandui.Command.__init__(self, "mark")
 
         plugins = pluginfinder.PluginFinder(markers).getPlugins()
@@ -53,10 +56,23 @@ class MarkCommand(commandui.Command):
             except AttributeError:
                 pass # Not a valid plugin
 
-        self._opts.add_argument("-a", "--auto", choices=["mark", "calc", "user"], nargs="*", metavar="METHOD",
-                                help="Auto-mark this node and those needed to resolve its markings. It will use the given resolution order.")
+        auto = self._opts.add_mutually_exclusive_group()
+        auto.add_argument("-a", "--auto", choices=["mark", "calc", "user"], nargs="*", metavar="METHOD",
+                          help="Auto-mark this node and those needed to resolve its markings. It will use the given resolution order.")
+        auto.add_argument("--auto-all", choices=["mark", "calc", "user"], nargs="*", metavar="METHOD",
+                          help="Auto-mark every node in the tree in one pass, children before parents. It will use the given resolution order.")
+        auto.add_argument("--files", nargs="+", metavar="FILE",
+                          help="Auto-mark every node of each file by calculation and save the markings next to it, for parse --load. Files are shared between --jobs processes.")
+        auto.add_argument("--all-scopes", action="store_true", default=False,
+                          help="Work out the scope and indirectrw markings of every function and class in the tree.")
+        self._opts.add_argument("-j", "--jobs", type=int, default=1,
+                                help="Number of processes to share the work of --auto-all or --files between.")
         self._opts.add_argument("--review", action="store_true", default=False,
                                 help="Review each set of markings before they are made permanent on a node. This is only valid for auto-marking.")
+        self._opts.add_argument("--no-cache", action="store_true", default=False,
+                                help="Calculate every marking again rather than using any saved by earlier runs.")
+        self._opts.add_argument("--stats", action="store_true", default=False,
+                                help="Show where the time went while auto-marking.")
 
         for marker in self.marks:
             self._opts.add_argument("-"+marker[0], "--"+marker,
@@ -65,6 +81,7 @@ class MarkCommand(commandui.Command):
 
         self._related_parsecmd = parsecmd
         self._related_explorecmd = explorecmd
+        self._related_cachecmd = cachecmd
 
     def _get_node(self):
         """Get current node, print errors and return the node or None."""
@@ -81,6 +98,9 @@ class MarkCommand(commandui.Command):
     def run(self, args):
         """Mark the current AST node with extra information."""
 
+        if args.files != None:
+            return self._mark_files(args.files, args.jobs)
+
         node = self._get_node()
         if node == None:
             return False
@@ -92,7 +112,13 @@ class MarkCommand(commandui.Command):
                 trans[p] = (lambda n=node, a=params[p], m=self.marks[p]: m.translate(n, a))
 
         if params["auto"] != None:
-            self._auto_update(node, params["auto"], params["review"], trans)
+            self._auto_update(node, params["auto"], params["review"], trans, params["no_cache"], stats=params["stats"])
+        elif params["auto_all"] != None:
+            self._auto_update(node.root(), params["auto_all"], params["review"], trans, params["no_cache"], jobs=params["jobs"], stats=params["stats"])
+        elif params["all_scopes"]:
+            count = scopes.mark_scopes(node)
+            self._related_parsecmd.ast.augmented = True
+            print("Marked the scopes of " + str(count) + " functions and classes.")
         elif trans:
             self._manual_update(node, trans)
         else:
@@ -106,21 +132,53 @@ class MarkCommand(commandui.Command):
         self._show_dummy_markings(m)
         self._related_parsecmd.ast.augmented = True
 
-    def _auto_update(self, node, res, review, trans):
-        self._related_parsecmd.ast.augmented = True
+    def _auto_update(self, node, res, review, trans, no_cache=False, jobs=None, stats=False):
+        storage = self._related_parsecmd.ast
+        storage.augmented = True
+        cache = None
+        if self._related_cachecmd != None and not no_cache:
+            cache = self._related_cachecmd.cache
+        stats = automarker.MarkStats() if stats else None
         try:
             if review:
-                marker = automarker.AutoMarker(res, mark=True, user=self._ask_specific, review=self._review_marks, defaults=trans)
+                marker = automarker.AutoMarker(res, mark=True, user=self._ask_specific, review=self._review_marks, defaults=trans, cache=cache, stats=stats)
             else:
-                marker = automarker.AutoMarker(res, mark=True, user=self._ask_specific, defaults=trans)
+                marker = automarker.AutoMarker(res, mark=True, user=self._ask_specific, defaults=trans, cache=cache, stats=stats)
         except ValueError as exc:
             print(str(exc))
         else:
             try:
-                m = marker.resolve_marks(node) # By default all markings
+                if jobs != None: # Whole tree
+                    # The source hash saves hashing the tree, but only says what it is if unchanged
+                    source = storage.filehash if node is storage.tree and not storage.modified else None
+                    m = marker.mark_tree(node, jobs=jobs, source_hash=source) # By default all markings
+                else:
+                    m = marker.resolve_marks(node) # By default all markings
                 self._show_dummy_markings(m)
             except automarker.UserStop:
                 print("The auto-marking process was interrupted.")
+            except ValueError as exc:
+                print(str(exc))
+            if stats != None:
+                for line in stats.report():
+                    print(line)
+
+    def _mark_files(self, fnames, jobs):
+        try:
+            found = automarker.mark_files(fnames, jobs=jobs)
+        except (IOError, SyntaxError) as exc:
+            print("The files could not be marked: " + str(exc))
+            return False
+
+        for fname in fnames:
+            try:
+                with open(sidecar.marks_file(fname), "wb") as file:
+                    file.write(found[fname])
+            except IOError:
+                print("The markings for " + fname + " could not be saved.")
+            else:
+                print("Marked: " + fname)
+        return True
 
     def _show_markings(self, node):
         """Print out the markings for the given node."""
@@ -133,7 +191,7 @@ class MarkCommand(commandui.Command):
     def _show_dummy_markings(self, markings):
         # Create a dummy node with the markings already set to show
         d_node = CustomAST([])
-        d_node._markings = markings
+        store.STORE.update(d_node, markings)
         self._show_markings(d_node)
 
 
@@ -21,11 +21,16 @@ Parses ASTs for the console.
 #     You should have received a copy of the GNU General Public License
 #     along with OAT.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import ast
 import hashlib
 import pickle
 
 from analysis.customast import CustomAST
+from analysis import flatast
+from analysis import incremental
+from analysis.markers import store
+from analysis.markers import sidecar
 from . import commandui
 
 class ParseCommand(commandui.Command):
@@ -38,9 +43,13 @@ class ParseCommand(commandui.Command):
                                 help="File to parse.")
         group = self._opts.add_mutually_exclusive_group()
         group.add_argument("-l", "--load", action="store_true", default=False,
-                           help="Load the AST from its stored form")
+                           help="Parse the file and load the markings saved for it")
         group.add_argument("-s", "--save", action="store_true", default=False,
-                           help="Save the AST with markings for later")
+                           help="Save the markings of the AST for later")
+        group.add_argument("-u", "--update", action="store_true", default=False,
+                           help="Reparse only the changed parts of the current file, keeping markings elsewhere")
+        self._opts.add_argument("-f", "--flat", action="store_true", default=False,
+                                help="Parse into a compact read-only tree. Useful for very large files.")
 
         self.ast = ASTStorage()
 
@@ -55,6 +64,9 @@ class ParseCommand(commandui.Command):
             print("Cannot load without a file.")
             return False
 
+        if args.update:
+            return self._update(args)
+
         if not args.load and not args.save and not args.file:
             print("Did nothing.")
             return False
@@ -70,16 +82,16 @@ class ParseCommand(commandui.Command):
                     print("The AST has been modified, save the source with format and try again.")
                     return False
                 except IOError:
-                    print("The AST file could not be opened.")
+                    print("The markings file could not be opened.")
                     return False
-                except pickle.PicklingError:
-                    print("The AST could not be saved.")
+                except TypeError:
+                    print("The markings could not be saved.")
                     return False
                 else:
-                    print("The current AST has been saved to: " + self.ast._ast_file())
+                    print("The current markings have been saved to: " + self.ast._marks_file())
         else:
             try:
-                self.ast = ASTStorage(args.file, load=args.load)
+                self.ast = ASTStorage(args.file, load=args.load, flat=args.flat)
             except IOError:
                 print("The necessary files could not be read.")
                 return False
@@ -89,12 +101,36 @@ class ParseCommand(commandui.Command):
             except (TypeError, pickle.UnpicklingError):
                 print("Could not use the data in the given file.")
                 return False
-            except AssertionError:
-                print("The AST and source files do not match. You must generate a new AST.")
+            except (AssertionError, ValueError):
+                print("The saved markings and source file do not match. You must mark the file again.")
                 return False
             else:
                 print("Loaded AST for file: " + args.file)
 
+    def _update(self, args):
+        """Bring the current AST up to date with its file."""
+
+        if self.ast.tree == None:
+            print("There is no AST to update, parse one first.")
+            return False
+        if args.file and args.file != self.ast.file:
+            print("Can only update the file that is currently parsed.")
+            return False
+
+        try:
+            changed = self.ast.update()
+        except AssertionError:
+            print("The AST has been modified, save the source with format and try again.")
+            return False
+        except IOError:
+            print("The file could not be read.")
+            return False
+        except SyntaxError:
+            print("The file contains incorrect syntax, the AST has not been changed.")
+            return False
+        else:
+            print("Updated AST for file: " + self.ast.file + " (" + str(changed) + " statements changed)")
+
     def autocomplete(self, before, arg, after):
         if len(before):
             return []
@@ -112,21 +148,27 @@ class ParseCommand(commandui.Command):
 class ASTStorage:
     """Holds an AST along with information about its origin."""
 
-    def __init__(self, fname = None, load = False):
+    def __init__(self, fname = None, load = False, flat = False):
         self.tree = None
         self.file = None
+        self.source = None
         self.filehash = None
         self.modified = False # Set to true on modification of the AST
         self.augmented = False # Set to true on addition of extra data
 
         if fname:
             if load:
-                self._load(fname)
+                self._load(fname, flat)
             else:
-                self._parse(fname)
+                self._parse(fname, flat)
+
+    def _marks_file(self, fname=None):
+        """Get the name of the potential markings file."""
+
+        return sidecar.marks_file(self.file if fname == None else fname)
 
     def _ast_file(self, fname=None):
-        """Get the name of the potential AST storage file."""
+        """Get the name of the potential AST storage file, as used by older versions."""
 
         if fname == None:
             fname = self.file
@@ -136,10 +178,11 @@ class ASTStorage:
         else:
             return fname + ".ast"
 
-    def _parse(self, fname):
+    def _parse(self, fname, flat=False):
         """
         Parse the filename from the given file.
 
+        If flat is set the tree will be a read-only view over a FlatAST.
         Allows IOError if the file cannot be read, SyntaxError if it cannot
         be understood, or TypeError if it is the wrong type.
 
@@ -152,31 +195,77 @@ class ASTStorage:
             source = file.read()
 
         # Could raise SyntaxError or TypeError
-        theast = CustomAST(ast.parse(source, filename=fname))
+        if flat:
+            theast = flatast.parse(source, fname).root()
+        else:
+            theast = CustomAST(ast.parse(source, filename=fname), index=True)
 
         h = hashlib.sha224()
         h.update(source.encode())
 
         self.tree = theast
         self.file = fname
+        self.source = source
         self.filehash = h.hexdigest()
         self.modified = False
         self.augmented = False
 
-    def _load(self, fname):
+    def _load(self, fname, flat=False):
+        """
+        Parse the given file and load the markings saved for it.
+
+        Falls back to the whole stored AST written by older versions if
+        there is no markings file. As well as the errors from _parse this
+        raises IOError if the markings cannot be read, TypeError or
+        pickle.UnpicklingError if they are incorrect and ValueError or
+        AssertionError if the file has changed since they were saved.
+
         """
-        Load the given file's AST from disk.
 
-        Raises IOError if the ast or source files cannot be read.
-        Raises TypeError or pickle.UnpicklingError if the AST file is incorrect
-        Raises AssertError if the file has changed.
+        if not os.path.exists(self._marks_file(fname)) and os.path.exists(self._ast_file(fname)):
+            return self._load_pickled(fname)
+
+        self._parse(fname, flat)
+
+        # Could raise IOError, TypeError or ValueError
+        sidecar.load(self._marks_file(), self.tree, self.source)
+
+    def _load_pickled(self, fname):
+        """
+        Load the whole AST pickled by older versions.
+
+        >>> import tempfile
+        >>> fname = os.path.join(tempfile.mkdtemp(), "old.py")
+        >>> with open(fname, "w") as file:
+        ...     file.write("a = b\\n")
+        6
+        >>> tree = CustomAST(ast.parse("a = b\\n"))
+        >>> nodes = list(tree.walk())
+        >>> for node in nodes: # Strip the nodes back to how they were saved
+        ...     del node.kind, node.parent, node.link
+        >>> nodes[2]._markings = {"visible": False}
+        >>> old = ASTStorage()
+        >>> old.tree, old.file = tree, fname
+        >>> old.filehash = hashlib.sha224(b"a = b\\n").hexdigest()
+        >>> del old.source
+        >>> with open(old._ast_file(), "wb") as file:
+        ...     pickle.dump(old, file)
+        >>> loaded = ASTStorage(fname, load=True)
+        >>> stmt = loaded.tree["body"]["0"]
+        >>> stmt.parent is loaded.tree["body"], stmt.root() is loaded.tree
+        (True, True)
+        >>> store.STORE.get(stmt)["visible"]
+        False
 
         """
 
         # Could raise IOError
         stored = None
         with open(self._ast_file(fname), "rb") as file:
-            stored = pickle.load(file)
+            try:
+                stored = pickle.load(file)
+            except (AttributeError, EOFError, ImportError, IndexError, KeyError) as exc:
+                raise pickle.UnpicklingError("The stored AST could not be read.") from exc
 
         # TypeError
         if not isinstance(stored, ASTStorage):
@@ -195,27 +284,141 @@ class ASTStorage:
 
         self.tree = stored.tree
         self.file = stored.file
+        self.source = source
         self.filehash = stored.filehash
         self.modified = False # We don't care what the file says
         self.augmented = False
 
+    def update(self):
+        """
+        Reparse the parts of our file that have changed since it was parsed.
+
+        Unchanged statements keep their nodes and markings, as do those
+        where only comments have changed. Returns the number of statements
+        that changed. Raises AssertionError if the AST has been modified,
+        IOError if the file cannot be read and SyntaxError if it can no
+        longer be parsed.
+
+        >>> import tempfile
+        >>> from analysis import automarker
+        >>> fname = os.path.join(tempfile.mkdtemp(), "edit.py")
+        >>> with open(fname, "w") as file:
+        ...     file.write("a = b\\nc = d\\n")
+        12
+        >>> storage = ASTStorage(fname)
+        >>> kept = storage.tree["body"]["0"]
+        >>> marks = automarker.AutoMarker(["calc"]).mark_tree(storage.tree)
+        >>> with open(fname, "w") as file:
+        ...     file.write("a = b  # Why\\nc = e\\n")
+        19
+        >>> storage.update()
+        1
+        >>> storage.tree["body"]["0"] is kept, sorted(store.STORE.get(kept)["reads"])
+        (True, ['b'])
+        >>> storage.tree["body"]["1"]["value"]["id"].node(), storage.update()
+        ('e', 0)
+
+        """
+
+        assert not self.modified
+
+        # Could raise IOError
+        with open(self.file, "r") as file:
+            source = file.read()
+
+        h = hashlib.sha224()
+        h.update(source.encode())
+        if h.hexdigest() == self.filehash:
+            return 0
+
+        if isinstance(self.tree, flatast.FlatNode):
+            self._parse(self.file, flat=True)
+            return len(self.tree["body"])
+
+        # Could raise SyntaxError
+        changed = incremental.update(self.tree, self.source, source, self.file)
+
+        self.source = source
+        self.filehash = h.hexdigest()
+        self.augmented = True
+        return changed
+
+    def written(self,
+                fname : "File the tree was written to",
+                source : "Source written, or None if only part of the tree was"):
+        """
+        Note that our tree has been written to a file, so now comes from it.
+
+        The hash of the file has to follow, as whole-file markings are
+        cached under it.
+
+        >>> import tempfile
+        >>> from analysis import automarker, markcache
+        >>> from writer.prettywriter import PrettyWriter
+        >>> from io import StringIO
+        >>> fname = os.path.join(tempfile.mkdtemp(), "swap.py")
+        >>> with open(fname, "w") as file:
+        ...     file.write("a = b\\nc = a\\n")
+        12
+        >>> storage = ASTStorage(fname)
+        >>> cache = markcache.MarkCache(tempfile.mkdtemp())
+        >>> def mark():
+        ...     marker = automarker.AutoMarker(["calc"], cache=cache)
+        ...     return marker.mark_tree(storage.tree, source_hash=storage.filehash)
+        >>> sorted(mark()["reads"])
+        ['b']
+        >>> body = storage.tree["body"]
+        >>> body.become(CustomAST([body["1"].node(), body["0"].node()]))
+        >>> text = StringIO()
+        >>> PrettyWriter(storage.tree, text).write()
+        >>> storage.written(fname, text.getvalue())
+        >>> sorted(mark()["reads"])
+        ['a', 'b']
+        >>> marks = store.STORE.get(storage.tree["body"]["0"])
+        >>> sorted(marks["reads"]), sorted(marks["writes"])
+        (['a'], ['c'])
+
+        """
+
+        self.file = fname
+        self.modified = False
+        if source == None:
+            self.filehash = None
+        else:
+            h = hashlib.sha224()
+            h.update(source.encode())
+            self.source = source
+            self.filehash = h.hexdigest()
+
     def save(self):
         """
-        Save the given file's AST to disk.
+        Save the markings of our AST to disk, next to the file.
 
         Raises AssertionError if the AST has changed since parsing the file.
         Raises IOError if the file could not be opened.
-        Raises pickle.PicklingError if the tree could not be pickled.
+        Raises TypeError if some marking could not be saved.
 
         """
 
         assert not self.modified
 
-        with open(self._ast_file(), "wb") as file:
-            pickle.dump(self, file, 3)
+        sidecar.save(self._marks_file(), self.tree, self.source)
 
         self.augmented = False
 
+    def __setstate__(self, state):
+        # Only needed to read AST files saved by older versions
+        markings = state.pop("markings", [])
+        self.__dict__.update(state)
+        for node, record in markings:
+            store.STORE.update(node, record)
+
+        # Older files kept the markings on the nodes themselves
+        if self.tree != None:
+            for node in self.tree.walk():
+                if "_markings" in node.__dict__:
+                    store.STORE.update(node, node.__dict__.pop("_markings"))
+
     def __str__(self):
         if self.tree == None:
             return "None"
@@ -27,6 +27,7 @@ from . import commandui
 
 from analysis import reorder
 from analysis import valuers
+from analysis import automarker
 
 from writer import sourcewriter
 from writer import prettywriter
@@ -38,6 +39,7 @@ from analysis.markers import write
 from analysis.markers import scope
 
 from analysis.customast import CustomAST
+from analysis.flatast import ReadOnlyTree
 
 class ReorderCommand(commandui.Command):
     """Reorder statement blocks from the console."""
@@ -59,6 +61,8 @@ class ReorderCommand(commandui.Command):
                                 help="Randomise order of output permutations.")
         self._opts.add_argument("-l", "--limit", type=int, default=None,
                                 help="Take only the first LIMIT permutations. Combine with --random for a very fast random permutation.")
+        self._opts.add_argument("-m", "--marked-only", action="store_true", default=False,
+                                help="Only use markings already made, rather than auto-marking the statements that need it.")
         actions = self._opts.add_mutually_exclusive_group()
         actions.add_argument("-c", "--current", action="store_const", const="current", dest="do",
                              help="Check if this node can be reordered and print it's current state if so.")
@@ -75,6 +79,7 @@ class ReorderCommand(commandui.Command):
 
         self._related_parsecmd = parsecmd
         self._related_explorecmd = explorecmd
+        self._provider = automarker.BlockProvider()
 
     def run(self, args):
         """Reorder the body of statements for the current node."""
@@ -94,19 +99,24 @@ class ReorderCommand(commandui.Command):
             print("This node is not reorderable.")
             return False
 
+        provider = None if args.marked_only else self._provider
         try:
-            orderer = (reorder.RandomReorderer(block, safe=args.safe, limit=args.limit) if args.random
-                      else reorder.Reorderer(block, safe=args.safe, limit=args.limit))
+            orderer = (reorder.RandomReorderer(block, safe=args.safe, limit=args.limit, provider=provider) if args.random
+                      else reorder.Reorderer(block, safe=args.safe, limit=args.limit, provider=provider))
         except TypeError:
             print("The node's body was of unexpected type, I don't know what do do with this.")
             return False
 
+        marked = self._provider.marked
         try:
             self._perform_action(do, block, orderer, args)
         except AssertionError:
             if not args.safe: # Then we shouldn't have got this
                 raise
             print("Safety check failed.")
+        finally:
+            if self._provider.marked != marked:
+                self._related_parsecmd.ast.augmented = True
 
     def _perform_action(self, do, block, orderer, args):
         """Perform the chosen action."""
@@ -172,8 +182,12 @@ class ReorderCommand(commandui.Command):
 
             print()
             if args.edit:
-                self._set_block(orderer.permute(perm))
-                print("The node has been reordered.")
+                try:
+                    self._set_block(orderer.permute(perm))
+                except ReadOnlyTree:
+                    print("The tree is read-only so the node could not be reordered.")
+                else:
+                    print("The node has been reordered.")
             else:
                 print("This is the optimal chosen rearrangement. To write to the node see --edit.")
             return
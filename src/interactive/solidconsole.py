@@ -30,6 +30,7 @@ from . import reordercmd
 from . import markcmd
 from . import visualisecmd
 from . import branchcmd
+from . import cachecmd
 
 class SolidConsole(commandui.CommandUI):
     """Solid command class."""
@@ -41,7 +42,8 @@ class SolidConsole(commandui.CommandUI):
         explore = explorecmd.ExploreCommand(parse)
         format = formatcmd.FormatCommand(parse, explore)
         reorder = reordercmd.ReorderCommand(parse, explore)
-        mark = markcmd.MarkCommand(parse, explore)
+        cache = cachecmd.CacheCommand()
+        mark = markcmd.MarkCommand(parse, explore, cache)
         visualise = visualisecmd.VisualiseCommand(parse, explore)
         branch = branchcmd.BranchCommand(parse, explore)
         self.add_command(parse)
@@ -51,3 +53,4 @@ class SolidConsole(commandui.CommandUI):
         self.add_command(mark)
         self.add_command(visualise)
         self.add_command(branch)
+        self.add_command(cache)
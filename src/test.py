@@ -22,6 +22,19 @@ from writer import sourcewriter
 from writer import basicwriter
 from writer import prettywriter
 from util import pluginfinder
+from analysis import customast
+from analysis import flatast
+from analysis import variant
+from analysis import incremental
+from analysis import automarker
+from analysis import markcache
+from analysis import scopes
+from analysis import callsummary
+from analysis.markers import store
+from analysis.markers import names
+from analysis.markers import block
+from analysis.markers import sidecar
+from interactive import parsecmd
 
 modules = [globals()[mod] for mod in globals() if not mod.startswith("__")]
 
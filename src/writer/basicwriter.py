@@ -81,7 +81,7 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._write_block(tree["body"], indent = False)
+        yield from self._write_block(tree["body"], indent = False)
 
     def _write_Interactive(self, tree):
         """
@@ -97,7 +97,7 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         old_interactive = self._is_interactive()
         self._is_interactive(True)
-        self._write_block(tree["body"], indent = False)
+        yield from self._write_block(tree["body"], indent = False)
         self._is_interactive(old_interactive)
 
     def _write_Expression(self, tree):
@@ -112,7 +112,7 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._write_block(CustomAST([tree["body"]]), indent = False)
+        yield from self._write_block(CustomAST([tree["body"]]), indent = False)
     
 
     def _write_Suite(self, tree):
@@ -140,20 +140,20 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._interleave_write(
+        yield from self._interleave_write(
             tree["decorator_list"],
             before = (lambda: self._ground_write("@")),
             after = self._next_statement)
 
         self._ground_write("def ")
-        self._write(tree["name"])
+        yield tree["name"]
         self._ground_write("(")
-        self._write(tree["args"])
+        yield tree["args"]
         self._ground_write(")")
         if not tree["returns"].is_empty():
             self._ground_write(" -> ")
-            self._write(tree["returns"])
-        self._write_block(tree["body"])
+            yield tree["returns"]
+        yield from self._write_block(tree["body"])
 
     def _write_ClassDef(self, tree):
         """
@@ -176,19 +176,19 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._interleave_write(tree["decorator_list"],
+        yield from self._interleave_write(tree["decorator_list"],
             before=(lambda: self._ground_write("@")),
             after=self._next_statement)
 
         self._ground_write("class ")
-        self._write(tree["name"])
+        yield tree["name"]
         if (not tree["bases"].is_empty() or
            not tree["keywords"].is_empty() or
            not tree["starargs"].is_empty() or
            not tree["kwargs"].is_empty()):
             self._ground_write("(")
 
-            self._interleave_write(
+            yield from self._interleave_write(
                 tree["bases"].temp_list(tree["keywords"]),
                 between=(lambda: self._ground_write(", ")))
 
@@ -199,17 +199,17 @@ class BasicWriter(sourcewriter.SourceWriter):
                     self._ground_write(", ")
                 had_arg = True
                 self._ground_write("*")
-                self._write(tree["starargs"])
+                yield tree["starargs"]
 
             if not tree["kwargs"].is_empty():
                 if had_arg:
                     self._ground_write(", ")
                 had_arg = True
                 self._ground_write("**")
-                self._write(tree["kwargs"])
+                yield tree["kwargs"]
 
             self._ground_write(")")
-        self._write_block(tree["body"])
+        yield from self._write_block(tree["body"])
         
 
     def _write_Return(self, tree):
@@ -230,7 +230,7 @@ class BasicWriter(sourcewriter.SourceWriter):
         self._ground_write("return")
         if not tree["value"].is_empty():
             self._ground_write(" ")
-            self._write(tree["value"])
+            yield tree["value"]
 
     def _write_Delete(self, tree):
         """
@@ -245,7 +245,7 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("del ")
-        self._interleave_write(tree["targets"],
+        yield from self._interleave_write(tree["targets"],
             between=(lambda: self._ground_write(", ")))
 
 
@@ -261,10 +261,10 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._interleave_write(tree["targets"],
+        yield from self._interleave_write(tree["targets"],
             between=(lambda: self._ground_write(" = ")))
         self._ground_write(" = ")
-        self._write(tree["value"])
+        yield tree["value"]
 
 
     def _write_AugAssign(self, tree):
@@ -279,11 +279,11 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._write(tree["target"])
+        yield tree["target"]
         self._ground_write(" ")
-        self._write(tree["op"])
+        yield tree["op"]
         self._ground_write("= ")
-        self._write(tree["value"])
+        yield tree["value"]
 
     def _write_For(self, tree):
         """
@@ -307,15 +307,15 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("for ")
-        self._write(tree["target"])
+        yield tree["target"]
         self._ground_write(" in ")
-        self._write(tree["iter"])
-        self._write_block(tree["body"])
+        yield tree["iter"]
+        yield from self._write_block(tree["body"])
 
         if not tree["orelse"].is_empty():
             self._next_statement()
             self._ground_write("else")
-            self._write_block(tree["orelse"])
+            yield from self._write_block(tree["orelse"])
 
     def _write_While(self, tree):
         """
@@ -339,13 +339,13 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("while ")
-        self._write(tree["test"])
-        self._write_block(tree["body"])
+        yield tree["test"]
+        yield from self._write_block(tree["body"])
 
         if not tree["orelse"].is_empty():
             self._next_statement()
             self._ground_write("else")
-            self._write_block(tree["orelse"])
+            yield from self._write_block(tree["orelse"])
 
     def _write_If(self, tree):
         """
@@ -369,13 +369,13 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("if ")
-        self._write(tree["test"])
-        self._write_block(tree["body"])
+        yield tree["test"]
+        yield from self._write_block(tree["body"])
 
         if not tree["orelse"].is_empty():
             self._next_statement()
             self._ground_write("else")
-            self._write_block(tree["orelse"])
+            yield from self._write_block(tree["orelse"])
 
 
     def _write_With(self, tree):
@@ -396,13 +396,13 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("with ")
-        self._write(tree["context_expr"])
+        yield tree["context_expr"]
 
         if not tree["optional_vars"].is_empty():
             self._ground_write(" as ")
-            self._write(tree["optional_vars"])
+            yield tree["optional_vars"]
 
-        self._write_block(tree["body"])
+        yield from self._write_block(tree["body"])
 
 
     def _write_Raise(self, tree):
@@ -424,11 +424,11 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         if not tree["exc"].is_empty():
             self._ground_write(" ")
-            self._write(tree["exc"])
+            yield tree["exc"]
 
             if not tree["cause"].is_empty():
                 self._ground_write(" from ")
-                self._write(tree["cause"])
+                yield tree["cause"]
 
 
     def _write_TryExcept(self, tree):
@@ -457,15 +457,15 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("try")
-        self._write_block(tree["body"])
+        yield from self._write_block(tree["body"])
 
-        self._interleave_write(tree["handlers"],
+        yield from self._interleave_write(tree["handlers"],
             before = self._next_statement)
 
         if not tree["orelse"].is_empty():
             self._next_statement()
             self._ground_write("else")
-            self._write_block(tree["orelse"])
+            yield from self._write_block(tree["orelse"])
         
 
     def _write_TryFinally(self, tree):
@@ -488,11 +488,11 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("try")
-        self._write_block(tree["body"])
+        yield from self._write_block(tree["body"])
 
         self._next_statement()
         self._ground_write("finally")
-        self._write_block(tree["finalbody"])
+        yield from self._write_block(tree["finalbody"])
 
     def _write_Assert(self, tree):
         """
@@ -507,11 +507,11 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("assert ")
-        self._write(tree["test"])
+        yield tree["test"]
 
         if not tree["msg"].is_empty():
             self._ground_write(", ")
-            self._write(tree["msg"])
+            yield tree["msg"]
 
 
     def _write_Import(self, tree):
@@ -527,7 +527,7 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("import ")
-        self._interleave_write(tree["names"],
+        yield from self._interleave_write(tree["names"],
             between = (lambda: self._ground_write(", ")))
 
     def _write_ImportFrom(self, tree):
@@ -549,10 +549,10 @@ class BasicWriter(sourcewriter.SourceWriter):
         if tree["level"].node():
             self._ground_write("." * tree["level"].node())
         if not tree["module"].is_empty():
-            self._write(tree["module"])
+            yield tree["module"]
         self._ground_write(" import ")
 
-        self._interleave_write(tree["names"],
+        yield from self._interleave_write(tree["names"],
             between = (lambda: self._ground_write(", ")))
 
 
@@ -569,7 +569,7 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("global ")
-        self._interleave_write(tree["names"],
+        yield from self._interleave_write(tree["names"],
             between = (lambda: self._ground_write(", ")))
 
 
@@ -586,7 +586,7 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("nonlocal ")
-        self._interleave_write(tree["names"],
+        yield from self._interleave_write(tree["names"],
             between = (lambda: self._ground_write(", ")))
 
 
@@ -604,7 +604,7 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._write(tree["value"])
+        yield tree["value"]
 
 
     # not worth testing
@@ -627,11 +627,11 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         def sep():
             self._ground_write(" ")
-            self._write(tree["op"])
+            yield tree["op"]
             self._ground_write(" ")
 
         self._ground_write("(")
-        self._interleave_write(tree["values"], between = sep)
+        yield from self._interleave_write(tree["values"], between = sep)
         self._ground_write(")")
 
     def _write_BinOp(self, tree):
@@ -647,11 +647,11 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("(")
-        self._write(tree["left"])
+        yield tree["left"]
         self._ground_write(" ")
-        self._write(tree["op"])
+        yield tree["op"]
         self._ground_write(" ")
-        self._write(tree["right"])
+        yield tree["right"]
         self._ground_write(")")
 
     def _write_UnaryOp(self, tree):
@@ -666,9 +666,9 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._write(tree["op"])
+        yield tree["op"]
         self._ground_write(" ")
-        self._write(tree["operand"])
+        yield tree["operand"]
 
     def _write_Lambda(self, tree):
         """
@@ -685,9 +685,9 @@ class BasicWriter(sourcewriter.SourceWriter):
         self._ground_write("lambda")
         if not tree["args"].is_empty():
             self._ground_write(" ")
-            self._write(tree["args"])
+            yield tree["args"]
         self._ground_write(": ")
-        self._write(tree["body"])
+        yield tree["body"]
 
     def _write_IfExp(self, tree):
         """
@@ -701,11 +701,11 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._write(tree["body"])
+        yield tree["body"]
         self._ground_write(" if ")
-        self._write(tree["test"])
+        yield tree["test"]
         self._ground_write(" else ")
-        self._write(tree["orelse"])
+        yield tree["orelse"]
 
 
     def _write_Dict(self, tree):
@@ -728,9 +728,9 @@ class BasicWriter(sourcewriter.SourceWriter):
                 self._ground_write(", ")
             else:
                 had_arg = True
-            self._write(tree["keys"][child])
+            yield tree["keys"][child]
             self._ground_write(": ")
-            self._write(tree["values"][child])
+            yield tree["values"][child]
 
         self._ground_write("}")
 
@@ -748,7 +748,7 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("{")
-        self._interleave_write(tree["elts"],
+        yield from self._interleave_write(tree["elts"],
             between = (lambda: self._ground_write(", ")))
         self._ground_write("}")
 
@@ -766,8 +766,8 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("[")
-        self._write(tree["elt"])
-        self._interleave_write(tree["generators"],
+        yield tree["elt"]
+        yield from self._interleave_write(tree["generators"],
             before = (lambda: self._ground_write(" ")))
         self._ground_write("]")
 
@@ -784,8 +784,8 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("{")
-        self._write(tree["elt"])
-        self._interleave_write(tree["generators"],
+        yield tree["elt"]
+        yield from self._interleave_write(tree["generators"],
             before = (lambda: self._ground_write(" ")))
         self._ground_write("}")
 
@@ -802,10 +802,10 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("{")
-        self._write(tree["key"])
+        yield tree["key"]
         self._ground_write(": ")
-        self._write(tree["value"])
-        self._interleave_write(tree["generators"],
+        yield tree["value"]
+        yield from self._interleave_write(tree["generators"],
             before = (lambda: self._ground_write(" ")))
         self._ground_write("}")
 
@@ -822,8 +822,8 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("(")
-        self._write(tree["elt"])
-        self._interleave_write(tree["generators"],
+        yield tree["elt"]
+        yield from self._interleave_write(tree["generators"],
             before = (lambda: self._ground_write(" ")))
         self._ground_write(")")
 
@@ -842,7 +842,7 @@ class BasicWriter(sourcewriter.SourceWriter):
         self._ground_write("yield")
         if not tree["value"].is_empty():
             self._ground_write(" ")
-            self._write(tree["value"])
+            yield tree["value"]
 
     def _write_Compare(self, tree):
         """
@@ -856,13 +856,13 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._write(tree["left"])
+        yield tree["left"]
 
         for child in tree["ops"]:
             self._ground_write(" ")
-            self._write(tree["ops"][child])
+            yield tree["ops"][child]
             self._ground_write(" ")
-            self._write(tree["comparators"][child])
+            yield tree["comparators"][child]
 
     def _write_Call(self, tree):
         """
@@ -876,11 +876,11 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._write(tree["func"])
+        yield tree["func"]
         self._ground_write("(")
 
         allargs = tree["args"].temp_list(tree["keywords"])
-        self._interleave_write(allargs,
+        yield from self._interleave_write(allargs,
             between = (lambda: self._ground_write(", ")))
 
         has_arg = bool(allargs)
@@ -890,14 +890,14 @@ class BasicWriter(sourcewriter.SourceWriter):
                 self._ground_write(", ")
             has_arg = True
             self._ground_write("*")
-            self._write(tree["starargs"])
+            yield tree["starargs"]
 
         if not tree["kwargs"].is_empty():
             if has_arg:
                 self._ground_write(", ")
             has_arg = True
             self._ground_write("*")
-            self._write(tree["kwargs"])
+            yield tree["kwargs"]
 
         self._ground_write(")")
 
@@ -957,9 +957,9 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._write(tree["value"])
+        yield tree["value"]
         self._ground_write(".")
-        self._write(tree["attr"])
+        yield tree["attr"]
 
     def _write_Subscript(self, tree):
         """
@@ -975,9 +975,9 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._write(tree["value"])
+        yield tree["value"]
         self._ground_write("[")
-        self._write(tree["slice"])
+        yield tree["slice"]
         self._ground_write("]")
 
     def _write_Starred(self, tree):
@@ -995,7 +995,7 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("*")
-        self._write(tree["value"])
+        yield tree["value"]
 
     def _write_Name(self, tree):
         """
@@ -1008,7 +1008,7 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._write(tree["id"])
+        yield tree["id"]
 
     def _write_List(self, tree):
         """
@@ -1022,7 +1022,7 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("[")
-        self._interleave_write(tree["elts"],
+        yield from self._interleave_write(tree["elts"],
             between = (lambda: self._ground_write(", ")))
         self._ground_write("]")
 
@@ -1039,7 +1039,7 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("(")
-        self._interleave_write(tree["elts"],
+        yield from self._interleave_write(tree["elts"],
             between = (lambda: self._ground_write(", ")))
         self._ground_write(")")
 
@@ -1065,13 +1065,13 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         if not tree["lower"].is_empty():
-            self._write(tree["lower"])
+            yield tree["lower"]
         self._ground_write(":")
         if not tree["upper"].is_empty():
-            self._write(tree["upper"])
+            yield tree["upper"]
         if not tree["step"].is_empty():
             self._ground_write(":")
-            self._write(tree["step"])
+            yield tree["step"]
 
     def _write_ExtSlice(self, tree):
         """
@@ -1084,7 +1084,7 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._interleave_write(tree["dims"],
+        yield from self._interleave_write(tree["dims"],
             between = (lambda: self._ground_write(",")))
 
     def _write_Index(self, tree):
@@ -1098,7 +1098,7 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._write(tree["value"])
+        yield tree["value"]
 
 
     # boolop - too simple to test
@@ -1151,11 +1151,11 @@ class BasicWriter(sourcewriter.SourceWriter):
         """
 
         self._ground_write("for ")
-        self._write(tree["target"])
+        yield tree["target"]
         self._ground_write(" in ")
-        self._write(tree["iter"])
+        yield tree["iter"]
 
-        self._interleave_write(tree["ifs"],
+        yield from self._interleave_write(tree["ifs"],
             before = (lambda: self._ground_write(" if ")))
 
 
@@ -1183,13 +1183,13 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         if not tree["type"].is_empty():
             self._ground_write(" ")
-            self._write(tree["type"])
+            yield tree["type"]
 
             if not tree["name"].is_empty():
                 self._ground_write(" as ")
-                self._write(tree["name"])
+                yield tree["name"]
 
-        self._write_block(tree["body"])
+        yield from self._write_block(tree["body"])
 
 
     # arguments
@@ -1219,16 +1219,16 @@ class BasicWriter(sourcewriter.SourceWriter):
             if had_arg:
                 self._ground_write(", ")
             had_arg = True
-            self._write(tree["args"][arg])
+            yield tree["args"][arg]
 
         # keyword args
         for (arg, default) in zip(ordered_args[n_posargs:], tree["defaults"].ordered_children()):
             if had_arg:
                 self._ground_write(", ")
             had_arg = True
-            self._write(tree["args"][arg])
+            yield tree["args"][arg]
             self._ground_write(" = ")
-            self._write(tree["defaults"][default])
+            yield tree["defaults"][default]
 
         # variable positional args
         if not tree["vararg"].is_empty():
@@ -1236,10 +1236,10 @@ class BasicWriter(sourcewriter.SourceWriter):
                 self._ground_write(", ")
             had_arg = True
             self._ground_write("*")
-            self._write(tree["vararg"])
+            yield tree["vararg"]
             if not tree["varargannotation"].is_empty():
                 self._ground_write(" : ")
-                self._write(tree["varargannotation"])
+                yield tree["varargannotation"]
         elif not tree["kwonlyargs"].is_empty():
             if had_arg:
                 self._ground_write(", ")
@@ -1251,9 +1251,9 @@ class BasicWriter(sourcewriter.SourceWriter):
             if had_arg:
                 self._ground_write(", ")
             had_arg = True
-            self._write(tree["kwonlyargs"][child])
+            yield tree["kwonlyargs"][child]
             self._ground_write(" = ")
-            self._write(tree["kw_defaults"][child])
+            yield tree["kw_defaults"][child]
 
         # variable keyword args
         if not tree["kwarg"].is_empty():
@@ -1261,10 +1261,10 @@ class BasicWriter(sourcewriter.SourceWriter):
                 self._ground_write(", ")
             had_arg = False
             self._ground_write("**")
-            self._write(tree["kwarg"])
+            yield tree["kwarg"]
             if not tree["kwargannotation"].is_empty():
                 self._ground_write(" : ")
-                self._write(tree.kwargannotation)
+                yield tree.kwargannotation
 
     # arg
     def _write_arg(self, tree):
@@ -1283,10 +1283,10 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._write(tree["arg"])
+        yield tree["arg"]
         if not tree["annotation"].is_empty():
             self._ground_write(" : ")
-            self._write(tree["annotation"])
+            yield tree["annotation"]
 
 
     # keyword
@@ -1303,9 +1303,9 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._write(tree["arg"])
+        yield tree["arg"]
         self._ground_write(" = ")
-        self._write(tree["value"])
+        yield tree["value"]
 
 
     # alias
@@ -1321,11 +1321,11 @@ class BasicWriter(sourcewriter.SourceWriter):
 
         """
 
-        self._write(tree["name"])
+        yield tree["name"]
 
         if not tree["asname"].is_empty():
             self._ground_write(" as ")
-            self._write(tree["asname"])
+            yield tree["asname"]
 
 
 if __name__ == "__main__":
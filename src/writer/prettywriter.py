@@ -84,9 +84,9 @@ class PrettyWriter(BasicWriter):
         """
 
         if tree["value"].type() == "Str":
-            self._write_docstring(tree["value"])
+            yield from self._write_docstring(tree["value"])
         else:
-            self._write(tree["value"])
+            yield tree["value"]
 
 
     def _write_docstring(self, doc : "Docstring to write"):
@@ -110,7 +110,7 @@ class PrettyWriter(BasicWriter):
                 self._inc_indent(" "*char_lv)
             self._ground_write("\"\"\"")
             self._next_statement()
-            self._interleave_write(CustomAST(clean), after=self._next_statement)
+            yield from self._interleave_write(CustomAST(clean), after=self._next_statement)
             self._next_statement() # blank line
             self._ground_write("\"\"\"")
             if char_lv > 0:
@@ -180,9 +180,9 @@ class PrettyWriter(BasicWriter):
         """
 
         if self._has_annotations(tree): # or self._has_defaults(tree)
-            self._write_newlineargs(tree)
+            yield from self._write_newlineargs(tree)
         else:
-            super()._write_arguments(tree)
+            yield from super()._write_arguments(tree)
 
 
     def _has_defaults(self, tree):
@@ -250,7 +250,7 @@ class PrettyWriter(BasicWriter):
                 self._ground_write(",")
                 self._next_statement()
             had_arg = True
-            self._write(tree["args"][arg])
+            yield tree["args"][arg]
 
         # keyword args
         for (arg, default) in zip(ord_args[n_posargs:], tree["defaults"].ordered_children()):
@@ -258,9 +258,9 @@ class PrettyWriter(BasicWriter):
                 self._ground_write(",")
                 self._next_statement()
             had_arg = True
-            self._write(tree["args"][arg])
+            yield tree["args"][arg]
             self._ground_write(" = ")
-            self._write(tree["defaults"][default])
+            yield tree["defaults"][default]
 
         # variable positional args
         if not tree["vararg"].is_empty():
@@ -269,10 +269,10 @@ class PrettyWriter(BasicWriter):
                 self._next_statement()
             had_arg = True
             self._ground_write("*")
-            self._write(tree["vararg"])
+            yield tree["vararg"]
             if not tree["varargannotation"].is_empty():
                 self._ground_write(" : ")
-                self._write(tree["varargannotation"])
+                yield tree["varargannotation"]
         elif not tree["kwonlyargs"].is_empty():
             if had_arg:
                 self._ground_write(",")
@@ -286,9 +286,9 @@ class PrettyWriter(BasicWriter):
                 self._ground_write(",")
                 self._next_statement()
             had_arg = True
-            self._write(tree["kwonlyargs"][child])
+            yield tree["kwonlyargs"][child]
             self._ground_write(" = ")
-            self._write(tree["kw_defaults"][child])
+            yield tree["kw_defaults"][child]
 
         # variable keyword args
         if not tree["kwarg"].is_empty():
@@ -297,10 +297,10 @@ class PrettyWriter(BasicWriter):
                 self._next_statement()
             had_arg = False
             self._ground_write("**")
-            self._write(tree["kwarg"])
+            yield tree["kwarg"]
             if not tree["kwargannotation"].is_empty():
                 self._ground_write(" : ")
-                self._write(tree["kwargannotation"])
+                yield tree["kwargannotation"]
 
         if char_lv > 0:
             self._dec_indent()
@@ -315,18 +315,18 @@ class PrettyWriter(BasicWriter):
         """Write a list of statements, each on a new line in a new indentation level."""
 
         if indent:
-            super()._write_block(stmts, True)
+            yield from super()._write_block(stmts, True)
         else:
             split_stmts = self._split_block(stmts)
 
             if split_stmts:
                 # First group as before
-                super()._write_block(split_stmts[0], False)
+                yield from super()._write_block(split_stmts[0], False)
 
                 # Other groups preceded with newline
                 for group in split_stmts[1:]:
                     self._next_statement()
-                    self._interleave_write(group, before=self._next_statement)
+                    yield from self._interleave_write(group, before=self._next_statement)
 
     def _split_block(self, stmts):
         """
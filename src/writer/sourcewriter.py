@@ -27,9 +27,13 @@ performs simple tasks that will be needed by all writers.
 import ast
 import abc
 import sys
+import weakref
 
 from analysis.customast import CustomAST
 
+# Number of fragments written before they are sent to the output file
+FLUSH_SIZE = 4096
+
 class SourceWriter(metaclass = abc.ABCMeta):
     """
     Base class for creating source writers.
@@ -60,41 +64,122 @@ class SourceWriter(metaclass = abc.ABCMeta):
             raise TypeError("The tree needs to begin with a CustomAST node.")
 
         self.__indentation = []
+        self.__prefix = "" # The indentation joined up
         self.__character_level = 0
         self.__is_interactive = False
 
+        self.__buffer = [] # Written but not yet sent to out
+
     def write(self):
         """Dump out the entire source tree."""
 
-        self._write(self.__top_ast)
+        try:
+            self._write(self.__top_ast)
+        finally:
+            self._flush()
 
     def _write(self, tree : "The tree to write"):
         """
         Write out the given tree.
 
-        This actually just dishes out work to the correct method.
+        Write methods which need to write other nodes yield those nodes
+        rather than calling back in here, so we keep a stack of the methods
+        in progress instead of recursing. This lets us write trees of any
+        depth. Methods which write nothing but strings can simply return.
+
+        >>> from . basicwriter import BasicWriter
+        >>> expr = ast.Name("a", ast.Load())
+        >>> for i in range(5000):
+        ...     expr = ast.UnaryOp(ast.USub(), expr)
+        >>> len(srcToStr(CustomAST(expr), BasicWriter))
+        10001
+
+        """
+
+        table = _dispatch_table(self.__class__)
+        hooks = self._has_hooks()
+        stack = []
+        node = tree
+        while True:
+            if node != None:
+                if hooks:
+                    self._node_started(node)
+                try:
+                    method = table[node.type(True)]
+                except KeyError:
+                    method = self._write_function(node.type(True))
+                steps = method(self, node)
+                if steps == None:
+                    if hooks:
+                        self._node_finished(node)
+                else:
+                    stack.append((node, steps))
+
+            if not stack:
+                return
+
+            current, steps = stack[-1]
+            node = next(steps, None)
+            if node == None:
+                stack.pop()
+                if hooks:
+                    self._node_finished(current)
+
+    def _write_function(self, cls : "Class of the node to write"):
+        """
+        Find the function used to write nodes of the given class.
+
+        It is kept in the dispatch table for our class, so every writer of
+        the same class finds it with a single lookup from then on.
 
         """
 
         try:
-            method = getattr(self, "_write_" + tree.type())
+            found = getattr(self.__class__, "_write_" + cls.__name__)
         except AttributeError as exc:
-            raise TypeError("Unknown CustomAST node: " + tree.type()) from exc
-        else:
-            method(tree)
+            raise TypeError("Unknown CustomAST node: " + cls.__name__) from exc
+        _dispatch_table(self.__class__)[cls] = found
+        return found
+
+    def _has_hooks(self):
+        """Do we need to call _node_started and _node_finished, or have they not been overridden."""
+
+        cls = self.__class__
+        return (cls._node_started is not SourceWriter._node_started or
+                cls._node_finished is not SourceWriter._node_finished)
+
+    def _node_started(self, tree):
+        """Called just before we start writing a node."""
+
+    def _node_finished(self, tree):
+        """Called once a node has been completely written."""
 
     def _ground_write(self, s):
         """Write the most basic string - all writing should be done through here."""
 
         self.__character_level += len(s)
-        self.__out.write(s)
+        self.__buffer.append(s)
+
+    def _flush(self):
+        """
+        Send everything written so far to the output file.
+
+        Output is kept until then so the file sees a few large writes
+        rather than one for every fragment. This happens at the end of
+        the first line after FLUSH_SIZE fragments, and when writing
+        finishes.
+
+        """
+
+        if self.__buffer:
+            self.__out.write("".join(self.__buffer))
+            self.__buffer = []
 
     def _char_level(self, relative = True):
         """Get the absolute character level or relative to the indentation."""
 
         if relative:
-            ind = sum([len(i) for i in self.__indentation])
-            return self.__character_level - ind
+            return self.__character_level - len(self.__prefix)
         else:
             return self.__character_level
 
@@ -103,6 +188,8 @@ class SourceWriter(metaclass = abc.ABCMeta):
 
         self._ground_write("\n")
         self.__character_level = 0
+        if len(self.__buffer) >= FLUSH_SIZE:
+            self._flush()
 
     def _inc_indent(self, by : "How far to indent - use '' to indent to character level" = "    "):
         """Increase indentation."""
@@ -110,11 +197,13 @@ class SourceWriter(metaclass = abc.ABCMeta):
         if by == '':
             by = " " * self.__character_level
         self.__indentation.append(by)
+        self.__prefix += by
 
     def _dec_indent(self):
         """Decrease indentation."""
 
         self.__indentation.pop()
+        self.__prefix = "".join(self.__indentation)
 
     def _indent_level(self):
         return len(self.__indentation)
@@ -122,7 +211,7 @@ class SourceWriter(metaclass = abc.ABCMeta):
     def _indent(self):
         """Indent to the correct level."""
 
-        self._ground_write("".join(self.__indentation))
+        self._ground_write(self.__prefix)
 
     def _is_interactive(self, interactive = None):
         if interactive != None:
@@ -150,39 +239,47 @@ class SourceWriter(metaclass = abc.ABCMeta):
         Write a list of expressions.
         Separate them by calling the given functions with no arguments.
 
+        This is a generator of nodes to write, so should be used with
+        yield from. Any of the functions may also be generators.
+
         """
 
         if not exprs.has_children():
             return
-        if not writer:
-            writer = self._write
 
-        i = iter(exprs)
-        before()
-        writer(exprs[next(i)])
-        after()
-        for expr in i:
-            between()
-            before()
-            writer(exprs[expr])
-            after()
+        first = True
+        for expr in exprs:
+            if not first:
+                yield from _steps(between())
+            first = False
+            yield from _steps(before())
+            if writer:
+                yield from _steps(writer(exprs[expr]))
+            else:
+                yield exprs[expr]
+            yield from _steps(after())
 
 
     def _write_block(self,
                     stmts : "List of statements inside the block.",
                     indent : "Should we be indenting?" = True):
-        """Write a list of statements, each on a new line in a new indentation level."""
+        """
+        Write a list of statements, each on a new line in a new indentation level.
+
+        Like _interleave_write this should be used with yield from.
+
+        """
 
         if indent:
             self._ground_write(":")
             self._inc_indent()
             self._newline()    # not next_statement as we want to allow 
                                # next statement to change independently
-            self._write_block(stmts, indent = False)
+            yield from self._write_block(stmts, indent = False)
             self._dec_indent()
         elif stmts.has_children(): # Don't write if no statements
             self._start_line()
-            self._interleave_write(stmts, between=self._next_statement)
+            yield from self._interleave_write(stmts, between=self._next_statement)
 
     def _next_statement(self):
         """Add any syntax needed before we write the next statement."""
@@ -195,7 +292,7 @@ class SourceWriter(metaclass = abc.ABCMeta):
     def _write_list(self, s):
         """Write a list assuming it is a list of statements. Should not be used willy nilly."""
 
-        self._write_block(s, indent=False)
+        yield from self._write_block(s, indent=False)
 
     def _write_str(self, s): self._ground_write(s.node())
     def _write_int(self, i): self._ground_write(str(i.node()))
@@ -428,6 +525,21 @@ class SourceWriter(metaclass = abc.ABCMeta):
     @abc.abstractmethod
     def _write_alias(self, tree): pass
 
+_TABLES = weakref.WeakKeyDictionary() # Writer class -> node class -> function writing it
+
+def _dispatch_table(cls : "Writer class"):
+    """Get the dispatch table for a writer class, filled in as each class of node is first written."""
+
+    try:
+        return _TABLES[cls]
+    except KeyError:
+        return _TABLES.setdefault(cls, {})
+
+def _steps(result):
+    """Nodes to write from a helper, which may or may not be a generator."""
+
+    return () if result == None else result
+
 def printSource(tree : "Tree to print", writer : "Type to write with"):
     """
     Write an AST as source to stdout. Works with doctest.